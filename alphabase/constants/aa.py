@@ -142,3 +142,68 @@ def calc_AA_masses_for_var_len_seqs(
     return AA_ASCII_MASS[
         np.array(sequence_array).view(np.int32)
     ].reshape(len(sequence_array), -1)
+
+def get_sequence_buffer(
+    sequences: Union[list, np.ndarray]
+)->Tuple[np.ndarray, np.ndarray]:
+    '''
+    Concatenate ASCII sequences into a flat uint8 buffer with offsets,
+    residues of sequence i are `seq_buf[seq_offsets[i]:seq_offsets[i+1]]`.
+    The ASCII codes can be used to index :data:`AA_ASCII_MASS`.
+
+    Parameters
+    ----------
+    sequences : list | np.ndarray
+        Sequences with variable lengths.
+
+    Returns
+    -------
+    np.ndarray
+        uint8 buffer of all residues (read-only)
+
+    np.ndarray
+        int64 offsets with length of `len(sequences)+1`
+
+    Raises
+    -------
+    UnicodeEncodeError
+        If sequences contain non-ASCII characters.
+    '''
+    # join with b'\n' to get sequence lengths without a python loop
+    seq_buf = np.frombuffer(
+        '\n'.join(sequences).encode('ascii'), dtype=np.uint8
+    )
+    is_sep = seq_buf == ord('\n')
+    seq_offsets = np.zeros(len(sequences)+1, dtype=np.int64)
+    if len(sequences) > 0:
+        # k-th separator ends the k-th sequence, minus k separators before
+        seq_offsets[1:-1] = np.flatnonzero(is_sep)
+        seq_offsets[-1] = len(seq_buf)
+        seq_offsets[1:] -= np.arange(len(sequences))
+    seq_buf = seq_buf[~is_sep]
+    seq_buf.flags.writeable = False
+    return seq_buf, seq_offsets
+
+def calc_AA_masses_for_ragged_seqs(
+    sequences: Union[list, np.ndarray]
+)->Tuple[np.ndarray, np.ndarray]:
+    '''
+    Calculate AA masses for sequences with variable lengths 
+    without padding or grouping by length.
+
+    Parameters
+    ----------
+    sequences : list | np.ndarray
+        Sequences with variable lengths.
+
+    Returns
+    -------
+    np.ndarray
+        1-D array of AA masses of all sequences.
+
+    np.ndarray
+        int64 offsets with length of `len(sequences)+1`, AA masses of 
+        sequence i are `aa_masses[seq_offsets[i]:seq_offsets[i+1]]`.
+    '''
+    seq_buf, seq_offsets = get_sequence_buffer(sequences)
+    return AA_ASCII_MASS[seq_buf], seq_offsets
@@ -356,6 +356,552 @@ def calc_modloss_mass(
     else:
         return _calc_modloss(mod_losses[::-1])[-3:0:-1]
 
+@numba.njit(nogil=True)
+def _calc_modloss_masses(
+    nAAs:np.ndarray,
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+    modloss_of_mod_ids:np.ndarray,
+    importance_of_mod_ids:np.ndarray,
+    for_nterm_frag:bool,
+    by_importance:bool,
+    frag_offsets:np.ndarray,
+    modlosses:np.ndarray,
+):
+    mod_losses = np.zeros(np.max(nAAs)+2)
+    importances = np.zeros_like(mod_losses)
+    for i in range(len(nAAs)):
+        nAA = nAAs[i]
+        if mod_offsets[i] == mod_offsets[i+1]: continue
+        mod_losses[:nAA+2] = 0
+        importances[:nAA+2] = 0
+        for k in range(mod_offsets[i], mod_offsets[i+1]):
+            site = mod_sites[k]
+            if site < 0: site += nAA+2
+            mod_losses[site] = modloss_of_mod_ids[mod_ids[k]]
+            importances[site] = importance_of_mod_ids[mod_ids[k]]
+        if by_importance:
+            for j in range(nAA+2):
+                if importances[j] == 0: mod_losses[j] = 0
+        # N-term frags take positions 1..nAA-1 scanning from 0,
+        # C-term frags take positions 2..nAA scanning from nAA+1
+        if for_nterm_frag:
+            first, step = 0, 1
+        else:
+            first, step = nAA+1, -1
+        loss = mod_losses[first]
+        prev_importance = importances[first]
+        pos = first
+        for _ in range(nAA):
+            pos += step
+            if by_importance:
+                if importances[pos] > prev_importance:
+                    prev_importance = importances[pos]
+                    loss = mod_losses[pos]
+            elif mod_losses[pos] != 0:
+                loss = mod_losses[pos]
+            if for_nterm_frag:
+                if pos <= nAA-1:
+                    modlosses[frag_offsets[i]+pos-1] = loss
+            elif pos >= 2:
+                modlosses[frag_offsets[i]+pos-2] = loss
+
+def calc_modloss_masses_for_ragged_seqs(
+    nAAs:np.ndarray,
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+    for_nterm_frag:bool,
+    by_importance:bool=False,
+)->np.ndarray:
+    '''
+    Batched :func:`calc_modloss_mass` (or 
+    :func:`calc_modloss_mass_with_importance` if `by_importance`)
+    for integer-coded mods of :func:`encode_mods`. 
+    Mod losses are taken from :data:`MOD_DF`, so modlosses disabled 
+    by :func:`keep_modloss_by_importance` are 0.
+
+    Parameters
+    ----------
+    nAAs : np.ndarray
+        Peptide lengths
+
+    mod_offsets : np.ndarray
+        Mod offsets (CSR) of the peptides
+
+    mod_ids : np.ndarray
+        Mod ids, see :func:`get_mod_ids`
+
+    mod_sites : np.ndarray
+        Mod sites
+
+    for_nterm_frag : bool
+        If `True`, the loss will be on the N-term fragments (`b` ions),
+        otherwise on the C-term fragments (`y` ions)
+
+    by_importance : bool, optional
+        If select the modloss by `MOD_LOSS_IMPORTANCE` 
+        instead of the closest modification, by default False
+
+    Returns
+    -------
+    np.ndarray
+        1-D modloss masses with nAA-1 values for each peptide
+    '''
+    nAAs = np.asarray(nAAs, dtype=np.int64)
+    frag_offsets = np.zeros(len(nAAs)+1, dtype=np.int64)
+    frag_offsets[1:] = np.cumsum(nAAs-1)
+    modlosses = np.zeros(frag_offsets[-1])
+    if len(nAAs) == 0: return modlosses
+    _calc_modloss_masses(
+        nAAs, mod_offsets, mod_ids, mod_sites,
+        MOD_DF['modloss'].values.astype(np.float64),
+        MOD_DF['modloss_importance'].values.astype(np.float64),
+        for_nterm_frag, by_importance,
+        frag_offsets, modlosses,
+    )
+    return modlosses
+
+def calc_modloss_masses_by_mod_ids(
+    nAA:int,
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+    for_nterm_frag:bool,
+    by_importance:bool=False,
+)->np.ndarray:
+    '''
+    Same as :func:`calc_modloss_masses_for_ragged_seqs` but 
+    for peptides with the same length `nAA`.
+
+    Returns
+    -------
+    np.ndarray
+        2-D array with shape=`(pep_count, nAA-1)`
+    '''
+    return calc_modloss_masses_for_ragged_seqs(
+        np.full(len(mod_offsets)-1, nAA, dtype=np.int64),
+        mod_offsets, mod_ids, mod_sites,
+        for_nterm_frag, by_importance,
+    ).reshape(-1, nAA-1)
+
+@numba.njit
+def _join_tokens_by_offsets(
+    offsets:np.ndarray, token_idxes:np.ndarray,
+    token_buf:np.ndarray, token_offsets:np.ndarray,
+)->tuple:
+    """Join tokens of each row with ';' into a single uint8 buffer,
+    tokens of row i are `token_idxes[offsets[i]:offsets[i+1]]`."""
+    n_bytes = 0
+    for i in range(len(offsets)-1):
+        for k in range(offsets[i], offsets[i+1]):
+            t = token_idxes[k]
+            n_bytes += token_offsets[t+1]-token_offsets[t]+1
+    out_buf = np.empty(n_bytes, dtype=np.uint8)
+    out_offsets = np.zeros(len(offsets), dtype=np.int64)
+    m = 0
+    for i in range(len(offsets)-1):
+        for k in range(offsets[i], offsets[i+1]):
+            if k > offsets[i]:
+                out_buf[m] = 59 # ';'
+                m += 1
+            t = token_idxes[k]
+            for b in range(token_offsets[t], token_offsets[t+1]):
+                out_buf[m] = token_buf[b]
+                m += 1
+        out_offsets[i+1] = m
+    return out_buf[:m], out_offsets
+
+def _join_tokens_to_strings(
+    offsets:np.ndarray, token_idxes:np.ndarray, tokens:list,
+)->np.ndarray:
+    """';'-join ASCII `tokens` of each row, see :func:`_join_tokens_by_offsets`"""
+    token_bytes = [token.encode('ascii') for token in tokens]
+    token_offsets = np.zeros(len(token_bytes)+1, dtype=np.int64)
+    token_offsets[1:] = np.cumsum([len(token) for token in token_bytes])
+    out_buf, out_offsets = _join_tokens_by_offsets(
+        offsets, token_idxes.astype(np.int64),
+        np.frombuffer(b''.join(token_bytes), dtype=np.uint8), token_offsets,
+    )
+    out_str = out_buf.tobytes().decode('ascii')
+    return np.array([
+        out_str[start:stop] for start, stop 
+        in zip(out_offsets[:-1].tolist(), out_offsets[1:].tolist())
+    ], dtype=object)
+
+def mod_arrays_to_strings(
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+    mod_names:np.ndarray,
+)->tuple:
+    """Render integer-coded mods (indices of `mod_names`)
+    into ';'-joined 'mods' and 'mod_sites' strings.
+
+    Returns
+    -------
+    tuple
+        np.ndarray (object): mods
+
+        np.ndarray (object): mod_sites
+    """
+    if len(mod_ids) == 0:
+        return (
+            np.full(len(mod_offsets)-1, '', dtype=object), 
+            np.full(len(mod_offsets)-1, '', dtype=object)
+        )
+    min_site = mod_sites.min()
+    return (
+        _join_tokens_to_strings(mod_offsets, mod_ids, list(mod_names)),
+        _join_tokens_to_strings(
+            mod_offsets, mod_sites-min_site, 
+            [str(site) for site in range(min_site, mod_sites.max()+1)]
+        ),
+    )
+
+def get_mod_ids(mod_names:Union[list,np.ndarray])->np.ndarray:
+    """
+    Get the integer ids of modifications, 
+    i.e. the row positions of `mod_names` in :data:`MOD_DF`.
+    Ids of existing modifications are kept when new modifications
+    are added by :func:`add_new_modifications`.
+
+    Parameters
+    ----------
+    mod_names : list | np.ndarray
+        Modification names
+
+    Returns
+    -------
+    np.ndarray
+        int32 mod ids
+
+    Raises
+    ------
+    KeyError
+        If any modification is not in :data:`MOD_DF`
+    """
+    if len(mod_names) == 0:
+        return np.empty(0, dtype=np.int32)
+    mod_ids = MOD_DF.index.get_indexer(mod_names)
+    if np.any(mod_ids < 0):
+        raise KeyError(
+            f"Unknown modifications: {list(np.asarray(mod_names, dtype=object)[mod_ids<0])}"
+        )
+    return mod_ids.astype(np.int32)
+
+def _split_items_to_csr(
+    strs:Union[list,np.ndarray], parse_items, column:str
+)->tuple:
+    """
+    Split ';'-joined strings into CSR arrays (offsets, items).
+    Only unique strings are split and parsed by `parse_items(list)`,
+    items of all rows are then gathered from the unique ones.
+    Missing values (NaN/None) raise ValueError naming `column`.
+    """
+    codes, uniq_strs = pd.factorize(np.asarray(strs, dtype=object))
+    if (codes < 0).any():
+        raise ValueError(
+            f"Missing values (NaN/None) in '{column}' at rows "
+            f"{np.flatnonzero(codes < 0)[:10].tolist()}, "
+            "use '' for no modifications"
+        )
+    uniq_items = [s.split(';') if s else [] for s in uniq_strs]
+    uniq_offsets = np.zeros(len(uniq_items)+1, dtype=np.int64)
+    uniq_offsets[1:] = np.cumsum([len(items) for items in uniq_items])
+    uniq_items = parse_items(
+        [item for items in uniq_items for item in items]
+    )
+    nums = np.diff(uniq_offsets)[codes]
+    offsets = np.zeros(len(codes)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(nums)
+    idxes = np.repeat(
+        uniq_offsets[:-1][codes]-offsets[:-1], nums
+    ) + np.arange(offsets[-1])
+    return offsets, uniq_items[idxes]
+
+def _parse_int16s(items:list)->np.ndarray:
+    return np.array([int(item) for item in items], dtype=np.int16)
+
+def _parse_float64s(items:list)->np.ndarray:
+    return np.array([float(item) for item in items], dtype=np.float64)
+
+def get_mod_names(mod_ids:np.ndarray)->np.ndarray:
+    """
+    Get modification names of mod ids, the inverse of :func:`get_mod_ids`.
+    """
+    return MOD_DF.mod_name.values[mod_ids]
+
+def get_mod_masses(mod_ids:np.ndarray)->np.ndarray:
+    """
+    Get modification masses of mod ids, see :func:`get_mod_ids`.
+    """
+    return MOD_DF.mass.values[mod_ids].astype(np.float64)
+
+def encode_mods(
+    mods:Union[list,np.ndarray], 
+    mod_sites:Union[list,np.ndarray],
+)->tuple:
+    """
+    Parse AlphaBase 'mods' and 'mod_sites' strings once into 
+    integer-coded mods in CSR layout, which can be used by 
+    `*_by_mod_ids` functions without splitting strings again.
+
+    Parameters
+    ----------
+    mods : list | np.ndarray
+        ';'-joined modification names of each peptide,
+        e.g. `['Oxidation@M;Phospho@S', '']`
+
+    mod_sites : list | np.ndarray
+        ';'-joined modification sites of each peptide,
+        e.g. `['3;6', '']`
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int64): mod offsets with length of `len(mods)+1`,
+        mods of peptide i are `mod_ids[mod_offsets[i]:mod_offsets[i+1]]`
+
+        np.ndarray (int32): mod ids, see :func:`get_mod_ids`
+
+        np.ndarray (int16): mod sites, 0 for N-term and -1 for C-term
+    """
+    mod_offsets, mod_ids = _split_items_to_csr(mods, get_mod_ids, 'mods')
+    site_offsets, mod_sites = _split_items_to_csr(
+        mod_sites, _parse_int16s, 'mod_sites'
+    )
+    if not np.array_equal(mod_offsets, site_offsets):
+        raise ValueError(
+            "The numbers of 'mods' and 'mod_sites' do not match"
+        )
+    return mod_offsets, mod_ids, mod_sites
+
+def encode_mod_deltas(
+    mod_deltas:Union[list,np.ndarray], 
+    mod_delta_sites:Union[list,np.ndarray],
+)->tuple:
+    """
+    Parse 'mod_deltas' and 'mod_delta_sites' strings (mass deltas
+    of open search) once into CSR arrays, same as :func:`encode_mods`.
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int64): delta offsets with length of `len(mod_deltas)+1`
+
+        np.ndarray (float64): mass deltas
+
+        np.ndarray (int16): mass delta sites
+    """
+    delta_offsets, deltas = _split_items_to_csr(
+        mod_deltas, _parse_float64s, 'mod_deltas'
+    )
+    site_offsets, delta_sites = _split_items_to_csr(
+        mod_delta_sites, _parse_int16s, 'mod_delta_sites'
+    )
+    if not np.array_equal(delta_offsets, site_offsets):
+        raise ValueError(
+            "The numbers of 'mod_deltas' and 'mod_delta_sites' do not match"
+        )
+    return delta_offsets, deltas, delta_sites
+
+def decode_mods(
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+)->tuple:
+    """
+    Render integer-coded mods of :func:`encode_mods` back into
+    AlphaBase 'mods' and 'mod_sites' strings.
+
+    Returns
+    -------
+    tuple
+        np.ndarray (object): mods
+
+        np.ndarray (object): mod_sites
+    """
+    return mod_arrays_to_strings(
+        mod_offsets, mod_ids, mod_sites, MOD_DF.mod_name.values
+    )
+
+@numba.njit
+def take_mod_arrays(
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+    row_idxes:np.ndarray,
+)->tuple:
+    """
+    Select (or reorder) the peptides of integer-coded mods by `row_idxes`,
+    for example positions of a peptide batch in `precursor_df`.
+
+    Returns
+    -------
+    tuple
+        (mod_offsets, mod_ids, mod_sites) of the selected peptides
+    """
+    new_offsets = np.zeros(len(row_idxes)+1, dtype=np.int64)
+    for i, row in enumerate(row_idxes):
+        new_offsets[i+1] = (
+            new_offsets[i] + mod_offsets[row+1] - mod_offsets[row]
+        )
+    new_ids = np.empty(new_offsets[-1], dtype=mod_ids.dtype)
+    new_sites = np.empty(new_offsets[-1], dtype=mod_sites.dtype)
+    for i, row in enumerate(row_idxes):
+        k = new_offsets[i]
+        for j in range(mod_offsets[row], mod_offsets[row+1]):
+            new_ids[k] = mod_ids[j]
+            new_sites[k] = mod_sites[j]
+            k += 1
+    return new_offsets, new_ids, new_sites
+
+@numba.njit
+def _calc_mod_masses_by_mod_ids(
+    nAA:int,
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+    mass_of_mod_ids:np.ndarray,
+)->np.ndarray:
+    masses = np.zeros((len(mod_offsets)-1, nAA))
+    for i in range(len(mod_offsets)-1):
+        for k in range(mod_offsets[i], mod_offsets[i+1]):
+            site = mod_sites[k]
+            if site == -1:
+                masses[i,nAA-1] += mass_of_mod_ids[mod_ids[k]]
+            elif site == 0:
+                masses[i,0] += mass_of_mod_ids[mod_ids[k]]
+            else:
+                masses[i,site-1] += mass_of_mod_ids[mod_ids[k]]
+    return masses
+
+def calc_mod_masses_by_mod_ids(
+    nAA:int,
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+)->np.ndarray:
+    '''
+    Same as :func:`calc_mod_masses_for_same_len_seqs` but 
+    for integer-coded mods of :func:`encode_mods`.
+
+    Parameters
+    ----------
+    nAA : int
+        Peptide length
+
+    mod_offsets : np.ndarray
+        Mod offsets (CSR) of peptides with the same length
+
+    mod_ids : np.ndarray
+        Mod ids, see :func:`get_mod_ids`
+
+    mod_sites : np.ndarray
+        Mod sites
+
+    Returns
+    -------
+    np.ndarray
+        2-D array with shape=`(pep_count, nAA)`. 
+    '''
+    return _calc_mod_masses_by_mod_ids(
+        nAA, mod_offsets, mod_ids, mod_sites, 
+        MOD_DF['mass'].values.astype(np.float64)
+    )
+
+@numba.njit(nogil=True)
+def add_mod_masses_to_ragged_seqs(
+    residue_masses:np.ndarray,
+    seq_offsets:np.ndarray,
+    mod_offsets:np.ndarray,
+    mod_masses:np.ndarray,
+    mod_sites:np.ndarray,
+):
+    """
+    Add masses of mods (or mass deltas) in CSR layout inplace 
+    onto the flat `residue_masses` of ragged sequences, 
+    residues of sequence i are `residue_masses[seq_offsets[i]:seq_offsets[i+1]]`.
+    `mod_masses` are masses of each mod item, e.g. `get_mod_masses(mod_ids)`.
+    """
+    for i in range(len(seq_offsets)-1):
+        for k in range(mod_offsets[i], mod_offsets[i+1]):
+            site = mod_sites[k]
+            if site == -1:
+                residue_masses[seq_offsets[i+1]-1] += mod_masses[k]
+            elif site == 0:
+                residue_masses[seq_offsets[i]] += mod_masses[k]
+            else:
+                residue_masses[seq_offsets[i]+site-1] += mod_masses[k]
+
+def calc_mod_masses_for_ragged_seqs(
+    seq_offsets:np.ndarray,
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+    mod_sites:np.ndarray,
+)->np.ndarray:
+    '''
+    Same as :func:`calc_mod_masses_by_mod_ids` but for sequences 
+    with variable lengths, see 
+    :func:`alphabase.constants.aa.get_sequence_buffer`.
+
+    Parameters
+    ----------
+    seq_offsets : np.ndarray
+        Sequence offsets of the flat residue buffer
+
+    mod_offsets : np.ndarray
+        Mod offsets (CSR) of the sequences
+
+    mod_ids : np.ndarray
+        Mod ids, see :func:`get_mod_ids`
+
+    mod_sites : np.ndarray
+        Mod sites
+
+    Returns
+    -------
+    np.ndarray
+        1-D array with length of `seq_offsets[-1]`, 
+        mod masses on each residue.
+    '''
+    masses = np.zeros(seq_offsets[-1])
+    add_mod_masses_to_ragged_seqs(
+        masses, seq_offsets, mod_offsets, 
+        get_mod_masses(mod_ids), mod_sites,
+    )
+    return masses
+
+def calc_mod_mass_sums_by_mod_ids(
+    mod_offsets:np.ndarray,
+    mod_ids:np.ndarray,
+)->np.ndarray:
+    '''
+    Calculate the summed modification mass of each peptide 
+    from integer-coded mods of :func:`encode_mods`.
+    
+    Parameters
+    ----------
+    mod_offsets : np.ndarray
+        Mod offsets (CSR)
+
+    mod_ids : np.ndarray
+        Mod ids, see :func:`get_mod_ids`
+
+    Returns
+    -------
+    np.ndarray
+        1-D float64 array of mod masses with length of `len(mod_offsets)-1`
+    '''
+    n_peps = len(mod_offsets)-1
+    return np.bincount(
+        np.repeat(np.arange(n_peps), np.diff(mod_offsets)),
+        weights=MOD_DF['mass'].values[mod_ids],
+        minlength=n_peps,
+    ).astype(np.float64)
+
 def _add_a_new_modification(
     mod_name:str, composition:str,
     modloss_composition:str=''
@@ -1,9 +1,318 @@
 import h5py
 import numpy as np
 import pandas as pd
+import os
 import re
 import contextlib
 import time
+import logging
+import typing
+
+try:
+    # registers blosc/zstd/... filters into h5py
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+
+_hdf_handles = {}
+"""
+Persistent h5py handles opened by :meth:`HDF_File.open` in this process,
+{(pid, abs file path): [h5py.File, reference count, borrow count]}.
+The borrow count is the number of :func:`open_hdf` contexts 
+which are using the handle (and may hold its h5py objects).
+
+A handle opened in 'r' mode is reopened in 'a' mode when a write 
+is requested, this is only allowed when the handle is not borrowed, 
+otherwise a RuntimeError is raised as the reopening would invalidate 
+the h5py groups and datasets of the borrowers.
+"""
+
+def _get_hdf_handle_key(file_name:str)->tuple:
+    # handles are not valid in forked processes
+    return (os.getpid(), os.path.abspath(file_name))
+
+def _get_persistent_hdf_handle(file_name:str, write:bool=False):
+    """Get the persistent handle entry of `file_name` if it is opened,
+    the read-only handle is reopened in 'a' mode for writing 
+    if it is not borrowed."""
+    handle = _hdf_handles.get(_get_hdf_handle_key(file_name))
+    if handle is None:
+        return None
+    if write and handle[0].mode == 'r':
+        if handle[2] > 0:
+            raise RuntimeError(
+                f"Cannot write '{file_name}' which is being read "
+                "by the read-only persistent handle"
+            )
+        handle[0].close()
+        handle[0] = h5py.File(file_name, "a")
+    return handle
+
+def _open_persistent_hdf_handle(file_name:str, write:bool=False):
+    key = _get_hdf_handle_key(file_name)
+    if key in _hdf_handles:
+        _hdf_handles[key][1] += 1
+        _get_persistent_hdf_handle(file_name, write)
+    else:
+        _hdf_handles[key] = [
+            h5py.File(file_name, "a" if write else "r"), 1, 0
+        ]
+
+def _close_persistent_hdf_handle(file_name:str):
+    key = _get_hdf_handle_key(file_name)
+    if key not in _hdf_handles: return
+    _hdf_handles[key][1] -= 1
+    if _hdf_handles[key][1] <= 0:
+        _hdf_handles[key][0].close()
+        del _hdf_handles[key]
+
+@contextlib.contextmanager
+def keep_hdf_open(file_name:str, write:bool=False):
+    """
+    Context manager to keep `file_name` opened as the persistent 
+    handle (see :meth:`HDF_File.open`), so all HDF accesses 
+    of this file inside the context are in one file session.
+    """
+    _open_persistent_hdf_handle(file_name, write)
+    try:
+        yield
+    finally:
+        _close_persistent_hdf_handle(file_name)
+
+def get_compression_kwargs(
+    compression:str = "lzf",
+    compression_level:int = None,
+    shuffle:bool = True,
+)->dict:
+    """
+    Get h5py `create_dataset` keyword arguments of the compression codec.
+
+    Parameters
+    ----------
+    compression : str, optional
+        None or "none" (no compression), "lzf", "gzip", 
+        or "blosc[:cname]" (e.g. "blosc:lz4", "blosc:zstd", requires `hdf5plugin`).
+        By default "lzf".
+
+    compression_level : int, optional
+        Compression level for "gzip" (0-9, default 4) 
+        and "blosc" (0-9, default 5). By default None.
+
+    shuffle : bool, optional
+        If use the byte shuffle filter, by default True.
+
+    Returns
+    -------
+    dict
+        Keyword arguments of `h5py.Group.create_dataset`
+    """
+    if compression is None or compression == "none":
+        return {}
+    elif compression == "lzf":
+        return {"compression": "lzf", "shuffle": shuffle}
+    elif compression == "gzip":
+        return {
+            "compression": "gzip", "shuffle": shuffle,
+            "compression_opts": (
+                4 if compression_level is None else compression_level
+            ),
+        }
+    elif compression.startswith("blosc"):
+        if hdf5plugin is None:
+            raise ImportError(
+                f"`hdf5plugin` is required for '{compression}' compression"
+            )
+        cname = compression[6:] if ":" in compression else "lz4"
+        return dict(hdf5plugin.Blosc(
+            cname=cname,
+            clevel=5 if compression_level is None else compression_level,
+            shuffle=(
+                hdf5plugin.Blosc.SHUFFLE if shuffle 
+                else hdf5plugin.Blosc.NOSHUFFLE
+            ),
+        ))
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+def _is_categories_name(name:str, group:h5py.Group)->bool:
+    """If `name` is the unique string table of a categorical dataset"""
+    return (
+        name.endswith("_categories") and
+        name[:-len("_categories")] in group
+    )
+
+def _get_code_dtype(n_categories:int)->np.dtype:
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def is_string_array(array:np.ndarray)->bool:
+    """If `array` is a unicode array or an object array of only str"""
+    if array.dtype.kind == "U":
+        return True
+    return (
+        array.dtype == np.dtype("O") and 
+        pd.api.types.infer_dtype(array, skipna=False) in ("string", "empty")
+    )
+
+def encode_string_array(
+    array:np.ndarray, 
+    string_encoding:str = "auto",
+)->tuple:
+    """
+    Encode a string array to be saved in HDF.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        The array to encode, non-string arrays are returned as they are
+
+    string_encoding : str, optional
+        "categorical": integer codes of a unique string table, 
+        "bytes": fixed-width utf-8 byte strings, 
+        "vlen": h5py variable-length strings, 
+        "auto": "categorical" if each unique string appears 
+        at least twice on average, otherwise "bytes" 
+        if padding to the longest string at most doubles the size, 
+        otherwise "vlen". By default "auto".
+
+    Returns
+    -------
+    tuple
+        str: the encoding (None if `array` is not a string array), 
+        np.ndarray: the encoded array, 
+        np.ndarray: the unique string table (None if not "categorical")
+    """
+    if string_encoding is None or not is_string_array(array):
+        return None, array, None
+    if string_encoding == "auto":
+        codes, categories = pd.factorize(array)
+        if len(categories)*2 <= len(array):
+            return (
+                "categorical", 
+                codes.astype(_get_code_dtype(len(categories))), 
+                np.asarray(categories, dtype=object)
+            )
+        str_lens = pd.Series(array, dtype=object).str.len().values
+        if str_lens.max()*len(array) <= str_lens.sum()*2:
+            string_encoding = "bytes"
+        else:
+            string_encoding = "vlen"
+    if string_encoding == "categorical":
+        codes, categories = pd.factorize(array)
+        return (
+            "categorical", 
+            codes.astype(_get_code_dtype(len(categories))), 
+            np.asarray(categories, dtype=object)
+        )
+    elif string_encoding == "bytes":
+        try:
+            return "bytes", array.astype(np.bytes_), None
+        except UnicodeEncodeError:
+            return "bytes", np.array(
+                [s.encode("utf-8") for s in array], dtype=np.bytes_
+            ), None
+    elif string_encoding == "vlen":
+        return "vlen", array.astype(object), None
+    else:
+        raise ValueError(f"Unknown string encoding: {string_encoding}")
+
+def decode_string_array(
+    values:np.ndarray,
+    string_encoding:str,
+    categories:np.ndarray = None,
+)->np.ndarray:
+    """
+    Decode values encoded by :func:`encode_string_array` 
+    to strings (object dtype).
+    """
+    if string_encoding == "categorical":
+        return categories[values]
+    elif string_encoding == "bytes":
+        if isinstance(values, bytes):
+            return values.decode("utf-8")
+        return np.char.decode(values, "utf-8").astype(object)
+    else:
+        return values
+
+def _get_encoded_nbytes(array:np.ndarray)->int:
+    """Bytes of the array to write, utf-8 bytes for vlen strings"""
+    if array.dtype == np.dtype("O"):
+        return sum(len(value.encode("utf-8")) for value in array)
+    return array.nbytes
+
+def _recreate_dataset_as(
+    hdf_file:h5py.File, name:str, dtype:np.dtype
+):
+    """Recreate the dataset `name` with a new (wider) `dtype`,
+    other properties of the dataset are kept."""
+    hdf_object = hdf_file[name]
+    values = hdf_object[...].astype(dtype)
+    attrs = dict(hdf_object.attrs)
+    kwargs = dict(
+        chunks=hdf_object.chunks,
+        maxshape=hdf_object.maxshape,
+        shuffle=hdf_object.shuffle,
+        compression=hdf_object.compression,
+        compression_opts=hdf_object.compression_opts,
+    )
+    if kwargs["compression"] is None:
+        # filters of hdf5plugin are only listed by their ids
+        for filter_id, opts in hdf_object._filters.items():
+            if filter_id.isdigit():
+                kwargs["compression"] = int(filter_id)
+                kwargs["compression_opts"] = tuple(opts)
+                break
+    del hdf_file[name]
+    hdf_object = hdf_file.create_dataset(name, data=values, **kwargs)
+    hdf_object.attrs.update(attrs)
+
+def _get_row_span(
+    rows:typing.Union[slice, np.ndarray], n_rows:int
+)->typing.Tuple[slice, np.ndarray]:
+    """
+    Convert `rows` (slice, integer indices or boolean mask) into 
+    the bounding slice to read and the indices to take (relative to 
+    the slice start, None to take the whole slice) after the read.
+    """
+    if isinstance(rows, slice):
+        start, stop, step = rows.indices(n_rows)
+        if step == 1:
+            return slice(start, max(start, stop)), None
+        rows = np.arange(start, stop, step)
+    rows = np.asarray(rows)
+    if rows.dtype == np.bool_:
+        rows = np.flatnonzero(rows)
+    if len(rows) == 0:
+        return slice(0, 0), None
+    rows = np.where(rows < 0, rows + n_rows, rows)
+    start = rows.min()
+    stop = rows.max()+1
+    if len(rows) == stop-start and np.all(np.diff(rows) == 1):
+        return slice(start, stop), None
+    return slice(start, stop), rows-start
+
+@contextlib.contextmanager
+def open_hdf(file_name:str, write:bool=False):
+    """
+    Context manager to get the h5py handle of `file_name`.
+    It uses the persistent handle if the file is opened 
+    by :meth:`HDF_File.open`, otherwise the file is opened 
+    ('r' mode for reading and 'a' mode for `write`) 
+    and closed on exit.
+    """
+    handle = _get_persistent_hdf_handle(file_name, write)
+    if handle is not None:
+        handle[2] += 1
+        try:
+            yield handle[0]
+        finally:
+            handle[2] -= 1
+    else:
+        with h5py.File(file_name, "a" if write else "r") as hdf_file:
+            yield hdf_file
 
 
 class HDF_Object(object):
@@ -52,7 +361,7 @@ class HDF_Object(object):
 
     @property
     def metadata(self):
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             return dict(hdf_file[self.name].attrs)
 
     def __init__(
@@ -88,7 +397,7 @@ class HDF_Object(object):
                 f"Attribute '{name}' cannot be truncated"
             )
         if isinstance(value, (str, bool, int, float)):
-            with h5py.File(self.file_name, "a") as hdf_file:
+            with open_hdf(self.file_name, write=True) as hdf_file:
                 hdf_object = hdf_file[self.name]
                 hdf_object.attrs[name] = value
                 object.__setattr__(self, name, value)
@@ -178,11 +487,14 @@ class HDF_Group(HDF_Object):
         group_names = []
         dataset_names = []
         datafame_names = []
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             hdf_object = hdf_file[self.name]
             for name in sorted(hdf_object):
                 if isinstance(hdf_object[name], h5py.Dataset):
-                    if not name.endswith("_mmap"):
+                    if not (
+                        name.endswith("_mmap") or 
+                        _is_categories_name(name, hdf_object)
+                    ):
                         dataset_names.append(name)
                 else:
                     if "is_pd_dataframe" in hdf_object[name].attrs:
@@ -243,16 +555,62 @@ class HDF_Group(HDF_Object):
         self,
         name: str,
         array: np.ndarray,
+        compression: str = "lzf",
+        compression_level: int = None,
+        chunk_rows: int = None,
+        string_encoding: str = "auto",
     ):
-        with h5py.File(self.file_name, "a") as hdf_file:
+        """Add a dataset into this group.
+
+        Parameters
+        ----------
+        name : str
+            Dataset name
+
+        array : np.ndarray
+            Values of the dataset
+
+        compression : str, optional
+            See :func:`get_compression_kwargs`, by default "lzf"
+
+        compression_level : int, optional
+            See :func:`get_compression_kwargs`, by default None
+
+        chunk_rows : int, optional
+            Number of rows in each chunk, large chunks are 
+            faster to write and to read by row slices. 
+            By default None to let h5py guess the chunk shape.
+
+        string_encoding : str, optional
+            Encoding of string arrays, see :func:`encode_string_array`.
+            By default "auto".
+
+        Returns
+        -------
+        int
+            Number of (uncompressed) bytes of the encoded data written
+        """
+        if isinstance(array, (pd.core.series.Series)):
+            array = array.values
+        string_encoding, array, categories = encode_string_array(
+            array, string_encoding
+        )
+        compression_kwargs = get_compression_kwargs(
+            compression, compression_level
+        )
+        if chunk_rows is None:
+            chunks = True
+        else:
+            chunks = (
+                max(min(chunk_rows, len(array)), 1), *array.shape[1:]
+            )
+        with open_hdf(self.file_name, write=True) as hdf_file:
             hdf_object = hdf_file[self.name]
             if name in hdf_object:
                 del hdf_object[name]
-                mmap_name = f"{name}_mmap"
-                if mmap_name in hdf_object:
-                    del hdf_object[mmap_name]
-            if isinstance(array, (pd.core.series.Series)):
-                array = array.values
+                for suffix in ("_mmap", "_categories"):
+                    if f"{name}{suffix}" in hdf_object:
+                        del hdf_object[f"{name}{suffix}"]
             # if array.dtype == np.dtype('O'):
             #     print("YAR")
             #     # dtype = h5py.string_dtype(encoding='utf-8')
@@ -266,11 +624,14 @@ class HDF_Group(HDF_Object):
                 hdf_object.create_dataset(
                     name,
                     data=array,
-                    compression="lzf",
-                    shuffle=True,
-                    chunks=True,
+                    chunks=chunks,
                     # chunks=array.shape,
                     maxshape=tuple([None for i in array.shape]),
+                    dtype=(
+                        h5py.string_dtype() if string_encoding == "vlen"
+                        else None
+                    ),
+                    **compression_kwargs,
                 )
             except TypeError:
                 raise NotImplementedError(
@@ -278,6 +639,17 @@ class HDF_Group(HDF_Object):
                     "If this is a string format, try to cast it to "
                     "np.dtype('O') as possible solution."
                 )
+            if string_encoding is not None:
+                hdf_object[name].attrs["string_encoding"] = string_encoding
+            if categories is not None:
+                hdf_object.create_dataset(
+                    f"{name}_categories",
+                    data=categories,
+                    dtype=h5py.string_dtype(),
+                    chunks=True,
+                    maxshape=(None,),
+                    **compression_kwargs,
+                )
             dataset = HDF_Dataset(
                 file_name=self.file_name,
                 name=f"{self.name}/{name}",
@@ -286,37 +658,100 @@ class HDF_Group(HDF_Object):
             )
             dataset.last_updated = time.asctime()
             object.__setattr__(self, name, dataset)
+        n_bytes = _get_encoded_nbytes(array)
+        if categories is not None:
+            n_bytes += _get_encoded_nbytes(categories)
+        return n_bytes
 
     def add_group(
         self,
         name: str,
         group: dict,
     ):
-        with h5py.File(self.file_name, "a") as hdf_file:
-            hdf_object = hdf_file[self.name]
-            if name in hdf_object:
-                del hdf_object[name]
-            hdf_object.create_group(name)
         if isinstance(group, pd.DataFrame):
-            group = dict(group)
-            group["is_pd_dataframe"] = True
-            new_group = HDF_Dataframe(
+            self.add_dataframe(name, group)
+            return
+        with keep_hdf_open(self.file_name, write=True):
+            with open_hdf(self.file_name, write=True) as hdf_file:
+                hdf_object = hdf_file[self.name]
+                if name in hdf_object:
+                    del hdf_object[name]
+                hdf_object.create_group(name)
+            new_group = HDF_Group(
                 file_name=self.file_name,
                 name=f"{self.name}/{name}",
                 read_only=self.read_only,
                 truncate=self.truncate,
             )
-        else:
-            new_group = HDF_Group(
+            for key, value in group.items():
+                new_group.__setattr__(key, value)
+            new_group.last_updated = time.asctime()
+        object.__setattr__(self, name, new_group)
+
+    def add_dataframe(
+        self,
+        name: str,
+        df: pd.DataFrame,
+        *,
+        compression: str = "lzf",
+        compression_level: int = None,
+        chunk_rows: int = None,
+        string_encoding: str = "auto",
+    ):
+        """Write all columns of `df` as the dataframe group `name` 
+        in one file session. The write throughput (of uncompressed bytes 
+        of the encoded columns) is logged at INFO level.
+
+        Parameters
+        ----------
+        name : str
+            Group name of the dataframe
+
+        df : pd.DataFrame
+            The dataframe to write
+
+        compression : str, optional
+            See :func:`get_compression_kwargs`, by default "lzf"
+
+        compression_level : int, optional
+            See :func:`get_compression_kwargs`, by default None
+
+        chunk_rows : int, optional
+            See :meth:`add_dataset`, by default None
+
+        string_encoding : str, optional
+            See :func:`encode_string_array`, by default "auto"
+        """
+        start_time = time.time()
+        with keep_hdf_open(self.file_name, write=True):
+            with open_hdf(self.file_name, write=True) as hdf_file:
+                hdf_object = hdf_file[self.name]
+                if name in hdf_object:
+                    del hdf_object[name]
+                hdf_object.create_group(name)
+                hdf_object[name].attrs["is_pd_dataframe"] = True
+            new_group = HDF_Dataframe(
                 file_name=self.file_name,
                 name=f"{self.name}/{name}",
                 read_only=self.read_only,
                 truncate=self.truncate,
             )
-        for key, value in group.items():
-            new_group.__setattr__(key, value)
-        new_group.last_updated = time.asctime()
+            n_bytes = 0
+            for column, values in df.items():
+                n_bytes += new_group.add_dataset(
+                    column, values.values,
+                    compression=compression,
+                    compression_level=compression_level,
+                    chunk_rows=chunk_rows,
+                    string_encoding=string_encoding,
+                )
+            new_group.last_updated = time.asctime()
         object.__setattr__(self, name, new_group)
+        seconds = time.time()-start_time
+        logging.info(
+            f"Wrote {n_bytes/1e6:.1f} MB of '{self.name}/{name}' "
+            f"in {seconds:.2f} s ({n_bytes/1e6/max(seconds,1e-9):.1f} MB/s)"
+        )
 
 
 class HDF_Dataset(HDF_Object):
@@ -336,7 +771,7 @@ class HDF_Dataset(HDF_Object):
             truncate=truncate,
         )
         object.__setattr__(self, "mmap_name", f"{self.name}_mmap")
-        with h5py.File(self.file_name, "r") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             mmap_exists = self.mmap_name in hdf_file
             object.__setattr__(self, "mmap_exists", mmap_exists)
 
@@ -345,41 +780,96 @@ class HDF_Dataset(HDF_Object):
 
     @property
     def dtype(self):
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             return hdf_file[self.name].dtype
 
     @property
     def shape(self):
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             return hdf_file[self.name].shape
 
     @property
     def values(self):
         return self[...]
 
+    def _get_categories(
+        self, hdf_file:h5py.File, codes:np.ndarray = None
+    )->np.ndarray:
+        """Read the unique string table of the categorical dataset, 
+        it is not cached as other HDF objects on the same file may 
+        add categories. If `codes` only use a few categories, 
+        only these categories are read to decode `codes`."""
+        categories = hdf_file[f"{self.name}_categories"].asstr()
+        if codes is None:
+            return categories[...]
+        used_codes = np.unique(codes)
+        if 0 < len(used_codes)*16 < len(categories):
+            return categories[used_codes][
+                np.searchsorted(used_codes, codes)
+            ]
+        return categories[...][codes]
+
     def __getitem__(self, keys):
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             hdf_object = hdf_file[self.name]
+            string_encoding = hdf_object.attrs.get("string_encoding", None)
             if h5py.check_string_dtype(hdf_object.dtype) is not None:
-                hdf_object = hdf_object.asstr()
-            return hdf_object[keys]
+                hdf_object = hdf_object.asstr("utf-8")
+            values = hdf_object[keys]
+            if string_encoding == "categorical":
+                values = self._get_categories(hdf_file, values)
+            return values
+
+    def _encode_values(self, hdf_file:h5py.File, values)->np.ndarray:
+        """Encode `values` by the string encoding of this dataset, 
+        new strings are added into the unique string table, 
+        and the dataset is recreated with a wider dtype if needed."""
+        hdf_object = hdf_file[self.name]
+        string_encoding = hdf_object.attrs.get("string_encoding", None)
+        if string_encoding not in ("categorical", "bytes"):
+            return values
+        values = np.asarray(values, dtype=object)
+        if string_encoding == "categorical":
+            categories = self._get_categories(hdf_file)
+            codes = pd.Index(categories).get_indexer(values)
+            is_new = codes < 0
+            if is_new.any():
+                new_codes, new_categories = pd.factorize(values[is_new])
+                codes[is_new] = new_codes + len(categories)
+                categories_object = hdf_file[f"{self.name}_categories"]
+                categories_object.resize(
+                    (len(categories)+len(new_categories),)
+                )
+                categories_object[len(categories):] = np.asarray(
+                    new_categories, dtype=object
+                )
+            values = codes.astype(_get_code_dtype(
+                hdf_file[f"{self.name}_categories"].shape[0]
+            ))
+        else:
+            values = encode_string_array(values, "bytes")[1]
+        if values.dtype.itemsize > hdf_object.dtype.itemsize:
+            _recreate_dataset_as(hdf_file, self.name, values.dtype)
+        return values
 
     def append(self, data):
         if self.read_only:
             raise AttributeError("Cannot append read-only dataset")
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name, write=True) as hdf_file:
+            data = self._encode_values(hdf_file, data)
             hdf_object = hdf_file[self.name]
             new_shape = tuple(
-                [i + j for i, j in zip(self.shape, data.shape)]
+                [i + j for i, j in zip(hdf_object.shape, data.shape)]
             )
-            old_size = len(self)
+            old_size = hdf_object.shape[0]
             hdf_object.resize(new_shape)
             hdf_object[old_size:] = data
 
     def set_slice(self, slice_selection, values):
         if self.read_only:
             raise AttributeError("Cannot set slice of read-only dataset")
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name, write=True) as hdf_file:
+            values = self._encode_values(hdf_file, values)
             hdf_object = hdf_file[self.name]
             hdf_object[slice_selection] = values
             if self.mmap_exists:
@@ -390,7 +880,7 @@ class HDF_Dataset(HDF_Object):
         if self.read_only:
             raise AttributeError("Cannot delete read-only mmap of dataset")
         if self.mmap_exists:
-            with h5py.File(self.file_name, "a") as hdf_file:
+            with open_hdf(self.file_name, write=True) as hdf_file:
                 del hdf_file[self.mmap_name]
             object.__setattr__(self, "mmap_exists", False)
 
@@ -399,7 +889,7 @@ class HDF_Dataset(HDF_Object):
             raise AttributeError("Cannot create read-only mmap of dataset")
         if self.mmap_exists:
             self.delete_mmap()
-        with h5py.File(self.file_name, "a") as hdf_file:
+        with open_hdf(self.file_name, write=True) as hdf_file:
             hdf_object = hdf_file[self.name]
             subgroup = hdf_file.create_dataset(
                 self.mmap_name,
@@ -414,7 +904,7 @@ class HDF_Dataset(HDF_Object):
     def mmap(self):
         if not self.mmap_exists:
             self.create_mmap()
-        with h5py.File(self.file_name, "r") as hdf_file:
+        with open_hdf(self.file_name) as hdf_file:
             subgroup = hdf_file[self.mmap_name]
             offset = subgroup.id.get_offset()
             shape = subgroup.shape
@@ -462,11 +952,84 @@ class HDF_Dataframe(HDF_Group):
                 df_dict[column_name] = dataset[keys]
         return pd.DataFrame(df_dict)
 
+    def get(
+        self,
+        columns: list = None,
+        rows: typing.Union[slice, np.ndarray] = slice(None),
+        where: dict = None,
+    )->pd.DataFrame:
+        """Read only the selected columns and rows. 
+        Only the bounding row range of the selection is read 
+        from each dataset with h5py hyperslab reads.
+
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to read, by default None for all columns
+
+        rows : slice | np.ndarray, optional
+            Row slice, integer indices or boolean mask, 
+            by default slice(None) (all rows)
+
+        where : dict, optional
+            Predicates on numeric columns as {column: (min, max)}, 
+            rows with `min <= value <= max` are kept, 
+            `min` or `max` can be None for an open bound. 
+            e.g. {'precursor_mz': (400, 1000)}.
+            Predicate columns are read before other columns.
+            By default None.
+
+        Returns
+        -------
+        pd.DataFrame
+            The dataframe, its index is the row positions in this HDF dataframe
+
+        Examples::
+            >>> hdf_file.library.mod_seq_df.get(
+            >>>     ['sequence','mods'], where={'precursor_mz': (400, 1000)}
+            >>> )
+        """
+        if columns is None:
+            columns = self.columns
+        with keep_hdf_open(self.file_name):
+            n_rows = len(self) if len(self.dataset_names) > 0 else 0
+            span, take = _get_row_span(rows, n_rows)
+            for column, (min_value, max_value) in (where or {}).items():
+                dataset = self.__getattribute__(column)
+                if (
+                    dataset.dtype.kind not in "iufb" or 
+                    hasattr(dataset, "string_encoding")
+                ):
+                    raise ValueError(
+                        f"`where` only supports numeric columns, got '{column}'"
+                    )
+                values = dataset[span]
+                if take is None:
+                    take = np.arange(len(values))
+                else:
+                    values = values[take]
+                mask = np.ones(len(values), dtype=np.bool_)
+                if min_value is not None:
+                    mask &= values >= min_value
+                if max_value is not None:
+                    mask &= values <= max_value
+                span, take = _get_row_span(take[mask]+span.start, n_rows)
+            df_dict = {}
+            for column in columns:
+                values = self.__getattribute__(column)[span]
+                df_dict[column] = values if take is None else values[take]
+        if take is None:
+            index = pd.RangeIndex(span.start, span.stop)
+        else:
+            index = take + span.start
+        return pd.DataFrame(df_dict, index=index)
+
     def append(self, data):
-        for column_name in self.dataset_names:
-            dataset = self.__getattribute__(column_name)
-            if isinstance(dataset, HDF_Dataset):
-                dataset.append(data[column_name])
+        with keep_hdf_open(self.file_name, write=True):
+            for column_name in self.dataset_names:
+                dataset = self.__getattribute__(column_name)
+                if isinstance(dataset, HDF_Dataset):
+                    dataset.append(data[column_name])
 
     def set_slice(self, slice_selection, df):
         if self.read_only:
@@ -526,13 +1089,55 @@ class HDF_File(HDF_Group):
         """
         if delete_existing:
             mode = "w"
+        elif read_only:
+            mode = "r"
         else:
             mode = "a"
-        with h5py.File(file_name, mode):#, swmr=True):
-            pass
+        if _get_persistent_hdf_handle(file_name) is None:
+            with h5py.File(file_name, mode):#, swmr=True):
+                pass
+        elif delete_existing:
+            raise RuntimeError(
+                f"Cannot delete '{file_name}' while it is kept opened "
+                "by `HDF_File.open` or `keep_hdf_open`"
+            )
         super().__init__(
             file_name=file_name,
             name="/",
             read_only=read_only,
             truncate=truncate,
         )
+
+    def open(self):
+        """
+        Keep the file opened ('r' mode if :attr:`read_only`, 
+        otherwise 'a' mode) until :meth:`close`. 
+        Meanwhile, all HDF objects of this file in this process share 
+        the persistent h5py handle instead of reopening the file 
+        for each access. Nested `open` calls are reference counted.
+        `with HDF_File(...) as hdf_file:` calls `open` and `close`.
+
+        A read-only handle is reopened in 'a' mode for a write 
+        only if no :func:`open_hdf` context is using it 
+        (RuntimeError otherwise), and `HDF_File(..., delete_existing=True)` 
+        raises RuntimeError while the file is kept opened.
+
+        Returns
+        -------
+        HDF_File
+            self
+        """
+        _open_persistent_hdf_handle(
+            self.file_name, write=not self.read_only
+        )
+        return self
+
+    def close(self):
+        """Close the persistent h5py handle opened by :meth:`open`"""
+        _close_persistent_hdf_handle(self.file_name)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,15 +1,20 @@
+import numba
 import numpy as np
 from typing import List, Tuple
 
 from alphabase.constants.aa import (
     calc_sequence_mass, 
     calc_AA_masses_for_same_len_seqs,
-    calc_sequence_masses_for_same_len_seqs
+    calc_sequence_masses_for_same_len_seqs,
+    calc_AA_masses_for_ragged_seqs,
 )
 from alphabase.constants.modification import (
     calc_modification_mass,
     calc_modification_mass_sum,
-    calc_mod_masses_for_same_len_seqs
+    calc_mod_masses_for_same_len_seqs,
+    calc_mod_masses_by_mod_ids,
+    calc_mod_masses_for_ragged_seqs,
+    add_mod_masses_to_ragged_seqs,
 )
 from alphabase.constants.element import MASS_H2O
 
@@ -252,3 +257,171 @@ def calc_b_y_and_peptide_masses_for_same_len_seqs(
     pepmass += MASS_H2O
     y_masses = pepmass - b_masses
     return b_masses, y_masses, pepmass.flatten()
+
+def calc_b_y_and_peptide_masses_by_mod_ids(
+    sequences: np.ndarray,
+    mod_offsets: np.ndarray,
+    mod_ids: np.ndarray,
+    mod_sites: np.ndarray,
+    mod_delta_list: List[List[float]]=None,
+    mod_delta_site_list: List[List[int]]=None,
+)->Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    '''
+    Same as `calc_b_y_and_peptide_masses_for_same_len_seqs` 
+    but modifications are integer-coded by 
+    `alphabase.constants.modification.encode_mods`.
+
+    Parameters
+    ----------
+    sequence : np.ndarray of str
+        np.ndarray of peptie sequences with same length.
+
+    mod_offsets : np.ndarray
+        Mod offsets (CSR) of the peptides
+
+    mod_ids : np.ndarray
+        Mod ids
+
+    mod_sites : np.ndarray
+        Mod sites
+
+    mod_delta_list : List[List[float]]
+        list of modification mass deltas, 
+        e.g. `[[15.994915,79.966331],[79.966331,0.984016]]` 
+
+    mod_delta_site_list : List[List[int]]
+        list of modification mass delta sites
+    
+    Returns
+    -------
+    np.ndarray
+        neutral b fragment masses (2-D array)
+
+    np.ndarray
+        neutral y fragmnet masses (2-D array)
+
+    np.ndarray
+        neutral peptide masses (1-D array)
+    '''
+    aa_masses = calc_AA_masses_for_same_len_seqs(sequences)
+    nAA = len(sequences[0])
+
+    mod_masses = calc_mod_masses_by_mod_ids(
+        nAA, mod_offsets, mod_ids, mod_sites
+    )
+    if mod_delta_list is not None:
+        mod_masses += calc_mod_delta_masses_for_same_len_seqs(
+            nAA, mod_delta_list, mod_delta_site_list
+        )
+    aa_masses += mod_masses
+
+    b_masses = np.cumsum(aa_masses, axis=1)
+    b_masses, pepmass = b_masses[:,:-1], b_masses[:,-1:]
+        
+    pepmass += MASS_H2O
+    y_masses = pepmass - b_masses
+    return b_masses, y_masses, pepmass.flatten()
+
+@numba.njit(nogil=True)
+def _calc_b_y_and_peptide_masses_for_ragged_seqs(
+    residue_masses:np.ndarray,
+    seq_offsets:np.ndarray,
+    frag_offsets:np.ndarray,
+    b_masses:np.ndarray,
+    y_masses:np.ndarray,
+    pep_masses:np.ndarray,
+):
+    for i in range(len(seq_offsets)-1):
+        start = seq_offsets[i]
+        frag_start = frag_offsets[i]
+        mass = 0.0
+        for k in range(start, seq_offsets[i+1]):
+            mass += residue_masses[k]
+            if k-start < frag_offsets[i+1]-frag_start:
+                b_masses[frag_start+k-start] = mass
+        pep_masses[i] = mass + MASS_H2O
+        for j in range(frag_start, frag_offsets[i+1]):
+            y_masses[j] = pep_masses[i] - b_masses[j]
+
+def calc_b_y_and_peptide_masses_for_ragged_seqs(
+    sequences: np.ndarray,
+    mod_offsets: np.ndarray,
+    mod_ids: np.ndarray,
+    mod_sites: np.ndarray,
+    mod_delta_offsets: np.ndarray=None,
+    mod_deltas: np.ndarray=None,
+    mod_delta_sites: np.ndarray=None,
+)->Tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+    '''
+    Calculate b/y fragment masses and peptide masses 
+    for peptide sequences with variable lengths, 
+    so peptides do not need to be sorted or grouped by 'nAA'.
+    The results are the same as 
+    `calc_b_y_and_peptide_masses_for_same_len_seqs` but flattened.
+
+    Parameters
+    ----------
+    sequences : np.ndarray of str
+        Peptide sequences with variable lengths.
+
+    mod_offsets : np.ndarray
+        Mod offsets (CSR) of the peptides, 
+        see `alphabase.constants.modification.encode_mods`
+
+    mod_ids : np.ndarray
+        Mod ids
+
+    mod_sites : np.ndarray
+        Mod sites
+
+    mod_delta_offsets : np.ndarray, optional
+        Mass delta offsets (CSR) of the peptides,
+        see `alphabase.constants.modification.encode_mod_deltas`.
+        By default None
+
+    mod_deltas : np.ndarray, optional
+        Mass deltas, by default None
+
+    mod_delta_sites : np.ndarray, optional
+        Mass delta sites, by default None
+    
+    Returns
+    -------
+    np.ndarray
+        neutral b fragment masses (1-D array)
+
+    np.ndarray
+        neutral y fragmnet masses (1-D array)
+
+    np.ndarray
+        neutral peptide masses (1-D array)
+
+    np.ndarray
+        fragment offsets with length of `len(sequences)+1`, 
+        b/y masses of peptide i are 
+        `b_masses[frag_offsets[i]:frag_offsets[i+1]]`, 
+        i.e. nAA-1 fragments for each peptide.
+    '''
+    aa_masses, seq_offsets = calc_AA_masses_for_ragged_seqs(sequences)
+    mod_masses = calc_mod_masses_for_ragged_seqs(
+        seq_offsets, mod_offsets, mod_ids, mod_sites
+    )
+    if mod_deltas is not None:
+        delta_masses = np.zeros_like(mod_masses)
+        add_mod_masses_to_ragged_seqs(
+            delta_masses, seq_offsets, 
+            mod_delta_offsets, mod_deltas, mod_delta_sites,
+        )
+        mod_masses += delta_masses
+    aa_masses += mod_masses
+
+    frag_offsets = np.zeros_like(seq_offsets)
+    frag_offsets[1:] = np.cumsum(np.maximum(np.diff(seq_offsets)-1, 0))
+    b_masses = np.zeros(frag_offsets[-1])
+    y_masses = np.zeros(frag_offsets[-1])
+    pep_masses = np.zeros(len(sequences))
+    _calc_b_y_and_peptide_masses_for_ragged_seqs(
+        aa_masses, seq_offsets, frag_offsets, 
+        b_masses, y_masses, pep_masses,
+    )
+    return b_masses, y_masses, pep_masses, frag_offsets
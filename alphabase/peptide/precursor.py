@@ -5,12 +5,19 @@ import multiprocessing as mp
 
 from mmh3 import hash64
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
 
 from alphabase.constants.element import (
-    MASS_PROTON, MASS_ISOTOPE
+    MASS_PROTON, MASS_ISOTOPE, MASS_H2O
+)
+from alphabase.constants.aa import (
+    AA_formula, AA_ASCII_MASS, get_sequence_buffer
+)
+from alphabase.constants.modification import (
+    MOD_formula, get_mod_names, get_mod_masses,
+    encode_mods, encode_mod_deltas
 )
-from alphabase.constants.aa import AA_formula
-from alphabase.constants.modification import MOD_formula
 from alphabase.constants.isotope import (
     IsotopeDistribution
 )
@@ -67,12 +74,38 @@ def is_precursor_refined(precursor_df: pd.DataFrame):
 
 is_precursor_sorted = is_precursor_refined
 
+@numba.njit(nogil=True)
+def _calc_precursor_mzs(
+    seq_buf:np.ndarray, seq_offsets:np.ndarray,
+    mod_offsets:np.ndarray, mod_masses:np.ndarray,
+    delta_offsets:np.ndarray, mass_deltas:np.ndarray,
+    charges:np.ndarray, aa_masses:np.ndarray,
+    start:int, stop:int, precursor_mzs:np.ndarray,
+):
+    """Fill `precursor_mzs[start:stop]` from the residue buffer and 
+    per-mod masses in CSR layout."""
+    for i in range(start, stop):
+        pep_mass = 0.0
+        for k in range(seq_offsets[i], seq_offsets[i+1]):
+            pep_mass += aa_masses[seq_buf[k]]
+        pep_mass += MASS_H2O
+        mod_mass = 0.0
+        for k in range(mod_offsets[i], mod_offsets[i+1]):
+            mod_mass += mod_masses[k]
+        for k in range(delta_offsets[i], delta_offsets[i+1]):
+            mod_mass += mass_deltas[k]
+        precursor_mzs[i] = (pep_mass+mod_mass)/charges[i] + MASS_PROTON
+
 def update_precursor_mz(
     precursor_df: pd.DataFrame,
     batch_size = 500000,
+    n_threads:int = 1,
 )->pd.DataFrame:
     """
-    Calculate precursor_mz inplace in the precursor_df
+    Calculate precursor_mz inplace in the precursor_df.
+    Sequences and modifications are parsed once into flat buffers,
+    and precursor_mz values of all rows are calculated in one pass 
+    by a numba kernel without grouping by 'nAA'.
     
     Parameters
     ----------
@@ -80,6 +113,15 @@ def update_precursor_mz(
 
         precursor_df with the 'charge' column
 
+    batch_size : int, optional
+
+        Number of precursors of each batch for multi-threading, 
+        by default 500000
+
+    n_threads : int, optional
+
+        Number of threads to run batches, by default 1
+
     Returns
     -------
     pd.DataFrame
@@ -89,37 +131,42 @@ def update_precursor_mz(
 
     if 'nAA' not in precursor_df:
         reset_precursor_df(precursor_df)
-        _calc_in_order = True
-    elif is_precursor_sorted(precursor_df):
-        _calc_in_order = True
+
+    seq_buf, seq_offsets = get_sequence_buffer(precursor_df.sequence.values)
+    mod_offsets, mod_ids, _ = encode_mods(
+        precursor_df.mods.values, precursor_df.mod_sites.values
+    )
+    if 'mod_deltas' in precursor_df.columns:
+        delta_offsets, mass_deltas, _ = encode_mod_deltas(
+            precursor_df.mod_deltas.values, 
+            precursor_df.mod_delta_sites.values
+        )
     else:
-        _calc_in_order = False
-    precursor_df['precursor_mz'] = 0.
-    _grouped = precursor_df.groupby('nAA')
-    precursor_mz_idx = precursor_df.columns.get_loc(
-        'precursor_mz'
+        delta_offsets = np.zeros(len(precursor_df)+1, dtype=np.int64)
+        mass_deltas = np.empty(0, dtype=np.float64)
+
+    args = (
+        seq_buf, seq_offsets, 
+        mod_offsets, get_mod_masses(mod_ids),
+        delta_offsets, mass_deltas,
+        precursor_df.charge.values, AA_ASCII_MASS,
     )
-    for nAA, big_df_group in _grouped:
-        for i in range(0, len(big_df_group), batch_size):
-            batch_end = i+batch_size
-            
-            df_group = big_df_group.iloc[i:batch_end,:]
-
-            pep_mzs = calc_peptide_masses_for_same_len_seqs(
-                df_group.sequence.values.astype('U'),
-                df_group.mods.values,
-                df_group.mod_deltas.values if 
-                'mod_deltas' in df_group.columns else None
-            )/df_group.charge + MASS_PROTON
-            if _calc_in_order:
-                precursor_df.iloc[:,precursor_mz_idx].values[
-                    df_group.index.values[0]:
-                    df_group.index.values[-1]+1
-                ] = pep_mzs
-            else:
-                precursor_df.loc[
-                    df_group.index, 'precursor_mz'
-                ] = pep_mzs
+    precursor_mzs = np.zeros(len(precursor_df))
+    batches = [
+        (start, min(start+batch_size, len(precursor_df)))
+        for start in range(0, len(precursor_df), batch_size)
+    ]
+    if n_threads > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(n_threads) as executor:
+            list(executor.map(
+                lambda batch: _calc_precursor_mzs(
+                    *args, *batch, precursor_mzs
+                ), batches
+            ))
+    else:
+        for start, stop in batches:
+            _calc_precursor_mzs(*args, start, stop, precursor_mzs)
+    precursor_df['precursor_mz'] = precursor_mzs
     return precursor_df
 
 calc_precursor_mz = update_precursor_mz
@@ -277,9 +324,12 @@ def hash_precursor_df(
         hash_mod_seq_charge_df(precursor_df, seed=seed)
     return precursor_df
 
-def get_mod_seq_formula(seq:str, mods:str)->list:
+def get_mod_seq_formula(seq:str, mods:Union[str,np.ndarray])->list:
     """ 
     'PEPTIDE','Acetyl@Any N-term' --> [('C',n), ('H',m), ...] 
+
+    `mods` could also be integer mod ids, see
+    `alphabase.constants.modification.encode_mods`.
     """
     formula = {}
     for aa in seq:
@@ -289,7 +339,11 @@ def get_mod_seq_formula(seq:str, mods:str)->list:
             else:
                 formula[chem]=n
     if len(mods) > 0:
-        for mod in mods.split(';'):
+        if isinstance(mods, str):
+            mods = mods.split(';')
+        else:
+            mods = get_mod_names(mods)
+        for mod in mods:
             for chem,n in MOD_formula[mod].items():
                 if chem in formula:
                     formula[chem]+=n
@@ -343,7 +397,7 @@ def get_mod_seq_isotope_distribution(
     Parameters
     ----------
     seq_mods : tuple
-        (sequence, mods)
+        (sequence, mods), see :func:`get_mod_seq_formula`
     
     isotope_dist : IsotopeDistribution
         See `IsotopeDistribution` in `alphabase.constants.isotope`
@@ -413,6 +467,9 @@ def calc_precursor_isotope(
         update_precursor_mz(precursor_df)
 
     isotope_dist = IsotopeDistribution()
+    mod_offsets, mod_ids, _ = encode_mods(
+        precursor_df.mods.values, precursor_df.mod_sites.values
+    )
 
     (
         precursor_df['isotope_m1_intensity'], 
@@ -421,11 +478,15 @@ def calc_precursor_isotope(
         precursor_df['isotope_right_most_intensity'],
         precursor_df['isotope_right_most_offset'],
     ) = zip(
-        *precursor_df[['sequence','mods']].apply(
-            get_mod_seq_isotope_distribution, 
-            axis=1, isotope_dist=isotope_dist,
-            min_right_most_intensity=min_right_most_intensity,
-        )
+        *[
+            get_mod_seq_isotope_distribution(
+                (seq, mod_ids), isotope_dist=isotope_dist,
+                min_right_most_intensity=min_right_most_intensity,
+            ) for seq, mod_ids in zip(
+                precursor_df.sequence.values, 
+                np.split(mod_ids, mod_offsets[1:-1])
+            )
+        ]
     )
     precursor_df['isotope_m1_intensity'] = precursor_df[
         'isotope_m1_intensity'
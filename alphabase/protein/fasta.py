@@ -5,6 +5,9 @@ import numba
 import os
 import itertools
 import copy
+import gzip
+import mmap
+import multiprocessing as mp
 
 from Bio import SeqIO
 from typing import Union
@@ -14,6 +17,11 @@ from alphabase.io.hdf import HDF_File
 from alphabase.utils import explode_multiple_columns
 
 from alphabase.constants._const import CONST_FILE_FOLDER
+from alphabase.constants.aa import get_sequence_buffer
+from alphabase.constants.modification import mod_arrays_to_strings
+from alphabase.protein.lcp_digest import (
+    get_suffix_and_lcp_arrays, get_unique_peptides_from_lcp
+)
 
 from alphabase.spectral_library.base import SpecLibBase
 
@@ -68,6 +76,228 @@ def load_all_proteins(fasta_file_list:list):
             protein_dict[protein['protein_id']] = protein
     return protein_dict
 
+@numba.njit(nogil=True)
+def parse_fasta_buffer(buf:np.ndarray)->tuple:
+    """Parse FASTA records from an uint8 (ASCII) buffer.
+    Text before the first header line is skipped, and 
+    whitespace/control characters in sequences are removed.
+
+    Parameters
+    ----------
+    buf : np.ndarray
+        uint8 array of the FASTA text
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int64): start positions (after '>') of header lines in `buf`
+
+        np.ndarray (int64): stop positions of header lines in `buf`
+
+        np.ndarray (uint8): all sequences in a contiguous buffer
+
+        np.ndarray (int64): sequence offsets with length of `record_num+1`,
+        sequence i is `seq_buf[seq_offsets[i]:seq_offsets[i+1]]`
+    """
+    n_rec = 0
+    at_line_start = True
+    for i in range(len(buf)):
+        if at_line_start and buf[i] == 62: # '>'
+            n_rec += 1
+        at_line_start = buf[i] == 10 # '\n'
+
+    header_starts = np.empty(n_rec, dtype=np.int64)
+    header_stops = np.empty(n_rec, dtype=np.int64)
+    seq_offsets = np.zeros(n_rec+1, dtype=np.int64)
+    seq_buf = np.empty(len(buf), dtype=np.uint8)
+
+    k = -1
+    m = 0
+    in_header = False
+    at_line_start = True
+    for i in range(len(buf)):
+        c = buf[i]
+        if at_line_start and c == 62:
+            k += 1
+            header_starts[k] = i+1
+            seq_offsets[k] = m
+            in_header = True
+        if c == 10:
+            if in_header:
+                header_stops[k] = i
+                in_header = False
+            at_line_start = True
+            continue
+        at_line_start = False
+        if in_header or k < 0 or c <= 32:
+            continue
+        seq_buf[m] = c
+        m += 1
+    if in_header:
+        header_stops[k] = len(buf)
+    seq_offsets[n_rec] = m
+    return header_starts, header_stops, seq_buf[:m].copy(), seq_offsets
+
+def _iter_fasta_record_chunks(
+    fasta_filename:str, chunk_size:int, use_mmap:bool
+):
+    """Yield uint8 chunks of a FASTA file, each ending at a record boundary.
+    '.gz' files are decompressed on the fly.
+    """
+    if use_mmap and not fasta_filename.endswith('.gz'):
+        with open(fasta_filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                start = 0
+                while start < len(mm):
+                    stop = mm.find(b'\n>', start+chunk_size)
+                    stop = len(mm) if stop == -1 else stop+1
+                    yield np.frombuffer(
+                        mm[start:stop], dtype=np.uint8
+                    )
+                    start = stop
+        return
+
+    if fasta_filename.endswith('.gz'):
+        handle = gzip.open(fasta_filename, 'rb')
+    else:
+        handle = open(fasta_filename, 'rb')
+    with handle:
+        remainder = b''
+        while True:
+            data = handle.read(chunk_size)
+            if not data:
+                break
+            data = remainder + data
+            if len(data) < chunk_size+len(remainder):
+                # reached the end of the file
+                remainder = data
+                break
+            pos = data.rfind(b'\n>')
+            if pos == -1:
+                remainder = data
+                continue
+            remainder = data[pos+1:]
+            yield np.frombuffer(data[:pos+1], dtype=np.uint8)
+        if remainder:
+            yield np.frombuffer(remainder, dtype=np.uint8)
+
+def read_fasta_batches(
+    fasta_filename:str, 
+    chunk_size:int=64*1024*1024,
+    use_mmap:bool=False,
+):
+    """
+    Read a FASTA file in binary chunks without creating 
+    Biopython records. '.gz' files are also supported.
+
+    Parameters
+    ----------
+    fasta_filename : str
+        fasta, or gzipped fasta ('.gz').
+
+    chunk_size : int, optional
+        Approximate byte size of each chunk, by default 64MB
+
+    use_mmap : bool, optional
+        If memory-map the (uncompressed) fasta file, by default False
+
+    Yields
+    ------
+    dict
+        Columnar protein batch:
+        {protein_id:np.ndarray, full_name:np.ndarray, gene_name:np.ndarray, 
+        description:np.ndarray, sequence_buffer:np.ndarray (uint8), 
+        sequence_offsets:np.ndarray (int64, length of `protein_num+1`)}
+    """
+    for buf in _iter_fasta_record_chunks(
+        fasta_filename, chunk_size, use_mmap
+    ):
+        (
+            header_starts, header_stops, seq_buf, seq_offsets
+        ) = parse_fasta_buffer(buf)
+        if len(header_starts) == 0: continue
+        descriptions = np.array([
+            buf[start:stop].tobytes().decode('utf-8').rstrip()
+            for start, stop in zip(header_starts, header_stops)
+        ], dtype=object)
+        full_names = np.array([
+            desc.split(None, 1)[0] if desc else ''
+            for desc in descriptions
+        ], dtype=object)
+        protein_ids = np.array([
+            parts[1] if len(parts) > 1 else name
+            for name in full_names
+            for parts in (name.split('|'),)
+        ], dtype=object)
+        gene_names = np.array([
+            get_uniprot_gene_name(desc) for desc in descriptions
+        ], dtype=object)
+        yield {
+            'protein_id': protein_ids,
+            'full_name': full_names,
+            'gene_name': gene_names,
+            'description': descriptions,
+            'sequence_buffer': seq_buf,
+            'sequence_offsets': seq_offsets,
+        }
+
+def load_protein_df(
+    fasta_file_list:list, 
+    chunk_size:int=64*1024*1024,
+    use_mmap:bool=False,
+)->pd.DataFrame:
+    """Load proteins from fasta files into a DataFrame 
+    using :func:`read_fasta_batches`. 
+    The result is the same as 
+    `pd.DataFrame.from_dict(load_all_proteins(fasta_file_list), orient='index')`, 
+    i.e. duplicated protein_ids are kept at the first position 
+    with the values of the last occurrence.
+
+    Parameters
+    ----------
+    fasta_file_list : list
+        fasta file list
+
+    chunk_size : int, optional
+        see :func:`read_fasta_batches`
+
+    use_mmap : bool, optional
+        see :func:`read_fasta_batches`
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with columns 'protein_id', 'full_name',
+        'gene_name', 'description', and 'sequence'
+    """
+    columns = ['protein_id','full_name','gene_name','description']
+    batches = {col:[] for col in columns+['sequence']}
+    for fasta in fasta_file_list:
+        for batch in read_fasta_batches(fasta, chunk_size, use_mmap):
+            for col in columns:
+                batches[col].append(batch[col])
+            seq_bytes = batch['sequence_buffer'].tobytes()
+            offsets = batch['sequence_offsets']
+            batches['sequence'].append(np.array([
+                seq_bytes[start:stop].decode('utf-8') for start, stop 
+                in zip(offsets[:-1], offsets[1:])
+            ], dtype=object))
+    if len(batches['protein_id']) == 0:
+        return pd.DataFrame(columns=columns+['sequence'])
+    protein_df = pd.DataFrame({
+        col: np.concatenate(vals) for col, vals in batches.items()
+    })
+    codes, _ = pd.factorize(protein_df.protein_id)
+    if codes.max()+1 < len(codes):
+        last_idxes = np.zeros(codes.max()+1, dtype=np.int64)
+        np.maximum.at(last_idxes, codes, np.arange(len(codes)))
+        protein_df = protein_df.iloc[last_idxes].reset_index(drop=True)
+    return protein_df
+
 def concat_proteins(protein_dict:dict, sep='$')->str:
     """Concatenate all protein sequences into a single sequence, 
     seperated by `sep ($ by default)`.
@@ -87,9 +317,86 @@ def concat_proteins(protein_dict:dict, sep='$')->str:
     for key in protein_dict:
         protein_dict[key]['offset'] = seq_count
         seq_list.append(protein_dict[key]['sequence'])
-        seq_count += protein_dict[key]['sequence']+1
+        seq_count += len(protein_dict[key]['sequence'])+1
     seq_list.append('')
-    return '$'.join(seq_list)
+    return sep.join(seq_list)
+
+def concat_protein_sequences(
+    protein_seqs:Union[list,np.ndarray], sep:str='$'
+)->tuple:
+    """Concatenate protein sequences into a single uint8 (ASCII) array,
+    in the same layout as :func:`concat_proteins`.
+
+    Parameters
+    ----------
+    protein_seqs : list | np.ndarray
+        protein sequences
+
+    sep : str, optional
+        separator between proteins, by default '$'
+
+    Returns
+    -------
+    tuple
+        np.ndarray (uint8): concatenated sequence
+
+        np.ndarray (int64): start position of each protein
+
+        np.ndarray (int64): length of each protein
+    """
+    prot_lens = np.fromiter(
+        (len(seq) for seq in protein_seqs), 
+        dtype=np.int64, count=len(protein_seqs)
+    )
+    prot_starts = np.ones(len(prot_lens), dtype=np.int64)
+    prot_starts[1:] += np.cumsum(prot_lens[:-1]+1)
+    cat_prot = np.frombuffer(
+        sep.join(['',*protein_seqs,'']).encode('ascii'),
+        dtype=np.uint8
+    )
+    return cat_prot, prot_starts, prot_lens
+
+def _concat_non_ascii_protein_sequences(
+    protein_seqs:Union[list,np.ndarray], sep:str='$'
+)->tuple:
+    """
+    Same as :func:`concat_protein_sequences`, but non-ASCII residues 
+    are mapped to byte values from 128, which only match negated 
+    character classes (e.g. [^P]) of cleavage rules.
+
+    Returns
+    -------
+    tuple
+        Same as :func:`concat_protein_sequences`, and 
+        dict: the translation table to map bytes back to residues 
+        (`str.translate` of latin-1 decoded peptides)
+    """
+    non_ascii = sorted(
+        c for c in set(''.join(protein_seqs)) if ord(c) > 127
+    )
+    if len(non_ascii) > 128:
+        raise ValueError(
+            f"Too many ({len(non_ascii)}) non-ASCII residues in proteins"
+        )
+    encode_table = str.maketrans({
+        c: chr(128+i) for i,c in enumerate(non_ascii)
+    })
+    cat_prot = np.frombuffer(
+        sep.join(['',*protein_seqs,'']).translate(
+            encode_table
+        ).encode('latin-1'),
+        dtype=np.uint8
+    )
+    prot_lens = np.fromiter(
+        (len(seq) for seq in protein_seqs), 
+        dtype=np.int64, count=len(protein_seqs)
+    )
+    prot_starts = np.ones(len(prot_lens), dtype=np.int64)
+    prot_starts[1:] += np.cumsum(prot_lens[:-1]+1)
+    decode_table = str.maketrans({
+        chr(128+i): c for i,c in enumerate(non_ascii)
+    })
+    return cat_prot, prot_starts, prot_lens, decode_table
 
 protease_dict = load_yaml(
     os.path.join(
@@ -166,12 +473,357 @@ def cleave_sequence_with_cut_pos(
                     cterm_list.append(False)
     return seq_list, miss_list, nterm_list, cterm_list
 
+def _parse_cleavage_char_classes(pattern:str)->list:
+    """
+    Split a regex without groups into single-char classes,
+    e.g. '[DE]{3}\w' -> ['[DE]','[DE]','[DE]','\w'].
+    """
+    char_classes = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '[':
+            j = pattern.index(']', i+2)
+            char_class = pattern[i:j+1]
+            i = j+1
+        elif pattern[i] == '\\':
+            char_class = pattern[i:i+2]
+            i += 2
+        elif pattern[i] in '()|?*+{}^$':
+            raise ValueError(f'Unsupported regex "{pattern}"')
+        else:
+            char_class = pattern[i]
+            i += 1
+        m = re.match(r'\{(\d+)\}', pattern[i:])
+        if m:
+            char_classes.extend([char_class]*int(m.group(1)))
+            i += m.end()
+        else:
+            char_classes.append(char_class)
+    return char_classes
+
+def _split_top_level_alternatives(pattern:str)->list:
+    alternatives = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(pattern):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i+1
+    alternatives.append(pattern[start:])
+    return alternatives
+
+def _strip_outer_group(pattern:str)->str:
+    while pattern.startswith('(') and not pattern.startswith('(?'):
+        depth = 0
+        for i, c in enumerate(pattern):
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+                if depth == 0: break
+        if i != len(pattern)-1: break
+        pattern = pattern[1:-1]
+    return pattern
+
+def _char_class_to_table(char_class:str, sep:str='$')->np.ndarray:
+    table = np.array([
+        re.fullmatch(char_class, chr(i)) is not None 
+        # bytes >= 128 are mapped non-ASCII residues 
+        # (see `_concat_non_ascii_protein_sequences`), 
+        # which only match negated classes like [^P]
+        for i in range(256)
+    ], dtype=np.bool_)
+    # lookarounds must not see the neighbour proteins
+    table[ord(sep)] = False
+    return table
+
+def get_cleavage_site_mask(
+    cat_prot:np.ndarray,
+    cleavage_rule:list,
+)->np.ndarray:
+    """
+    Find all cleavage sites in one pass over a (concatenated) 
+    sequence with a rule compiled by :func:`compile_cleavage_rule`.
+
+    Parameters
+    ----------
+    cat_prot : np.ndarray
+        uint8 (ASCII) sequence, e.g. from :func:`concat_protein_sequences`
+
+    cleavage_rule : list
+        compiled cleavage rule
+
+    Returns
+    -------
+    np.ndarray
+        uint8 mask, 1 if the protein is cleaved 
+        after this position (`m.start()` of the regex match)
+    """
+    cut_mask = np.zeros(len(cat_prot), dtype=np.bool_)
+    for lookbehind, center, lookahead in cleavage_rule:
+        term = center[cat_prot]
+        for j, table in enumerate(lookbehind[::-1], 1):
+            term[j:] &= table[cat_prot[:-j]]
+            term[:j] = False
+        for j, table in enumerate(lookahead, 1):
+            term[:-j] &= table[cat_prot[j:]]
+            term[-j:] = False
+        cut_mask |= term
+    return cut_mask.view(np.uint8)
+
+def compile_cleavage_rule(
+    regex_pattern:str, sep:str='$'
+)->list:
+    """
+    Compile a protease regex into lookup tables for 
+    :func:`get_cleavage_site_mask`. Only regexes in which each 
+    alternative matches exactly one residue with optional
+    lookbehind/lookahead char classes are supported, 
+    this covers most proteases in :data:`protease_dict`.
+
+    Parameters
+    ----------
+    regex_pattern : str
+        protease regular expression
+
+    sep : str, optional
+        protein separator in the concatenated sequence, by default '$'
+
+    Returns
+    -------
+    list
+        compiled rule: list of (lookbehind tables, center table, lookahead tables),
+        or None if the regex is not supported.
+    """
+    try:
+        cleavage_rule = []
+        for alternative in _split_top_level_alternatives(regex_pattern):
+            m = re.fullmatch(
+                r'(?:\(\?<=([^()]+)\))?([^()]+)(?:\(\?=([^()]+)\))?',
+                _strip_outer_group(alternative)
+            )
+            if m is None: return None
+            lookbehind, center, lookahead = [
+                _parse_cleavage_char_classes(p) if p else []
+                for p in m.groups()
+            ]
+            if len(center) != 1: return None
+            cleavage_rule.append((
+                [_char_class_to_table(c, sep) for c in lookbehind],
+                _char_class_to_table(center[0], sep),
+                [_char_class_to_table(c, sep) for c in lookahead],
+            ))
+    except (ValueError, re.error):
+        return None
+
+    # Make sure the compiled rule is identical to the regex
+    regex = re.compile(regex_pattern)
+    rng = np.random.default_rng(1337)
+    aas = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWYUXOBZJ', dtype=np.uint8)
+    test_seqs = [
+        rng.choice(aas, size=rng.integers(1, 50)).tobytes().decode()
+        for _ in range(200)
+    ]
+    cat_prot, prot_starts, prot_lens = concat_protein_sequences(
+        test_seqs, sep
+    )
+    cut_mask = get_cleavage_site_mask(cat_prot, cleavage_rule)
+    for seq, start in zip(test_seqs, prot_starts):
+        if not np.array_equal(
+            np.flatnonzero(cut_mask[start:start+len(seq)]),
+            [m.start() for m in regex.finditer(seq)]
+        ):
+            return None
+    return cleavage_rule
+
+@numba.njit
+def _enlarge_digest_arrays(
+    prot_idxes, pep_starts, pep_stops, 
+    miss_cleavages, is_nterms, is_cterms,
+):
+    n = len(pep_starts)*2+16
+    _prot_idxes = np.empty(n, dtype=prot_idxes.dtype)
+    _prot_idxes[:len(prot_idxes)] = prot_idxes
+    _pep_starts = np.empty(n, dtype=pep_starts.dtype)
+    _pep_starts[:len(pep_starts)] = pep_starts
+    _pep_stops = np.empty(n, dtype=pep_stops.dtype)
+    _pep_stops[:len(pep_stops)] = pep_stops
+    _misses = np.empty(n, dtype=miss_cleavages.dtype)
+    _misses[:len(miss_cleavages)] = miss_cleavages
+    _nterms = np.empty(n, dtype=is_nterms.dtype)
+    _nterms[:len(is_nterms)] = is_nterms
+    _cterms = np.empty(n, dtype=is_cterms.dtype)
+    _cterms[:len(is_cterms)] = is_cterms
+    return _prot_idxes, _pep_starts, _pep_stops, _misses, _nterms, _cterms
+
+@numba.njit(nogil=True)
+def cleave_proteome_with_cut_mask(
+    cat_prot:np.ndarray,
+    cut_mask:np.ndarray,
+    prot_starts:np.ndarray,
+    prot_lens:np.ndarray,
+    n_missed_cleavages:int=2,
+    pep_length_min:int=6,
+    pep_length_max:int=45,
+)->tuple:
+    """
+    Array version of :func:`cleave_sequence_with_cut_pos` 
+    for all proteins in the concatenated sequence,
+    the protein N-term Met loss of :meth:`Digest.cleave_sequence` 
+    is also considered. Peptides are returned in exactly the same order 
+    as calling :meth:`Digest.cleave_sequence` protein by protein.
+
+    Parameters
+    ----------
+    cat_prot : np.ndarray
+        uint8 concatenated protein sequences
+
+    cut_mask : np.ndarray
+        uint8 cleavage site mask, see :func:`get_cleavage_site_mask`
+
+    prot_starts : np.ndarray
+        start positions of proteins in `cat_prot`
+
+    prot_lens : np.ndarray
+        lengths of proteins
+
+    n_missed_cleavages : int
+        the number of max missed cleavages.
+
+    pep_length_min : int
+        min peptide length.
+
+    pep_length_max :int
+        max peptide length.
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int32): protein index of each peptide
+
+        np.ndarray (int64): peptide start positions in `cat_prot`
+
+        np.ndarray (int64): peptide stop positions in `cat_prot`
+
+        np.ndarray (int64): miss cleavages
+
+        np.ndarray (bool): if protein N-term
+
+        np.ndarray (bool): if protein C-term
+    """
+    n = (np.sum(cut_mask)+len(prot_starts))*(n_missed_cleavages+1)+16
+    prot_idxes = np.empty(n, dtype=np.int32)
+    pep_starts = np.empty(n, dtype=np.int64)
+    pep_stops = np.empty(n, dtype=np.int64)
+    miss_cleavages = np.empty(n, dtype=np.int64)
+    is_nterms = np.empty(n, dtype=np.bool_)
+    is_cterms = np.empty(n, dtype=np.bool_)
+    k = 0
+    for prot_idx in range(len(prot_starts)):
+        offset = prot_starts[prot_idx]
+        prot_len = prot_lens[prot_idx]
+        cut_pos = np.empty(
+            np.sum(cut_mask[offset:offset+prot_len])+2, dtype=np.int64
+        )
+        cut_pos[0] = 0
+        n_cut = 1
+        for i in range(prot_len):
+            if cut_mask[offset+i]:
+                cut_pos[n_cut] = i+1
+                n_cut += 1
+        cut_pos[n_cut] = prot_len
+        first_k = k
+        for i in range(len(cut_pos)):
+            start_pos = cut_pos[i]
+            for n_miss in range(n_missed_cleavages+1):
+                if i+1+n_miss >= len(cut_pos): break
+                end_pos = cut_pos[i+1+n_miss]
+                if end_pos > start_pos + pep_length_max:
+                    break
+                elif end_pos < start_pos + pep_length_min:
+                    continue
+                if k >= len(pep_starts):
+                    (
+                        prot_idxes, pep_starts, pep_stops, 
+                        miss_cleavages, is_nterms, is_cterms
+                    ) = _enlarge_digest_arrays(
+                        prot_idxes, pep_starts, pep_stops, 
+                        miss_cleavages, is_nterms, is_cterms
+                    )
+                prot_idxes[k] = prot_idx
+                pep_starts[k] = offset+start_pos
+                pep_stops[k] = offset+end_pos
+                miss_cleavages[k] = n_miss
+                is_nterms[k] = start_pos == 0
+                is_cterms[k] = end_pos == prot_len
+                k += 1
+        # Consider M loss at protein N-term
+        if prot_len == 0 or cat_prot[offset] != 77: # 'M'
+            continue
+        i = first_k
+        while i < k:
+            pep_len = pep_stops[i]-pep_starts[i]
+            is_prefix = pep_len > pep_length_min
+            if is_prefix:
+                for j in range(pep_len):
+                    if cat_prot[pep_starts[i]+j] != cat_prot[offset+j]:
+                        is_prefix = False
+                        break
+            if is_prefix:
+                if k >= len(pep_starts):
+                    (
+                        prot_idxes, pep_starts, pep_stops, 
+                        miss_cleavages, is_nterms, is_cterms
+                    ) = _enlarge_digest_arrays(
+                        prot_idxes, pep_starts, pep_stops, 
+                        miss_cleavages, is_nterms, is_cterms
+                    )
+                prot_idxes[k] = prot_idx
+                pep_starts[k] = pep_starts[i]+1
+                pep_stops[k] = pep_stops[i]
+                miss_cleavages[k] = miss_cleavages[i]
+                is_nterms[k] = True
+                is_cterms[k] = is_cterms[i]
+                k += 1
+            i += 1
+    return (
+        prot_idxes[:k], pep_starts[:k], pep_stops[:k],
+        miss_cleavages[:k], is_nterms[:k], is_cterms[:k],
+    )
+
+@numba.njit(nogil=True)
+def get_peptide_bytes_from_proteome(
+    cat_prot:np.ndarray,
+    pep_starts:np.ndarray,
+    pep_stops:np.ndarray,
+)->np.ndarray:
+    """
+    Get the zero-padded 2-D uint8 array of peptides 
+    by `cat_prot[pep_starts[i]:pep_stops[i]]`. 
+    It can be viewed as fixed-width byte strings with
+    `.view(f'S{array.shape[1]}').ravel()`.
+    """
+    max_len = 1
+    for i in range(len(pep_starts)):
+        max_len = max(max_len, pep_stops[i]-pep_starts[i])
+    pep_bytes = np.zeros((len(pep_starts), max_len), dtype=np.uint8)
+    for i in range(len(pep_starts)):
+        pep_bytes[i,:pep_stops[i]-pep_starts[i]] = cat_prot[
+            pep_starts[i]:pep_stops[i]
+        ]
+    return pep_bytes
+
 class Digest(object):
     def __init__(self,
         protease:str='trypsin/P',
         max_missed_cleavages:int=2,
         peptide_length_min:int=6,
         peptide_length_max:int=45,
+        specificity:str='specific',
     ):
         """Digest a protein sequence
 
@@ -190,19 +842,36 @@ class Digest(object):
             
         peptide_length_max : int, optional
             Maximal cleaved peptide length, by default 45
+
+        specificity : str, optional
+            'specific', 'semi-specific' (at least one terminus is specific),
+            or 'non-specific' (all sub-sequences).
+            Semi- and non-specific digestion only work on whole proteomes
+            with :meth:`digest_proteome_by_lcp`, see :func:`cleave_proteins`.
+            Protease 'non-specific' always uses 'non-specific'.
+            By default 'specific'
         """
 
         self.n_miss_cleave = max_missed_cleavages
         self.peptide_length_min = peptide_length_min
         self.peptide_length_max = peptide_length_max
-        if protease.lower() in protease_dict:
-            self.regex_pattern = re.compile(
-                protease_dict[protease.lower()]
+        if protease.lower() == 'non-specific':
+            specificity = 'non-specific'
+        if specificity not in (
+            'specific', 'semi-specific', 'non-specific'
+        ):
+            raise ValueError(
+                f'Unknown digestion specificity "{specificity}"'
             )
+        self.specificity = specificity
+        if protease.lower() in protease_dict:
+            regex_str = protease_dict[protease.lower()]
         else:
-            self.regex_pattern = re.compile(
-                protease
-            )
+            regex_str = protease
+        self.regex_pattern = re.compile(regex_str)
+        # None if the regex cannot be compiled, 
+        # then `cleave_sequence` is used for digestion
+        self.cleavage_rule = compile_cleavage_rule(regex_str)
 
     def cleave_sequence(self,
         sequence:str,
@@ -255,6 +924,499 @@ class Digest(object):
                     cterm_list.append(cterm)
         return seq_list, miss_list, nterm_list, cterm_list
 
+    def cleave_proteome(self,
+        cat_prot:np.ndarray,
+        prot_starts:np.ndarray,
+        prot_lens:np.ndarray,
+    )->tuple:
+        """
+        Cleave all proteins in the concatenated sequence at once
+        with the compiled cleavage rule (`self.cleavage_rule`).
+
+        Parameters
+        ----------
+        cat_prot : np.ndarray
+            uint8 concatenated sequence, see :func:`concat_protein_sequences`
+
+        prot_starts : np.ndarray
+            start positions of proteins in `cat_prot`
+
+        prot_lens : np.ndarray
+            lengths of proteins
+
+        Returns
+        -------
+        tuple
+            See :func:`cleave_proteome_with_cut_mask`
+        """
+        if self.cleavage_rule is None:
+            raise ValueError(
+                f'Regex "{self.regex_pattern.pattern}" cannot be compiled, '
+                'use `cleave_sequence` instead'
+            )
+        return cleave_proteome_with_cut_mask(
+            cat_prot, 
+            get_cleavage_site_mask(cat_prot, self.cleavage_rule),
+            prot_starts, prot_lens,
+            self.n_miss_cleave,
+            self.peptide_length_min,
+            self.peptide_length_max,
+        )
+
+    def get_cleavage_site_mask(self,
+        cat_prot:np.ndarray,
+        prot_starts:np.ndarray,
+        prot_lens:np.ndarray,
+    )->np.ndarray:
+        """
+        Cleavage site mask of the concatenated sequence, 
+        use the compiled rule if possible, 
+        otherwise search the regex protein by protein.
+
+        Parameters
+        ----------
+        cat_prot : np.ndarray
+            uint8 concatenated sequence, see :func:`concat_protein_sequences`
+
+        prot_starts : np.ndarray
+            start positions of proteins in `cat_prot`
+
+        prot_lens : np.ndarray
+            lengths of proteins
+
+        Returns
+        -------
+        np.ndarray
+            See :func:`get_cleavage_site_mask`
+        """
+        if self.cleavage_rule is not None:
+            return get_cleavage_site_mask(cat_prot, self.cleavage_rule)
+        cut_mask = np.zeros(len(cat_prot), dtype=np.uint8)
+        for start, length in zip(prot_starts, prot_lens):
+            # latin-1 also keeps bytes of mapped non-ASCII residues
+            sequence = cat_prot[start:start+length].tobytes().decode('latin-1')
+            for m in self.regex_pattern.finditer(sequence):
+                if m.start() < length:
+                    cut_mask[start+m.start()] = 1
+        return cut_mask
+
+    def digest_proteome_by_lcp(self,
+        cat_prot:np.ndarray,
+        prot_starts:np.ndarray,
+        prot_lens:np.ndarray,
+    )->tuple:
+        """
+        Semi-specific or non-specific digestion of all proteins 
+        in the concatenated sequence. Peptides are enumerated 
+        with the suffix array and LCP array, so each unique peptide
+        is only generated once.
+
+        Parameters
+        ----------
+        cat_prot : np.ndarray
+            uint8 concatenated sequence, see :func:`concat_protein_sequences`
+
+        prot_starts : np.ndarray
+            start positions of proteins in `cat_prot`
+
+        prot_lens : np.ndarray
+            lengths of proteins
+
+        Returns
+        -------
+        tuple
+            See :func:`alphabase.protein.lcp_digest.get_unique_peptides_from_lcp`
+        """
+        semi_specific = self.specificity == 'semi-specific'
+        if semi_specific:
+            cut_mask = self.get_cleavage_site_mask(
+                cat_prot, prot_starts, prot_lens
+            )
+        else:
+            cut_mask = np.zeros(len(cat_prot), dtype=np.uint8)
+        suffix_array, lcp_array = get_suffix_and_lcp_arrays(cat_prot)
+        return get_unique_peptides_from_lcp(
+            cat_prot, suffix_array, lcp_array,
+            prot_starts, prot_lens, cut_mask,
+            semi_specific, self.n_miss_cleave,
+            self.peptide_length_min, self.peptide_length_max,
+        )
+
+def digest_protein_shard(
+    protein_seqs:Union[list,np.ndarray],
+    first_protein_idx:int,
+    digest:Digest,
+)->tuple:
+    """
+    Digest a shard (a contiguous slice) of protein sequences.
+    The results are not de-duplicated, see :func:`merge_digested_peptides`.
+
+    Parameters
+    ----------
+    protein_seqs : list | np.ndarray
+        Protein sequences of this shard
+
+    first_protein_idx : int
+        The protein index of `protein_seqs[0]` in the whole protein_df
+
+    digest : Digest
+        The :class:`Digest` object to cleave sequences
+
+    Returns
+    -------
+    tuple
+        np.ndarray (object): cleaved peptide sequences
+
+        np.ndarray (int32): protein index of each peptide
+
+        np.ndarray (int64): miss cleavage of each peptide
+
+        np.ndarray (bool): if protein N-term
+
+        np.ndarray (bool): if protein C-term
+    """
+    seq_list = []
+    miss_list = []
+    nterm_list = []
+    cterm_list = []
+    pep_counts = np.zeros(len(protein_seqs), dtype=np.int64)
+    for i,prot_seq in enumerate(protein_seqs):
+        (
+            _seqs, _misses, _nterms, _cterms
+        ) = digest.cleave_sequence(prot_seq)
+        seq_list.extend(_seqs)
+        miss_list.extend(_misses)
+        nterm_list.extend(_nterms)
+        cterm_list.extend(_cterms)
+        pep_counts[i] = len(_seqs)
+    return (
+        np.array(seq_list, dtype=object),
+        np.repeat(np.arange(
+            first_protein_idx, first_protein_idx+len(protein_seqs),
+            dtype=np.int32
+        ), pep_counts),
+        np.array(miss_list, dtype=np.int64),
+        np.array(nterm_list, dtype=np.bool_),
+        np.array(cterm_list, dtype=np.bool_),
+    )
+
+def _digest_protein_shard_tuple(args:tuple)->tuple:
+    """Internal function for multiprocessing"""
+    return digest_protein_shard(*args)
+
+def protein_csr_to_strings(
+    prot_offsets:np.ndarray, 
+    protein_idxes:np.ndarray, 
+    protein_names:np.ndarray=None,
+)->np.ndarray:
+    """
+    Translate the CSR-style peptide-protein mapping 
+    (protein indices of peptide i are 
+    `protein_idxes[prot_offsets[i]:prot_offsets[i+1]]`)
+    into ';'-joined strings of protein indices, or of `protein_names`
+    if given. Empty names are skipped as :func:`protein_idxes_to_names`.
+
+    Parameters
+    ----------
+    prot_offsets : np.ndarray
+        int64 offsets with length of `peptide_num+1`
+
+    protein_idxes : np.ndarray
+        int32 protein indices
+
+    protein_names : np.ndarray, optional
+        Protein names (e.g. `protein_df.protein_id.values`), 
+        by default None
+
+    Returns
+    -------
+    np.ndarray
+        object array of ';'-joined strings for each peptide
+    """
+    if protein_names is None:
+        if len(protein_idxes) == 0:
+            return np.full(len(prot_offsets)-1, '', dtype=object)
+        protein_names = np.arange(protein_idxes.max()+1).astype('U')
+    prot_strs = np.asarray(protein_names, dtype=object)[protein_idxes]
+    prot_counts = np.diff(prot_offsets)
+    non_empty = prot_strs != ''
+    if not non_empty.all():
+        prot_strs = prot_strs[non_empty]
+        prot_counts = np.bincount(
+            np.repeat(np.arange(len(prot_counts)), prot_counts)[non_empty],
+            minlength=len(prot_counts)
+        )
+        prot_offsets = np.zeros(len(prot_counts)+1, dtype=np.int64)
+        prot_offsets[1:] = np.cumsum(prot_counts)
+
+    joined = np.full(len(prot_counts), '', dtype=object)
+    # most peptides are unique to one protein, only join the shared ones
+    single = prot_counts == 1
+    joined[single] = prot_strs[prot_offsets[:-1][single]]
+    for i in np.flatnonzero(prot_counts > 1):
+        joined[i] = ';'.join(
+            prot_strs[prot_offsets[i]:prot_offsets[i+1]]
+        )
+    return joined
+
+def protein_idxes_to_csr(protein_idxes:np.ndarray)->tuple:
+    """Convert ';'-joined protein index strings into 
+    the CSR-style mapping, see :func:`protein_csr_to_strings`.
+
+    Parameters
+    ----------
+    protein_idxes : np.ndarray
+        ';'-joined protein indices of each peptide
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int64): offsets with length of `peptide_num+1`
+
+        np.ndarray (int32): protein indices
+    """
+    protein_idxes = pd.Series(protein_idxes, dtype=object).fillna('')
+    prot_counts = protein_idxes.str.count(';').values+1
+    prot_counts[(protein_idxes == '').values] = 0
+    prot_offsets = np.zeros(len(prot_counts)+1, dtype=np.int64)
+    prot_offsets[1:] = np.cumsum(prot_counts)
+    non_empty = protein_idxes[protein_idxes != '']
+    if len(non_empty) == 0:
+        return prot_offsets, np.array([], dtype=np.int32)
+    return prot_offsets, np.array(
+        ';'.join(non_empty).split(';'), dtype=np.int32
+    )
+
+def merge_digested_peptides(
+    sequences:np.ndarray,
+    protein_idxes:np.ndarray,
+    miss_cleavages:np.ndarray,
+    is_prot_nterm:np.ndarray,
+    is_prot_cterm:np.ndarray,
+    return_protein_csr:bool=False,
+)->pd.DataFrame:
+    """
+    Vectorized de-duplication of digested peptides.
+    Peptides are kept in the order of their first occurrence,
+    the `miss_cleavage` is from the first occurrence,
+    `is_prot_nterm` and `is_prot_cterm` are True if any of
+    the occurrences is True. Protein indices of each peptide
+    are unique and ';'-joined in ascending order of occurrence.
+
+    Parameters
+    ----------
+    sequences : np.ndarray
+        Peptide sequences, could contain duplicates
+
+    protein_idxes : np.ndarray
+        Protein index of each sequence, must be non-decreasing
+        for identical sequences
+
+    miss_cleavages : np.ndarray
+        Miss cleavage of each sequence
+
+    is_prot_nterm : np.ndarray
+        If each sequence is at protein N-term
+
+    is_prot_cterm : np.ndarray
+        If each sequence is at protein C-term
+
+    return_protein_csr : bool, optional
+        If True, return the CSR-style protein mapping instead of 
+        the 'protein_idxes' column, by default False
+
+    Returns
+    -------
+    pd.DataFrame | tuple
+        DataFrame with columns 'sequence', 'protein_idxes',
+        'miss_cleavage', 'is_prot_nterm' and 'is_prot_cterm'.
+
+        If `return_protein_csr`, tuple of (the DataFrame without 
+        'protein_idxes', int64 protein offsets, int32 protein indices), 
+        see :func:`protein_csr_to_strings`.
+    """
+    codes, uniq_seqs = pd.factorize(sequences)
+    n_uniq = len(uniq_seqs)
+    _, first_idxes = np.unique(codes, return_index=True)
+
+    sorted_idxes = np.argsort(codes, kind='stable')
+    sorted_codes = codes[sorted_idxes]
+    sorted_prots = protein_idxes[sorted_idxes]
+    keep = np.ones(len(sorted_codes), dtype=np.bool_)
+    keep[1:] = (
+        (sorted_codes[1:] != sorted_codes[:-1]) |
+        (sorted_prots[1:] != sorted_prots[:-1])
+    )
+
+    if uniq_seqs.dtype.kind == 'S':
+        uniq_seqs = uniq_seqs.astype('U')
+
+    prot_offsets = np.zeros(n_uniq+1, dtype=np.int64)
+    prot_offsets[1:] = np.cumsum(
+        np.bincount(sorted_codes[keep], minlength=n_uniq)
+    )
+
+    prot_idxes = sorted_prots[keep].astype(np.int32)
+
+    df = pd.DataFrame({
+        'sequence': np.asarray(uniq_seqs, dtype=object),
+        'miss_cleavage': miss_cleavages[first_idxes].astype(np.int64),
+        'is_prot_nterm': np.bincount(
+            codes, weights=is_prot_nterm, minlength=n_uniq
+        ) > 0,
+        'is_prot_cterm': np.bincount(
+            codes, weights=is_prot_cterm, minlength=n_uniq
+        ) > 0,
+    })
+    if return_protein_csr:
+        return df, prot_offsets, prot_idxes
+    df.insert(
+        1, 'protein_idxes', 
+        protein_csr_to_strings(prot_offsets, prot_idxes)
+    )
+    return df
+
+def cleave_proteins(
+    protein_seqs:Union[list,np.ndarray],
+    digest:Digest,
+    *,
+    shard_size:int=5000,
+    processes:int=1,
+    min_protein_num_to_run_mp:int=20000,
+    process_bar=None,
+    return_protein_csr:bool=False,
+)->pd.DataFrame:
+    """
+    Cleave protein sequences into unique peptides.
+    Semi-specific and non-specific digestion (`digest.specificity`)
+    uses :meth:`Digest.digest_proteome_by_lcp`.
+    If the protease regex can be compiled (`digest.cleavage_rule`), 
+    all proteins are concatenated and cleaved at once 
+    with :meth:`Digest.cleave_proteome`. Otherwise, 
+    proteins are split into shards of `shard_size` proteins,
+    each shard is digested independently (optionally in
+    a process pool). The array-backed results
+    are merged by :func:`merge_digested_peptides`.
+
+    Parameters
+    ----------
+    protein_seqs : list | np.ndarray
+        Protein sequences, the protein index of
+        a peptide is the position in this list
+
+    digest : Digest
+        The :class:`Digest` object to cleave sequences
+
+    shard_size : int, optional
+        Number of proteins in each shard, by default 5000
+
+    processes : int, optional
+        Process number, by default 1 (no multiprocessing)
+
+    min_protein_num_to_run_mp : int, optional
+        Only use multiprocessing if there are more
+        proteins than this value, by default 20000
+
+    process_bar : Callable, optional
+        The tqdm-based callback function
+        to check multiprocessing. Defaults to None.
+
+    return_protein_csr : bool, optional
+        See :func:`merge_digested_peptides`, by default False
+
+    Returns
+    -------
+    pd.DataFrame | tuple
+        See :func:`merge_digested_peptides`
+    """
+    if digest.specificity != 'specific':
+        try:
+            cat_prot, prot_starts, prot_lens = concat_protein_sequences(
+                protein_seqs
+            )
+            decode_table = None
+        except UnicodeEncodeError:
+            (
+                cat_prot, prot_starts, prot_lens, decode_table
+            ) = _concat_non_ascii_protein_sequences(protein_seqs)
+        (
+            pep_starts, pep_stops, miss_cleavages, 
+            is_nterms, is_cterms, prot_offsets, prot_idxes
+        ) = digest.digest_proteome_by_lcp(cat_prot, prot_starts, prot_lens)
+        pep_bytes = get_peptide_bytes_from_proteome(
+            cat_prot, pep_starts, pep_stops
+        )
+        pep_seqs = pep_bytes.view(f'S{pep_bytes.shape[1]}').ravel()
+        if decode_table is None:
+            pep_seqs = pep_seqs.astype('U').astype(object)
+        else:
+            pep_seqs = pd.Series(
+                np.char.decode(pep_seqs, 'latin-1'), dtype=object
+            ).str.translate(decode_table).values
+        df = pd.DataFrame({
+            'sequence': pep_seqs,
+            'miss_cleavage': miss_cleavages,
+            'is_prot_nterm': is_nterms,
+            'is_prot_cterm': is_cterms,
+        })
+        if return_protein_csr:
+            return df, prot_offsets, prot_idxes
+        df.insert(
+            1, 'protein_idxes', 
+            protein_csr_to_strings(prot_offsets, prot_idxes)
+        )
+        return df
+
+    if digest.cleavage_rule is not None:
+        try:
+            cat_prot, prot_starts, prot_lens = concat_protein_sequences(
+                protein_seqs
+            )
+        except UnicodeEncodeError:
+            cat_prot = None
+        if cat_prot is not None:
+            (
+                prot_idxes, pep_starts, pep_stops,
+                miss_cleavages, is_nterms, is_cterms
+            ) = digest.cleave_proteome(cat_prot, prot_starts, prot_lens)
+            pep_bytes = get_peptide_bytes_from_proteome(
+                cat_prot, pep_starts, pep_stops
+            )
+            return merge_digested_peptides(
+                pep_bytes.view(f'S{pep_bytes.shape[1]}').ravel(),
+                prot_idxes, miss_cleavages, is_nterms, is_cterms,
+                return_protein_csr=return_protein_csr,
+            )
+
+    shards = [
+        (protein_seqs[i:i+shard_size], i, digest)
+        for i in range(0, len(protein_seqs), shard_size)
+    ]
+    if (
+        processes > 1 and
+        len(protein_seqs) > min_protein_num_to_run_mp
+    ):
+        with mp.get_context("spawn").Pool(processes) as p:
+            processing = p.imap(_digest_protein_shard_tuple, shards)
+            if process_bar:
+                processing = process_bar(processing, len(shards))
+            shard_results = list(processing)
+    else:
+        shard_results = [
+            digest_protein_shard(*shard) for shard in shards
+        ]
+
+    if len(shard_results) == 0:
+        return merge_digested_peptides(
+            np.array([], dtype=object), np.array([], dtype=np.int32),
+            np.array([], dtype=np.int64), np.array([], dtype=np.bool_),
+            np.array([], dtype=np.bool_),
+            return_protein_csr=return_protein_csr,
+        )
+    return merge_digested_peptides(*[
+        np.concatenate(arrays) for arrays in zip(*shard_results)
+    ], return_protein_csr=return_protein_csr)
+
 def get_fix_mods(
     sequence:str,
     fix_mod_aas:str,
@@ -385,37 +1547,312 @@ def get_var_mods_per_sites_single_mod_on_aa(
             mod_str += var_mod_dict[sequence[site-1]]+';'
     return [mod_str[:-1]]
 
-get_var_mods_per_sites = get_var_mods_per_sites_single_mod_on_aa
+get_var_mods_per_sites = get_var_mods_per_sites_single_mod_on_aa
+
+def get_var_mods(
+    sequence:str,
+    var_mod_aas:str,
+    mod_dict:dict,
+    min_var_mod:int,
+    max_var_mod:int,
+    max_combs:int,
+)->tuple:
+    """
+    Generate all modification combinations and associated sites
+    for the sequence.
+    """
+    mod_sites_list = get_var_mod_sites(
+        sequence, var_mod_aas, 
+        min_var_mod, max_var_mod, max_combs
+    )
+    ret_mods = []
+    ret_sites_list = []
+    for mod_sites in mod_sites_list:
+        _mods = get_var_mods_per_sites(
+            sequence,mod_sites,mod_dict
+        )
+        mod_sites_str = ';'.join([str(i) for i in mod_sites])
+        ret_mods.extend(_mods)
+        ret_sites_list.extend([mod_sites_str]*len(_mods))
+    if min_var_mod == 0:
+        ret_mods.append('')
+        ret_sites_list.append('')
+    return ret_mods, ret_sites_list
+
+@numba.njit
+def _emit_peptidoform(
+    seq:np.ndarray, pep_idx:int, nterm_mod:int,
+    cand_sites:np.ndarray, combo:np.ndarray, n_var:int, expand_idx:int,
+    fix_mod_of_aa:np.ndarray, var_mod_starts:np.ndarray, 
+    var_mod_counts:np.ndarray, var_mod_ids:np.ndarray,
+    row_pep_idxes:np.ndarray, mod_offsets:np.ndarray,
+    mod_ids:np.ndarray, mod_sites:np.ndarray,
+    n_rows:int, n_mods:int, fill:bool,
+)->tuple:
+    """Emit one peptidoform: fixed mods, N-term mod and then variable mods"""
+    m = n_mods
+    for i in range(len(seq)):
+        if fix_mod_of_aa[seq[i]] >= 0:
+            if fill:
+                mod_ids[m] = fix_mod_of_aa[seq[i]]
+                mod_sites[m] = i+1
+            m += 1
+    if nterm_mod >= 0:
+        if fill:
+            mod_ids[m] = nterm_mod
+            mod_sites[m] = 0
+        m += 1
+    for j in range(n_var):
+        site = cand_sites[combo[j]]
+        if fill:
+            aa = seq[site]
+            mod_ids[m] = var_mod_ids[
+                var_mod_starts[aa]+expand_idx%var_mod_counts[aa]
+            ]
+            mod_sites[m] = site+1
+        expand_idx //= var_mod_counts[seq[site]]
+        m += 1
+    if fill:
+        row_pep_idxes[n_rows] = pep_idx
+        mod_offsets[n_rows+1] = m
+    return n_rows+1, m
+
+@numba.njit
+def _emit_var_mods_of_peptide(
+    seq:np.ndarray, pep_idx:int, nterm_mod:int,
+    fix_mod_of_aa:np.ndarray, var_mod_starts:np.ndarray, 
+    var_mod_counts:np.ndarray, var_mod_ids:np.ndarray,
+    min_var_mod:int, max_var_mod:int, max_combs:int,
+    row_pep_idxes:np.ndarray, mod_offsets:np.ndarray,
+    mod_ids:np.ndarray, mod_sites:np.ndarray,
+    n_rows:int, n_mods:int, fill:bool,
+)->tuple:
+    """Emit peptidoforms of all variable mod combinations
+    in the same order as :func:`get_var_mods`"""
+    cand_sites = np.empty(len(seq), dtype=np.int64)
+    n_cand = 0
+    for i in range(len(seq)):
+        if var_mod_counts[seq[i]] > 0:
+            cand_sites[n_cand] = i
+            n_cand += 1
+    combo = np.zeros(max(max_var_mod,1), dtype=np.int64)
+
+    n_combs = 0
+    if min_var_mod <= 1 and max_var_mod >= 1:
+        for i in range(n_cand):
+            combo[0] = i
+            for t in range(var_mod_counts[seq[cand_sites[i]]]):
+                n_rows, n_mods = _emit_peptidoform(
+                    seq, pep_idx, nterm_mod, cand_sites, combo, 1, t,
+                    fix_mod_of_aa, var_mod_starts, var_mod_counts, var_mod_ids,
+                    row_pep_idxes, mod_offsets, mod_ids, mod_sites,
+                    n_rows, n_mods, fill,
+                )
+        n_combs = n_cand
+    for n_var in range(max(2, min_var_mod), max_var_mod+1):
+        if n_combs >= max_combs: break
+        if n_var > n_cand: continue
+        for j in range(n_var):
+            combo[j] = j
+        while n_combs < max_combs:
+            n_expand = 1
+            for j in range(n_var):
+                n_expand *= var_mod_counts[seq[cand_sites[combo[j]]]]
+            for t in range(n_expand):
+                n_rows, n_mods = _emit_peptidoform(
+                    seq, pep_idx, nterm_mod, cand_sites, combo, n_var, t,
+                    fix_mod_of_aa, var_mod_starts, var_mod_counts, var_mod_ids,
+                    row_pep_idxes, mod_offsets, mod_ids, mod_sites,
+                    n_rows, n_mods, fill,
+                )
+            n_combs += 1
+            # next combination in lexicographic order
+            j = n_var-1
+            while j >= 0 and combo[j] == n_cand-n_var+j:
+                j -= 1
+            if j < 0: break
+            combo[j] += 1
+            for jj in range(j+1, n_var):
+                combo[jj] = combo[jj-1]+1
+    if min_var_mod == 0:
+        n_rows, n_mods = _emit_peptidoform(
+            seq, pep_idx, nterm_mod, cand_sites, combo, 0, 0,
+            fix_mod_of_aa, var_mod_starts, var_mod_counts, var_mod_ids,
+            row_pep_idxes, mod_offsets, mod_ids, mod_sites,
+            n_rows, n_mods, fill,
+        )
+    return n_rows, n_mods
+
+@numba.njit
+def _enumerate_peptidoforms(
+    seq_buf:np.ndarray, seq_offsets:np.ndarray, is_prot_nterms:np.ndarray,
+    fix_mod_of_aa:np.ndarray, 
+    var_mod_starts:np.ndarray, var_mod_counts:np.ndarray, var_mod_ids:np.ndarray,
+    prot_nterm_starts:np.ndarray, prot_nterm_counts:np.ndarray, 
+    prot_nterm_ids:np.ndarray,
+    pep_nterm_starts:np.ndarray, pep_nterm_counts:np.ndarray, 
+    pep_nterm_ids:np.ndarray,
+    min_var_mod:int, max_var_mod:int, max_combs:int,
+    row_pep_idxes:np.ndarray, mod_offsets:np.ndarray,
+    mod_ids:np.ndarray, mod_sites:np.ndarray, fill:bool,
+)->tuple:
+    n_rows = 0
+    n_mods = 0
+    nterm_mods = np.empty(
+        1+prot_nterm_counts.max()*2+pep_nterm_counts.max()*2, dtype=np.int32
+    )
+    for pep_idx in range(len(seq_offsets)-1):
+        seq = seq_buf[seq_offsets[pep_idx]:seq_offsets[pep_idx+1]]
+        nterm_mods[0] = -1
+        n_nterm = 1
+        # index 0 of the tables is for N-term mods on any AA
+        for aa in (0, np.int64(seq[0])):
+            if is_prot_nterms[pep_idx]:
+                for k in range(prot_nterm_counts[aa]):
+                    nterm_mods[n_nterm] = prot_nterm_ids[prot_nterm_starts[aa]+k]
+                    n_nterm += 1
+        for aa in (0, np.int64(seq[0])):
+            for k in range(pep_nterm_counts[aa]):
+                nterm_mods[n_nterm] = pep_nterm_ids[pep_nterm_starts[aa]+k]
+                n_nterm += 1
+        for k in range(n_nterm):
+            n_rows, n_mods = _emit_var_mods_of_peptide(
+                seq, pep_idx, nterm_mods[k],
+                fix_mod_of_aa, var_mod_starts, var_mod_counts, var_mod_ids,
+                min_var_mod, max_var_mod, max_combs,
+                row_pep_idxes, mod_offsets, mod_ids, mod_sites,
+                n_rows, n_mods, fill,
+            )
+    return n_rows, n_mods
+
+def _get_aa_mod_table(aa_mod_dict:dict, mod_name_idxes:dict)->tuple:
+    """Convert {aa: [mods]} into (starts, counts, mod ids) tables
+    indexed by ASCII codes, '' (any AA) is indexed by 0."""
+    starts = np.zeros(128, dtype=np.int64)
+    counts = np.zeros(128, dtype=np.int64)
+    ids = []
+    for aa, mods in aa_mod_dict.items():
+        if isinstance(mods, str): mods = [mods]
+        aa_idx = ord(aa) if aa else 0
+        starts[aa_idx] = len(ids)
+        counts[aa_idx] = len(mods)
+        ids.extend(mod_name_idxes.setdefault(mod, len(mod_name_idxes)) for mod in mods)
+    return starts, counts, np.array(ids, dtype=np.int32)
+
+def enumerate_peptidoform_mods(
+    sequences:np.ndarray,
+    is_prot_nterms:np.ndarray,
+    fix_mod_dict:dict,
+    var_mod_dict:dict,
+    var_mod_prot_nterm_dict:dict,
+    var_mod_pep_nterm_dict:dict,
+    min_var_mod:int,
+    max_var_mod:int,
+    max_combs:int,
+    cannot_modify_pep_nterm_aa:bool=False,
+    cannot_modify_pep_cterm_aa:bool=False,
+)->tuple:
+    """
+    Enumerate fixed and variable modifications of all peptides at once
+    into integer-coded arrays, the order of peptidoforms is the same as
+    :meth:`SpecLibFasta.add_mods_for_one_seq`.
+
+    Parameters
+    ----------
+    sequences : np.ndarray
+        ASCII peptide sequences
+
+    is_prot_nterms : np.ndarray
+        If peptides are at protein N-term
+
+    fix_mod_dict : dict
+        {aa: mod}
+
+    var_mod_dict : dict
+        {aa: mod} or {aa: [mods]}
+
+    var_mod_prot_nterm_dict : dict
+        {aa or '': [mods]}
+
+    var_mod_pep_nterm_dict : dict
+        {aa or '': [mods]}
+
+    min_var_mod : int
+        min number of variable mods in a peptide
+
+    max_var_mod : int
+        max number of variable mods in a peptide
+
+    max_combs : int
+        max number of variable mod site combinations of a peptide
+
+    cannot_modify_pep_nterm_aa : bool, optional
+        If AA-specific mods (including AA-specific N-term mods) 
+        cannot modify the first AA of peptides, by default False
+
+    cannot_modify_pep_cterm_aa : bool, optional
+        If AA-specific mods cannot modify the last AA of peptides, 
+        by default False
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int64): peptide index of each peptidoform
+
+        np.ndarray (int64): mod offsets with length of `peptidoform_num+1`,
+        mods of peptidoform i are `mod_ids[mod_offsets[i]:mod_offsets[i+1]]`
 
-def get_var_mods(
-    sequence:str,
-    var_mod_aas:str,
-    mod_dict:dict,
-    min_var_mod:int,
-    max_var_mod:int,
-    max_combs:int,
-)->tuple:
-    """
-    Generate all modification combinations and associated sites
-    for the sequence.
+        np.ndarray (int32): mod ids, indices of `mod_names`
+
+        np.ndarray (int16): mod sites
+
+        np.ndarray (object): mod_names
     """
-    mod_sites_list = get_var_mod_sites(
-        sequence, var_mod_aas, 
-        min_var_mod, max_var_mod, max_combs
-    )
-    ret_mods = []
-    ret_sites_list = []
-    for mod_sites in mod_sites_list:
-        _mods = get_var_mods_per_sites(
-            sequence,mod_sites,mod_dict
+    mod_name_idxes = {}
+    fix_mod_of_aa = np.full(128, -1, dtype=np.int32)
+    for aa, mod in fix_mod_dict.items():
+        fix_mod_of_aa[ord(aa)] = mod_name_idxes.setdefault(
+            mod, len(mod_name_idxes)
         )
-        mod_sites_str = ';'.join([str(i) for i in mod_sites])
-        ret_mods.extend(_mods)
-        ret_sites_list.extend([mod_sites_str]*len(_mods))
-    if min_var_mod == 0:
-        ret_mods.append('')
-        ret_sites_list.append('')
-    return ret_mods, ret_sites_list
+    var_mod_tables = _get_aa_mod_table(var_mod_dict, mod_name_idxes)
+    prot_nterm_tables = _get_aa_mod_table(
+        var_mod_prot_nterm_dict, mod_name_idxes
+    )
+    pep_nterm_tables = _get_aa_mod_table(
+        var_mod_pep_nterm_dict, mod_name_idxes
+    )
+    mod_names = np.array(list(mod_name_idxes), dtype=object)
+
+    seq_buf, seq_offsets = get_sequence_buffer(sequences)
+    if cannot_modify_pep_nterm_aa or cannot_modify_pep_cterm_aa:
+        # lower-case letters are not in the AA mod tables
+        seq_buf = seq_buf.copy()
+        non_empty = np.diff(seq_offsets) > 0
+        if cannot_modify_pep_nterm_aa:
+            seq_buf[seq_offsets[:-1][non_empty]] |= 0x20
+        if cannot_modify_pep_cterm_aa:
+            seq_buf[seq_offsets[1:][non_empty]-1] |= 0x20
+    is_prot_nterms = np.asarray(is_prot_nterms, dtype=np.bool_)
+
+    args = (
+        seq_buf, seq_offsets, is_prot_nterms, fix_mod_of_aa,
+        *var_mod_tables, *prot_nterm_tables, *pep_nterm_tables,
+        min_var_mod, max_var_mod, max_combs,
+    )
+    n_rows, n_mods = _enumerate_peptidoforms(
+        *args, 
+        np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+        np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int16),
+        False,
+    )
+    row_pep_idxes = np.empty(n_rows, dtype=np.int64)
+    mod_offsets = np.zeros(n_rows+1, dtype=np.int64)
+    mod_ids = np.empty(n_mods, dtype=np.int32)
+    mod_sites = np.empty(n_mods, dtype=np.int16)
+    _enumerate_peptidoforms(
+        *args, row_pep_idxes, mod_offsets, mod_ids, mod_sites, True,
+    )
+    return row_pep_idxes, mod_offsets, mod_ids, mod_sites, mod_names
 
 def parse_term_mod(term_mod_name:str):
     _mod, term = term_mod_name.split('@')
@@ -472,11 +1909,148 @@ def parse_labels(labels:list):
             cterm_label_mod = label
     return label_aas, label_mod_dict, nterm_label_mod, cterm_label_mod
         
+def join_mod_strings(
+    mods:np.ndarray, mod_sites:np.ndarray,
+    app_mods:np.ndarray, app_mod_sites:np.ndarray,
+)->tuple:
+    """';'-join `app_mods` and `app_mod_sites` after 
+    `mods` and `mod_sites` of each peptide, empty strings are skipped.
+
+    Returns
+    -------
+    tuple
+        np.ndarray (object): mods
+
+        np.ndarray (object): mod_sites
+    """
+    mods = np.asarray(mods, dtype=object)
+    mod_sites = np.asarray(mod_sites, dtype=object)
+    new_mods = np.array(app_mods, dtype=object)
+    new_sites = np.array(app_mod_sites, dtype=object)
+    has_mods = mod_sites != ''
+    has_apps = new_sites != ''
+    only_mods = has_mods & ~has_apps
+    new_mods[only_mods] = mods[only_mods]
+    new_sites[only_mods] = mod_sites[only_mods]
+    both = has_mods & has_apps
+    new_mods[both] = mods[both]+';'+new_mods[both]
+    new_sites[both] = mod_sites[both]+';'+new_sites[both]
+    return new_mods, new_sites
+
+@numba.njit
+def _get_label_mod_arrays(
+    seq_buf:np.ndarray, seq_offsets:np.ndarray,
+    label_of_aa:np.ndarray,
+    add_nterms:np.ndarray, add_cterms:np.ndarray,
+)->tuple:
+    """Integer-coded labels of all peptides, label id 0 is the 
+    N-term label, 1 is the C-term label, and `label_of_aa[aa]` for AAs."""
+    n_labels = 0
+    for i in range(len(seq_offsets)-1):
+        n_labels += add_nterms[i] + add_cterms[i]
+        for k in range(seq_offsets[i], seq_offsets[i+1]):
+            if label_of_aa[seq_buf[k]] >= 0:
+                n_labels += 1
+    label_offsets = np.zeros(len(seq_offsets), dtype=np.int64)
+    label_ids = np.empty(n_labels, dtype=np.int32)
+    label_sites = np.empty(n_labels, dtype=np.int16)
+    m = 0
+    for i in range(len(seq_offsets)-1):
+        if add_nterms[i]:
+            label_ids[m] = 0
+            label_sites[m] = 0
+            m += 1
+        if add_cterms[i]:
+            label_ids[m] = 1
+            label_sites[m] = -1
+            m += 1
+        for k in range(seq_offsets[i], seq_offsets[i+1]):
+            if label_of_aa[seq_buf[k]] >= 0:
+                label_ids[m] = label_of_aa[seq_buf[k]]
+                label_sites[m] = k-seq_offsets[i]+1
+                m += 1
+        label_offsets[i+1] = m
+    return label_offsets, label_ids, label_sites
+
+def get_labeling_mods(
+    sequences:np.ndarray,
+    mods:np.ndarray,
+    mod_sites:np.ndarray,
+    labels:list,
+)->tuple:
+    """
+    Add labeling modifications to 'mods' and 'mod_sites' of 
+    all peptides at once, same as :func:`add_single_peptide_labeling`.
+
+    Parameters
+    ----------
+    sequences : np.ndarray
+        Peptide sequences
+
+    mods : np.ndarray
+        Existing modifications
+
+    mod_sites : np.ndarray
+        Existing modification sites
+
+    labels : list
+        Labeling modifications, see :func:`parse_labels`
+
+    Returns
+    -------
+    tuple
+        np.ndarray (object): mods with labels
+
+        np.ndarray (object): mod_sites with labels
+    """
+    (
+        label_aas, label_mod_dict, 
+        nterm_label_mod, cterm_label_mod
+    ) = parse_labels(labels)
+
+    mods = np.asarray(mods, dtype=object)
+    mod_sites = np.asarray(mod_sites, dtype=object)
+    _sites = (';'+pd.Series(mod_sites, dtype=object)+';')
+    add_nterms = np.zeros(len(mods), dtype=np.int64)
+    if nterm_label_mod:
+        add_nterms[:] = ~_sites.str.contains(';0;', regex=False).values
+    add_cterms = np.zeros(len(mods), dtype=np.int64)
+    if cterm_label_mod:
+        add_cterms[:] = ~_sites.str.contains(';-1;', regex=False).values
+
+    label_names = [nterm_label_mod, cterm_label_mod]
+    label_of_aa = np.full(128, -1, dtype=np.int32)
+    for aa in label_aas:
+        label_of_aa[ord(aa)] = len(label_names)
+        label_names.append(label_mod_dict[aa])
+
+    seq_buf, seq_offsets = get_sequence_buffer(sequences)
+    label_mods, label_sites = mod_arrays_to_strings(
+        *_get_label_mod_arrays(
+            seq_buf, seq_offsets, label_of_aa, add_nterms, add_cterms,
+        ), np.array(label_names, dtype=object)
+    )
+
+    return join_mod_strings(mods, mod_sites, label_mods, label_sites)
+
 def create_labeling_peptide_df(peptide_df:pd.DataFrame, labels:list):
     if len(peptide_df) == 0: return peptide_df
 
     df = peptide_df.copy()
 
+    try:
+        (
+            df['mods'],
+            df['mod_sites']
+        ) = get_labeling_mods(
+            df.sequence.values, df.mods.values, 
+            df.mod_sites.values, labels
+        )
+        return df
+    except UnicodeEncodeError:
+        # non-ASCII sequences
+        pass
+
     (
         label_aas, label_mod_dict, 
         nterm_label_mod, cterm_label_mod
@@ -502,6 +2076,65 @@ def protein_idxes_to_names(protein_idxes:str, protein_names:list):
     proteins = [protein for protein in proteins if protein]
     return ';'.join(proteins)
 
+def _append_special_modifications_per_seq(
+    df:pd.DataFrame, 
+    var_mods:list, 
+    min_mod_num:int, max_mod_num:int, 
+    max_peptidoform_num:int,
+    cannot_modify_pep_nterm_aa:bool,
+    cannot_modify_pep_cterm_aa:bool,
+)->pd.DataFrame:
+    """Sequence-wise :func:`append_special_modifications`, 
+    used for non-ASCII sequences."""
+    if cannot_modify_pep_nterm_aa:
+        df['sequence'] = df['sequence'].apply(
+            lambda seq: seq[0].lower()+seq[1:]
+        )
+    
+    if cannot_modify_pep_cterm_aa:
+        df['sequence'] = df['sequence'].apply(
+            lambda seq: seq[:-1]+seq[-1].lower()
+        )
+
+    mod_dict = dict([(mod[-1],mod) for mod in var_mods])
+    var_mod_aas = ''.join(mod_dict.keys())
+    
+    (
+        df['mods_app'],
+        df['mod_sites_app']
+    ) = zip(*df.sequence.apply(get_var_mods,
+            var_mod_aas=var_mod_aas, mod_dict=mod_dict, 
+            min_var_mod=min_mod_num, max_var_mod=max_mod_num, 
+            max_combs=max_peptidoform_num,
+        )
+    )
+
+    if cannot_modify_pep_nterm_aa:
+        df['sequence'] = df['sequence'].apply(
+            lambda seq: seq[0].upper()+seq[1:]
+        )
+    
+    if cannot_modify_pep_cterm_aa:
+        df['sequence'] = df['sequence'].apply(
+            lambda seq: seq[:-1]+seq[-1].upper()
+        )
+    
+    if min_mod_num==0:
+        df = df.explode(['mods_app','mod_sites_app'])
+        df.fillna('', inplace=True)
+    else:
+        df.drop(df[df.mods_app.apply(lambda x: len(x)==0)].index, inplace=True)
+        df = df.explode(['mods_app','mod_sites_app'])
+    df['mods'] = df[['mods','mods_app']].apply(
+        lambda x: ';'.join(i for i in x if i), axis=1
+    )
+    df['mod_sites'] = df[['mod_sites','mod_sites_app']].apply(
+        lambda x: ';'.join(i for i in x if i), axis=1
+    )
+    df.drop(columns=['mods_app', 'mod_sites_app'], inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
 def append_special_modifications(
     df:pd.DataFrame, 
     var_mods:list = ['Phospho@S','Phospho@T','Phospho@Y'], 
@@ -513,6 +2146,7 @@ def append_special_modifications(
     """
     Append special (not N/C-term) variable modifications to the 
     exsiting modifications of each sequence in `df`.
+    All sequences are enumerated at once by :func:`enumerate_peptidoform_mods`.
 
     Parameters
     ----------
@@ -552,53 +2186,30 @@ def append_special_modifications(
     if len(var_mods) == 0 or len(df) == 0: 
         return df
 
-    if cannot_modify_pep_nterm_aa:
-        df['sequence'] = df['sequence'].apply(
-            lambda seq: seq[0].lower()+seq[1:]
-        )
-    
-    if cannot_modify_pep_cterm_aa:
-        df['sequence'] = df['sequence'].apply(
-            lambda seq: seq[:-1]+seq[-1].lower()
-        )
-
     mod_dict = dict([(mod[-1],mod) for mod in var_mods])
-    var_mod_aas = ''.join(mod_dict.keys())
-    
-    (
-        df['mods_app'],
-        df['mod_sites_app']
-    ) = zip(*df.sequence.apply(get_var_mods,
-            var_mod_aas=var_mod_aas, mod_dict=mod_dict, 
-            min_var_mod=min_mod_num, max_var_mod=max_mod_num, 
-            max_combs=max_peptidoform_num,
-        )
-    )
-
-    if cannot_modify_pep_nterm_aa:
-        df['sequence'] = df['sequence'].apply(
-            lambda seq: seq[0].upper()+seq[1:]
+    try:
+        (
+            row_pep_idxes, mod_offsets, mod_ids, mod_sites, mod_names
+        ) = enumerate_peptidoform_mods(
+            df.sequence.values, np.zeros(len(df), dtype=np.bool_),
+            {}, mod_dict, {}, {},
+            min_mod_num, max_mod_num, max_peptidoform_num,
+            cannot_modify_pep_nterm_aa=cannot_modify_pep_nterm_aa,
+            cannot_modify_pep_cterm_aa=cannot_modify_pep_cterm_aa,
         )
-    
-    if cannot_modify_pep_cterm_aa:
-        df['sequence'] = df['sequence'].apply(
-            lambda seq: seq[:-1]+seq[-1].upper()
+    except UnicodeEncodeError:
+        return _append_special_modifications_per_seq(
+            df, var_mods, min_mod_num, max_mod_num, 
+            max_peptidoform_num,
+            cannot_modify_pep_nterm_aa, cannot_modify_pep_cterm_aa,
         )
-    
-    if min_mod_num==0:
-        df = df.explode(['mods_app','mod_sites_app'])
-        df.fillna('', inplace=True)
-    else:
-        df.drop(df[df.mods_app.apply(lambda x: len(x)==0)].index, inplace=True)
-        df = df.explode(['mods_app','mod_sites_app'])
-    df['mods'] = df[['mods','mods_app']].apply(
-        lambda x: ';'.join(i for i in x if i), axis=1
+    app_mods, app_mod_sites = mod_arrays_to_strings(
+        mod_offsets, mod_ids, mod_sites, mod_names
     )
-    df['mod_sites'] = df[['mod_sites','mod_sites_app']].apply(
-        lambda x: ';'.join(i for i in x if i), axis=1
+    df = df.iloc[row_pep_idxes].reset_index(drop=True)
+    df['mods'], df['mod_sites'] = join_mod_strings(
+        df.mods.values, df.mod_sites.values, app_mods, app_mod_sites
     )
-    df.drop(columns=['mods_app', 'mod_sites_app'], inplace=True)
-    df.reset_index(drop=True, inplace=True)
     return df
 
 class SpecLibFasta(SpecLibBase):
@@ -618,10 +2229,29 @@ class SpecLibFasta(SpecLibBase):
         thousands of peptidoforms generated for some peptides, 
         so we use this attribute to control the overall number of 
         peptidoforms of a peptide.
+
+    digest_process_num : int, 1 by default
+        Process number to digest proteins,
+        see :func:`cleave_proteins`.
+
+    digest_shard_size : int, 5000 by default
+        Number of proteins in each digestion shard,
+        see :func:`cleave_proteins`.
     
     protein_df : pd.DataFrame
         Protein dataframe with columns 'protein_id', 
         'sequence', 'description', 'gene_name', etc.
+
+    peptide_protein_offsets : np.ndarray
+        int64 offsets of the CSR-style peptide-protein mapping 
+        of digested peptides, protein indices of the peptide 
+        with `precursor_df.peptide_idx==i` are
+        `peptide_protein_idxes[peptide_protein_offsets[i]:peptide_protein_offsets[i+1]]`.
+        None if proteins are not digested.
+
+    peptide_protein_idxes : np.ndarray
+        int32 protein indices of the CSR-style mapping, 
+        see `peptide_protein_offsets`.
     """
     def __init__(self,
         charged_frag_types:list = [
@@ -632,6 +2262,7 @@ class SpecLibFasta(SpecLibBase):
         max_missed_cleavages:int = 2,
         peptide_length_min:int = 7,
         peptide_length_max:int = 35,
+        specificity:str = 'specific',
         precursor_charge_min:int = 2,
         precursor_charge_max:int = 4,
         precursor_mz_min:float = 400.0, 
@@ -671,6 +2302,11 @@ class SpecLibFasta(SpecLibBase):
         peptide_length_max : int, optional
             Maximal cleaved peptide length, by default 35
 
+        specificity : str, optional
+            Digestion specificity, 'specific', 'semi-specific' 
+            or 'non-specific', see :class:`Digest`. 
+            By default 'specific'
+
         precursor_charge_min : int, optional
             Minimal precursor charge, by default 2
 
@@ -744,9 +2380,14 @@ class SpecLibFasta(SpecLibBase):
         self.I_to_L = I_to_L
         self.include_contaminants = include_contaminants
         self.max_peptidoform_num = 100
+        self.digest_process_num = 1
+        self.digest_shard_size = 5000
+        self.peptide_protein_offsets:np.ndarray = None
+        self.peptide_protein_idxes:np.ndarray = None
         self._digest = Digest(
             protease, max_missed_cleavages,
-            peptide_length_min, peptide_length_max
+            peptide_length_min, peptide_length_max,
+            specificity=specificity,
         )
         self.min_precursor_charge = precursor_charge_min
         self.max_precursor_charge = precursor_charge_max
@@ -876,12 +2517,8 @@ class SpecLibFasta(SpecLibBase):
         fasta_files : list
             A fasta file or a list of fasta files
         """
-        if self.include_contaminants:
-            fasta_files.append(os.path.join(
-                CONST_FILE_FOLDER, 'contaminants.fasta'
-            ))
-        protein_dict = load_all_proteins(fasta_files)
-        self.import_and_process_protein_dict(protein_dict)
+        self.get_peptides_from_fasta(fasta_files)
+        self._process_after_load_pep_seqs()
 
     def import_and_process_protein_dict(self, protein_dict:dict):
         """ 
@@ -918,7 +2555,9 @@ class SpecLibFasta(SpecLibBase):
 
         protein_list : list, optional
             Protein id list which maps to pep_seq_list one-by-one, 
-            by default None
+            by default None. If None and `self.protein_df` is loaded
+            (e.g. by :func:`load_protein_df`), peptides are mapped to 
+            proteins by :meth:`map_peptides_to_protein_df`.
         """
         self.get_peptides_from_peptide_sequence_list(
             pep_seq_list, protein_list
@@ -961,8 +2600,7 @@ class SpecLibFasta(SpecLibBase):
             fasta_files.append(os.path.join(
                 CONST_FILE_FOLDER, 'contaminants.fasta'
             ))
-        protein_dict = load_all_proteins(fasta_files)
-        self.get_peptides_from_protein_dict(protein_dict)
+        self.get_peptides_from_protein_df(load_protein_df(fasta_files))
 
     def get_peptides_from_protein_dict(self, protein_dict:dict):
         """Cleave the protein sequences in protein_dict.
@@ -979,9 +2617,22 @@ class SpecLibFasta(SpecLibBase):
             }
             ```
         """
-        self.protein_df = pd.DataFrame.from_dict(
-            protein_dict, orient='index'
-        ).reset_index(drop=True)
+        self.get_peptides_from_protein_df(
+            pd.DataFrame.from_dict(
+                protein_dict, orient='index'
+            ).reset_index(drop=True)
+        )
+
+    def get_peptides_from_protein_df(self, protein_df:pd.DataFrame):
+        """Cleave the protein sequences in protein_df.
+
+        Parameters
+        ----------
+        protein_df : pd.DataFrame
+            Protein DataFrame with columns 'protein_id', 'sequence', 
+            'gene_name', ..., see :func:`load_protein_df`.
+        """
+        self.protein_df = protein_df
 
         if self.I_to_L:
             self.protein_df[
@@ -999,7 +2650,10 @@ class SpecLibFasta(SpecLibBase):
         protein_df:pd.DataFrame,
         protein_seq_column:str='sequence'
     ):
-        """Cleave protein sequences in protein_df
+        """Cleave protein sequences in protein_df.
+        Peptide-protein mapping is stored in `self.peptide_protein_offsets`
+        and `self.peptide_protein_idxes`, indexed by the 'peptide_idx' column,
+        see :meth:`append_protein_name`.
 
         Parameters
         ----------
@@ -1008,71 +2662,100 @@ class SpecLibFasta(SpecLibBase):
         protein_seq_column : str, optional
             Target column containing protein sequences, by default 'sequence'
         """
-        pep_dict = {}
-
-        for i,prot_seq in enumerate(
-            protein_df[protein_seq_column].values
-        ):
-            (
-                seq_list, miss_list, nterm_list, cterm_list
-            ) = self._digest.cleave_sequence(prot_seq)
-            for seq,miss,nterm,cterm in zip(
-                seq_list,miss_list,nterm_list, cterm_list
-            ):
-                prot_id = str(i)
-                if seq in pep_dict:
-                    if not pep_dict[seq][0].endswith(prot_id):
-                        pep_dict[seq][0] += ';'+prot_id
-                    if nterm:
-                        pep_dict[seq][2] = nterm
-                    if cterm:
-                        pep_dict[seq][3] = cterm
-                else:
-                    pep_dict[seq] = [prot_id,miss,nterm,cterm]
-        self._precursor_df = pd.DataFrame().from_dict(
-            pep_dict, orient='index', columns = [
-                'protein_idxes','miss_cleavage',
-                'is_prot_nterm','is_prot_cterm'
-            ]
+        (
+            self._precursor_df, 
+            self.peptide_protein_offsets, 
+            self.peptide_protein_idxes
+        ) = cleave_proteins(
+            protein_df[protein_seq_column].values,
+            self._digest,
+            shard_size=self.digest_shard_size,
+            processes=self.digest_process_num,
+            return_protein_csr=True,
         )
-        self._precursor_df.reset_index(drop=False, inplace=True)
-        self._precursor_df.rename(
-            columns={'index':'sequence'}, inplace=True
+        self._precursor_df['peptide_idx'] = np.arange(
+            len(self._precursor_df), dtype=np.int64
         )
         self._precursor_df['mods'] = ''
         self._precursor_df['mod_sites'] = ''
         self.refine_df()
 
     def append_protein_name(self):
+        """Append 'protein_idxes', 'proteins' and 'genes' columns 
+        into `self.precursor_df` from the CSR-style mapping
+        (`self.peptide_protein_offsets` and `self.peptide_protein_idxes`), 
+        or from the existing 'protein_idxes' column.
+        """
         if (
-            'protein_id' not in self.protein_df or 
-            'protein_idxes' not in self._precursor_df
-        ): 
+            'peptide_idx' in self._precursor_df.columns and
+            self.peptide_protein_offsets is not None
+        ):
+            prot_offsets = self.peptide_protein_offsets
+            prot_idxes = self.peptide_protein_idxes
+            pep_idxes = self._precursor_df.peptide_idx.values
+            self._precursor_df['protein_idxes'] = protein_csr_to_strings(
+                prot_offsets, prot_idxes
+            )[pep_idxes]
+        elif 'protein_idxes' in self._precursor_df.columns:
+            prot_offsets, prot_idxes = protein_idxes_to_csr(
+                self._precursor_df.protein_idxes.values
+            )
+            pep_idxes = np.arange(len(self._precursor_df))
+        else:
             return
 
-        self._precursor_df['proteins'] = self._precursor_df['protein_idxes'].apply(
-            protein_idxes_to_names,
-            protein_names=self.protein_df['protein_id'].values
-        )
+        if 'protein_id' not in self.protein_df: 
+            return
+
+        self._precursor_df['proteins'] = protein_csr_to_strings(
+            prot_offsets, prot_idxes, 
+            self.protein_df['protein_id'].values
+        )[pep_idxes]
 
         if 'gene_name' in self.protein_df.columns:
-            self._precursor_df['genes'] = self._precursor_df['protein_idxes'].apply(
-                protein_idxes_to_names,
-                protein_names=self.protein_df['gene_name'].values
-            )
+            self._precursor_df['genes'] = protein_csr_to_strings(
+                prot_offsets, prot_idxes, 
+                self.protein_df['gene_name'].values
+            )[pep_idxes]
 
     def get_peptides_from_peptide_sequence_list(self, 
         pep_seq_list:list,
         protein_list:list = None
     ):
+        """Load peptide sequences. If `protein_list` is None and 
+        `self.protein_df` is not empty, peptides are mapped to 
+        `self.protein_df` by :meth:`map_peptides_to_protein_df`.
+
+        Parameters
+        ----------
+        pep_seq_list : list
+            Peptide sequence list
+
+        protein_list : list, optional
+            Protein id list which maps to pep_seq_list one-by-one, 
+            by default None
+        """
         self._precursor_df = pd.DataFrame()
         self._precursor_df['sequence'] = pep_seq_list
         if protein_list is not None:
             self._precursor_df['protein_name'] = protein_list
         self._precursor_df['is_prot_nterm'] = False
         self._precursor_df['is_prot_cterm'] = False
+        if protein_list is None and 'sequence' in self.protein_df.columns:
+            self.map_peptides_to_protein_df()
         self.refine_df()
 
+    def map_peptides_to_protein_df(self):
+        """Map sequences in `self.precursor_df` to `self.protein_df`
+        with the Aho-Corasick automaton, 
+        see :func:`alphabase.protein.inference.annotate_protein_mapping`.
+        It requires `pyahocorasick`.
+        """
+        from alphabase.protein.inference import annotate_protein_mapping
+        annotate_protein_mapping(
+            self._precursor_df, self.protein_df, I_to_L=self.I_to_L
+        )
+
     def add_mods_for_one_seq(self, sequence:str, 
         is_prot_nterm, is_prot_cterm
     )->tuple:
@@ -1142,7 +2825,9 @@ class SpecLibFasta(SpecLibBase):
         )
 
     def add_modifications(self):
-        """Add fixed and variable modifications to all peptide sequences in `self.precursor_df`
+        """Add fixed and variable modifications to all peptide sequences in `self.precursor_df`.
+        All peptides are enumerated at once into integer-coded mods by
+        :func:`enumerate_peptidoform_mods`, and then rendered into strings.
         """
         if 'is_prot_nterm' not in self._precursor_df.columns:
             self._precursor_df['is_prot_nterm'] = False
@@ -1153,20 +2838,43 @@ class SpecLibFasta(SpecLibBase):
             self._precursor_df['mods'] = ""
             self._precursor_df['mod_sites'] = ""
             return
-            
-        (
-            self._precursor_df['mods'],
-            self._precursor_df['mod_sites']
-        ) = zip(*self._precursor_df[
-            ['sequence','is_prot_nterm','is_prot_cterm']
-        ].apply(lambda x:
-            self.add_mods_for_one_seq(*x), axis=1
-        ))
-        self._precursor_df = explode_multiple_columns(
-            self._precursor_df,
-            ['mods','mod_sites']
-        )
-        self._precursor_df.reset_index(drop=True, inplace=True)
+
+        try:
+            (
+                row_pep_idxes, mod_offsets, mod_ids, mod_sites, mod_names
+            ) = enumerate_peptidoform_mods(
+                self._precursor_df.sequence.values,
+                self._precursor_df.is_prot_nterm.values,
+                self.fix_mod_dict, self.var_mod_dict,
+                self.var_mod_prot_nterm_dict, self.var_mod_pep_nterm_dict,
+                self.min_var_mod_num, self.max_var_mod_num,
+                self.max_peptidoform_num-1, # 1 for unmodified
+            )
+            mods, mod_sites = mod_arrays_to_strings(
+                mod_offsets, mod_ids, mod_sites, mod_names
+            )
+        except UnicodeEncodeError:
+            # non-ASCII sequences
+            (
+                self._precursor_df['mods'],
+                self._precursor_df['mod_sites']
+            ) = zip(*self._precursor_df[
+                ['sequence','is_prot_nterm','is_prot_cterm']
+            ].apply(lambda x:
+                self.add_mods_for_one_seq(*x), axis=1
+            ))
+            self._precursor_df = explode_multiple_columns(
+                self._precursor_df,
+                ['mods','mod_sites']
+            )
+            self._precursor_df.reset_index(drop=True, inplace=True)
+            return
+
+        self._precursor_df = self._precursor_df.iloc[
+            row_pep_idxes
+        ].reset_index(drop=True)
+        self._precursor_df['mods'] = mods
+        self._precursor_df['mod_sites'] = mod_sites
 
     def add_special_modifications(self):
         """
@@ -1210,12 +2918,23 @@ class SpecLibFasta(SpecLibBase):
             labeling_channel_dict = self.labeling_channels
         if labeling_channel_dict is None or len(labeling_channel_dict) == 0:
             return
-        df_list = []
-        for channel, labels in labeling_channel_dict.items():
-            df = create_labeling_peptide_df(self._precursor_df, labels)
-            df['labeling_channel'] = channel
-            df_list.append(df)
-        self._precursor_df = pd.concat(df_list, ignore_index=True)
+        mods_list = []
+        mod_sites_list = []
+        for labels in labeling_channel_dict.values():
+            df = create_labeling_peptide_df(
+                self._precursor_df[['sequence','mods','mod_sites']], labels
+            )
+            mods_list.append(df.mods.values)
+            mod_sites_list.append(df.mod_sites.values)
+        n_peps = len(self._precursor_df)
+        self._precursor_df = self._precursor_df.iloc[np.tile(
+            np.arange(n_peps), len(labeling_channel_dict)
+        )].reset_index(drop=True)
+        self._precursor_df['mods'] = np.concatenate(mods_list)
+        self._precursor_df['mod_sites'] = np.concatenate(mod_sites_list)
+        self._precursor_df['labeling_channel'] = np.repeat(
+            np.array(list(labeling_channel_dict), dtype=object), n_peps
+        )
         try:
             self._precursor_df[
                 'labeling_channel'
@@ -1228,22 +2947,27 @@ class SpecLibFasta(SpecLibBase):
 
 
     def add_charge(self):
-        """Add charge states
+        """Add charge states, each row of `self.precursor_df` is repeated
+        for charges from `self.min_precursor_charge` 
+        to `self.max_precursor_charge`.
         """
-        self._precursor_df['charge'] = [
-            np.arange(
-                self.min_precursor_charge, 
-                self.max_precursor_charge+1
-            )
-        ]*len(self._precursor_df)
-        self._precursor_df = self._precursor_df.explode('charge')
-        self._precursor_df['charge'] = self._precursor_df.charge.astype(np.int8)
-        self._precursor_df.reset_index(drop=True, inplace=True)
+        charges = np.arange(
+            self.min_precursor_charge, 
+            self.max_precursor_charge+1,
+            dtype=np.int8
+        )
+        n_peps = len(self._precursor_df)
+        self._precursor_df = self._precursor_df.iloc[
+            np.repeat(np.arange(n_peps), len(charges))
+        ].reset_index(drop=True)
+        self._precursor_df['charge'] = np.tile(charges, n_peps)
 
     def save_hdf(self, hdf_file:str):
         """Save the contents into hdf file (attribute -> hdf_file):
         - self.precursor_df -> library/precursor_df
         - self.protein_df -> library/protein_df
+        - self.peptide_protein_offsets -> library/peptide_protein_map/offsets
+        - self.peptide_protein_idxes -> library/peptide_protein_map/protein_idxes
         - self.fragment_mz_df -> library/fragment_mz_df
         - self.fragment_intensity_df -> library/fragment_intensity_df
 
@@ -1260,12 +2984,116 @@ class SpecLibFasta(SpecLibBase):
             delete_existing=False
         )
         _hdf.library.protein_df = self.protein_df
+        if self.peptide_protein_offsets is not None:
+            _hdf.library.peptide_protein_map = {
+                'offsets': self.peptide_protein_offsets,
+                'protein_idxes': self.peptide_protein_idxes,
+            }
+
+    def process_and_save_hdf_by_chunks(self, 
+        hdf_file:str, 
+        peptide_chunk_size:int=100000,
+    ):
+        """
+        Streaming version of :meth:`_process_after_load_pep_seqs`,
+        :meth:`calc_precursor_mz`, :meth:`calc_fragment_mz_df` and
+        :meth:`save_hdf` for large libraries. 
+        Decoy sequences are appended to all loaded peptides first, 
+        then peptides are processed chunk by chunk 
+        (modifications, special modifications, labeling, charges, 
+        precursor mz, fragment mz and hash values), and each chunk is 
+        appended into `hdf_file` with shifted 'frag_start_idx' and 
+        'frag_stop_idx', so the peak memory is bounded 
+        by `peptide_chunk_size`.
+
+        The library is only stored in `hdf_file` after this method,
+        `self.precursor_df` and `self.fragment_mz_df` are emptied,
+        use :meth:`load_hdf` to load the library.
+        Precursors are sorted by 'nAA' within each chunk 
+        instead of the whole library.
+
+        Parameters
+        ----------
+        hdf_file : str
+            The hdf file path to save, existing file will be deleted.
+
+        peptide_chunk_size : int, optional
+            Number of peptide sequences (before adding modifications 
+            and charges) in each chunk, by default 100000
+        """
+        self.append_decoy_sequence()
+        peptide_df = self._precursor_df
+        key_columns = self.key_numeric_columns+[
+            'mod_seq_hash', 'mod_seq_charge_hash'
+        ]
+        _hdf = None
+        frag_offset = 0
+        for start in range(0, len(peptide_df), peptide_chunk_size):
+            self._precursor_df = peptide_df.iloc[
+                start:start+peptide_chunk_size
+            ].reset_index(drop=True)
+            self.add_modifications()
+            self.add_special_modifications()
+            self.add_peptide_labeling()
+            self.add_charge()
+            self.calc_precursor_mz()
+            if len(self._precursor_df) == 0: continue
+            self.calc_fragment_mz_df()
+            self.hash_precursor_df()
+            fragment_mz_df = self.fragment_mz_df
+
+            if 'frag_start_idx' in self._precursor_df.columns:
+                self._precursor_df['frag_start_idx'] += frag_offset
+                self._precursor_df['frag_stop_idx'] += frag_offset
+                frag_offset += len(fragment_mz_df)
+
+            mod_seq_df = self._precursor_df[[
+                col for col in self._precursor_df.columns 
+                if col not in self.key_numeric_columns
+            ]]
+            precursor_df = self._precursor_df[[
+                col for col in self._precursor_df.columns 
+                if col in key_columns
+            ]]
+            if _hdf is None:
+                _hdf = HDF_File(
+                    hdf_file, 
+                    read_only=False, 
+                    truncate=True,
+                    delete_existing=True
+                )
+                _hdf.library = {
+                    'mod_seq_df': mod_seq_df,
+                    'precursor_df': precursor_df,
+                    'fragment_mz_df': fragment_mz_df,
+                    'fragment_intensity_df': pd.DataFrame(),
+                }
+            else:
+                _hdf.library.mod_seq_df.append(mod_seq_df)
+                _hdf.library.precursor_df.append(precursor_df)
+                if len(fragment_mz_df) > 0:
+                    _hdf.library.fragment_mz_df.append(fragment_mz_df)
+
+        self._precursor_df = pd.DataFrame()
+        self._fragment_mz_df = pd.DataFrame()
+        if _hdf is None:
+            # all precursors are clipped by precursor mz
+            self.save_hdf(hdf_file)
+            return
+        _hdf.library.protein_df = self.protein_df
+        if self.peptide_protein_offsets is not None:
+            _hdf.library.peptide_protein_map = {
+                'offsets': self.peptide_protein_offsets,
+                'protein_idxes': self.peptide_protein_idxes,
+            }
 
     def load_hdf(self, hdf_file:str, load_mod_seq:bool=False):
         """Load contents from hdf file:
         - self.precursor_df <- library/precursor_df
         - self.precursor_df <- library/mod_seq_df if load_mod_seq is True
         - self.protein_df <- library/protein_df
+        - self.peptide_protein_offsets <- library/peptide_protein_map/offsets
+        - self.peptide_protein_idxes <- library/peptide_protein_map/protein_idxes
         - self.fragment_mz_df <- library/fragment_mz_df
         - self.fragment_intensity_df <- library/fragment_intensity_df
 
@@ -1288,3 +3116,16 @@ class SpecLibFasta(SpecLibBase):
             self.protein_df = _hdf.library.protein_df.values
         except (AttributeError, KeyError, ValueError, TypeError):
             print(f"No protein_df in {hdf_file}")
+        try:
+            _hdf = HDF_File(
+                hdf_file,
+            )
+            self.peptide_protein_offsets = (
+                _hdf.library.peptide_protein_map.offsets.values
+            )
+            self.peptide_protein_idxes = (
+                _hdf.library.peptide_protein_map.protein_idxes.values
+            )
+        except (AttributeError, KeyError, ValueError, TypeError):
+            self.peptide_protein_offsets = None
+            self.peptide_protein_idxes = None
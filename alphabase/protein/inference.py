@@ -1,15 +1,199 @@
 import ahocorasick
+import numpy as np
+import pandas as pd
+from typing import Union
 
-def build_AC(peptides:list):
+from alphabase.protein.fasta import (
+    protein_csr_to_strings, protein_idxes_to_csr
+)
+
+def build_AC(peptides:Union[list,np.ndarray])->ahocorasick.Automaton:
+    """Build the Aho-Corasick automaton of peptides.
+
+    Parameters
+    ----------
+    peptides : list | np.ndarray
+        Peptide sequences
+
+    Returns
+    -------
+    ahocorasick.Automaton
+        The value of each word is a tuple of
+        (the first index of the peptide in `peptides`, peptide length).
+    """
     AC = ahocorasick.Automaton()
 
-    for seq in peptides:
-        AC.add_word(seq, seq)
+    for i,seq in enumerate(peptides):
+        if seq not in AC:
+            AC.add_word(seq, (i, len(seq)))
     AC.make_automaton()
+    return AC
+
+def match_AC(AC:ahocorasick.Automaton, protein_seq:str)->list:
+    """Find all peptides of `AC` in `protein_seq`.
+
+    Parameters
+    ----------
+    AC : ahocorasick.Automaton
+        Automaton built by :func:`build_AC`
+
+    protein_seq : str
+        Protein sequence
 
-def match_AC(AC:ahocorasick.Automaton, protein_seq):
+    Returns
+    -------
+    list
+        list of (start index, last index, peptide index)
+    """
     start_last_list = []
-    for last_index, seq in AC.iter(protein_seq):
-        start_index = last_index - len(seq) + 1
-        start_last_list.append((start_index, last_index))
-    return start_last_list
\ No newline at end of file
+    for last_index, (pep_idx, pep_len) in AC.iter(protein_seq):
+        start_index = last_index - pep_len + 1
+        start_last_list.append((start_index, last_index, pep_idx))
+    return start_last_list
+
+def map_peptides_to_proteins(
+    peptides:Union[list,np.ndarray],
+    protein_seqs:Union[list,np.ndarray],
+    I_to_L:bool=True,
+)->pd.DataFrame:
+    """
+    Map peptides to proteins by scanning the concatenated proteome
+    once with the Aho-Corasick automaton of peptides.
+
+    Parameters
+    ----------
+    peptides : list | np.ndarray
+        Peptide sequences, could contain duplicates
+
+    protein_seqs : list | np.ndarray
+        Protein sequences, the protein index of
+        a peptide is the position in this list
+
+    I_to_L : bool, optional
+        If treat 'I' and 'L' as the same amino acid, by default True
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame aligned with `peptides`, with columns:
+        'protein_idxes' (';'-joined protein indices in ascending order,
+        '' if not found), 'start_positions' (';'-joined first start
+        position of the peptide in each protein of 'protein_idxes'),
+        'is_prot_nterm' (True if any occurrence starts at protein N-term,
+        or at the second position of proteins starting with 'M'),
+        and 'is_prot_cterm'.
+    """
+    peptides = pd.Series(peptides, dtype=object)
+    protein_seqs = pd.Series(protein_seqs, dtype=object)
+    if I_to_L:
+        peptides = peptides.str.replace('I','L')
+        protein_seqs = protein_seqs.str.replace('I','L')
+    pep_codes, uniq_peps = pd.factorize(peptides)
+
+    prot_lens = protein_seqs.str.len().values.astype(np.int64)
+    prot_starts = np.ones(len(prot_lens), dtype=np.int64)
+    prot_starts[1:] += np.cumsum(prot_lens[:-1]+1)
+    cat_prot = '$'.join(['', *protein_seqs, ''])
+
+    if len(uniq_peps) > 0:
+        AC = build_AC(uniq_peps)
+        matches = np.array(match_AC(AC, cat_prot), dtype=np.int64)
+    else:
+        matches = np.array([])
+    if len(matches) == 0:
+        matches = np.zeros((0,3), dtype=np.int64)
+    starts, lasts, match_peps = matches.T
+    match_prots = np.searchsorted(prot_starts, starts, side='right')-1
+    starts = starts - prot_starts[match_prots]
+    is_nterms = (starts == 0) | (
+        (starts == 1) &
+        (protein_seqs.str[0].values[match_prots] == 'M')
+    )
+    is_cterms = lasts+1 == prot_starts[match_prots]+prot_lens[match_prots]
+
+    n_uniq = len(uniq_peps)
+    is_nterm_uniq = np.bincount(
+        match_peps[is_nterms], minlength=n_uniq
+    ) > 0
+    is_cterm_uniq = np.bincount(
+        match_peps[is_cterms], minlength=n_uniq
+    ) > 0
+
+    order = np.lexsort((starts, match_prots, match_peps))
+    match_peps = match_peps[order]
+    match_prots = match_prots[order]
+    starts = starts[order]
+    keep = np.ones(len(order), dtype=np.bool_)
+    keep[1:] = (
+        (match_peps[1:] != match_peps[:-1]) |
+        (match_prots[1:] != match_prots[:-1])
+    )
+    prot_strs = match_prots[keep].astype('U').astype(object)
+    start_strs = starts[keep].astype('U').astype(object)
+    offsets = np.zeros(n_uniq+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(
+        np.bincount(match_peps[keep], minlength=n_uniq)
+    )
+
+    counts = np.diff(offsets)
+    protein_idxes = np.full(n_uniq, '', dtype=object)
+    start_positions = np.full(n_uniq, '', dtype=object)
+    # most peptides are unique to one protein, only join the shared ones
+    single = counts == 1
+    protein_idxes[single] = prot_strs[offsets[:-1][single]]
+    start_positions[single] = start_strs[offsets[:-1][single]]
+    for i in np.flatnonzero(counts > 1):
+        protein_idxes[i] = ';'.join(prot_strs[offsets[i]:offsets[i+1]])
+        start_positions[i] = ';'.join(start_strs[offsets[i]:offsets[i+1]])
+
+    return pd.DataFrame({
+        'protein_idxes': protein_idxes[pep_codes],
+        'start_positions': start_positions[pep_codes],
+        'is_prot_nterm': is_nterm_uniq[pep_codes],
+        'is_prot_cterm': is_cterm_uniq[pep_codes],
+    })
+
+def annotate_protein_mapping(
+    psm_df:pd.DataFrame,
+    protein_df:pd.DataFrame,
+    I_to_L:bool=True,
+)->pd.DataFrame:
+    """
+    Add 'protein_idxes', 'start_positions', 'is_prot_nterm' and 
+    'is_prot_cterm' columns into `psm_df` inplace 
+    with :func:`map_peptides_to_proteins`.
+    If `protein_df` contains 'protein_id' and 'gene_name' columns,
+    'proteins' and 'genes' columns are also added.
+
+    Parameters
+    ----------
+    psm_df : pd.DataFrame
+        PSM or precursor DataFrame with the 'sequence' column,
+        e.g. `psm_reader.psm_df` or `SpecLibFasta.precursor_df`
+
+    protein_df : pd.DataFrame
+        Protein DataFrame with the 'sequence' column, 
+        see :func:`alphabase.protein.fasta.load_protein_df`
+
+    I_to_L : bool, optional
+        If treat 'I' and 'L' as the same amino acid, by default True
+
+    Returns
+    -------
+    pd.DataFrame
+        `psm_df`
+    """
+    mapping_df = map_peptides_to_proteins(
+        psm_df.sequence.values, protein_df.sequence.values, I_to_L
+    )
+    for col in mapping_df.columns:
+        psm_df[col] = mapping_df[col].values
+    prot_offsets, prot_idxes = protein_idxes_to_csr(
+        mapping_df.protein_idxes.values
+    )
+    for name_col, prot_col in [('proteins','protein_id'),('genes','gene_name')]:
+        if prot_col not in protein_df.columns: continue
+        psm_df[name_col] = protein_csr_to_strings(
+            prot_offsets, prot_idxes, protein_df[prot_col].values
+        )
+    return psm_df
@@ -40,6 +40,178 @@ def get_substring_indices(cat_prot:str, min_len=7, max_len=25, stop_char='$'):
     lcp_array = get_lcp_array(cat_prot)
     return get_all_substring_indices_from_lcp(cat_prot, lcp_array, min_len, max_len, stop_char=stop_char)
 
+def get_suffix_and_lcp_arrays(cat_prot:np.ndarray)->tuple:
+    """Suffix array and LCP array of the uint8 concatenated proteins.
+
+    Parameters
+    ----------
+    cat_prot : np.ndarray
+        uint8 concatenated protein sequences
+
+    Returns
+    -------
+    tuple
+        np.ndarray: suffix array
+
+        np.ndarray: LCP array in suffix array order, 
+        `lcp_array[k]` is the LCP of suffixes `suffix_array[k]` 
+        and `suffix_array[k+1]`
+    """
+    data = np.array(cat_prot, dtype=np.uint8).view(np.int8)
+    suffix_array = divsufsort(data)
+    lcp_array = kasai(data, suffix_array)
+    return suffix_array, lcp_array
+
+@numba.njit(nogil=True)
+def get_unique_peptides_from_lcp(
+    cat_prot:np.ndarray, 
+    suffix_array:np.ndarray, 
+    lcp_array:np.ndarray,
+    prot_starts:np.ndarray,
+    prot_lens:np.ndarray,
+    cut_mask:np.ndarray,
+    semi_specific:bool,
+    n_missed_cleavages:int,
+    min_len:int, max_len:int,
+)->tuple:
+    """
+    Enumerate unique (non-specific or semi-specific) peptides 
+    of concatenated proteins with the suffix array and the LCP array.
+    Each unique peptide is visited only once at its last suffix 
+    in the suffix array, and all its occurrences are 
+    the adjacent suffixes sharing an LCP not shorter than the peptide.
+
+    Parameters
+    ----------
+    cat_prot : np.ndarray
+        uint8 concatenated protein sequences
+
+    suffix_array : np.ndarray
+        see :func:`get_suffix_and_lcp_arrays`
+
+    lcp_array : np.ndarray
+        see :func:`get_suffix_and_lcp_arrays`
+
+    prot_starts : np.ndarray
+        start positions of proteins in `cat_prot`
+
+    prot_lens : np.ndarray
+        lengths of proteins
+
+    cut_mask : np.ndarray
+        uint8 cleavage site mask, cleave after `cat_prot[i]` if `cut_mask[i]`.
+        Only used if `semi_specific`.
+
+    semi_specific : bool
+        If True, an occurrence is only valid if at least one terminus 
+        is specific (or at the protein terminus) and internal cleavage 
+        sites are not more than `n_missed_cleavages`.
+        Otherwise all substrings are valid (non-specific).
+
+    n_missed_cleavages : int
+        Max missed cleavages for semi-specific digestion
+
+    min_len : int
+        min peptide length
+
+    max_len : int
+        max peptide length
+
+    Returns
+    -------
+    tuple
+        np.ndarray (int64): peptide start positions in `cat_prot`
+
+        np.ndarray (int64): peptide stop positions in `cat_prot`
+
+        np.ndarray (int64): min missed cleavages of valid occurrences
+
+        np.ndarray (bool): if any valid occurrence is at protein N-term
+
+        np.ndarray (bool): if any valid occurrence is at protein C-term
+
+        np.ndarray (int64): protein offsets with length of `peptide_num+1`
+
+        np.ndarray (int32): unique and sorted protein indices 
+        of each peptide, i.e. `prot_idxes[prot_offsets[i]:prot_offsets[i+1]]`
+    """
+    pos_prot_idxes = np.full(len(cat_prot), -1, dtype=np.int32)
+    for i in range(len(prot_starts)):
+        pos_prot_idxes[prot_starts[i]:prot_starts[i]+prot_lens[i]] = i
+    miss_cumsum = np.zeros(len(cat_prot)+1, dtype=np.int64)
+    if semi_specific:
+        miss_cumsum[1:] = np.cumsum(cut_mask.astype(np.int64))
+
+    pep_starts = []
+    pep_stops = []
+    misses = []
+    nterms = []
+    cterms = []
+    prot_offsets = [0]
+    prot_idxes = []
+    occ_prots = np.empty(len(cat_prot), dtype=np.int32)
+    for k in range(len(suffix_array)):
+        i = suffix_array[k]
+        if pos_prot_idxes[i] < 0: continue
+        prot_stop = (
+            prot_starts[pos_prot_idxes[i]]+prot_lens[pos_prot_idxes[i]]
+        )
+        for seq_len in range(max(lcp_array[k]+1, min_len), max_len+1):
+            if i+seq_len > prot_stop: break
+            n_occ = 0
+            miss = n_missed_cleavages+1
+            nterm = False
+            cterm = False
+            kk = k
+            while True:
+                j = suffix_array[kk]
+                prot_idx = pos_prot_idxes[j]
+                prot_start = prot_starts[prot_idx]
+                prot_end = prot_start+prot_lens[prot_idx]
+                is_nterm = j == prot_start or (
+                    j == prot_start+1 and cat_prot[prot_start] == 77 # 'M'
+                )
+                is_cterm = j+seq_len == prot_end
+                if semi_specific:
+                    occ_miss = miss_cumsum[j+seq_len-1]-miss_cumsum[j]
+                    valid = occ_miss <= n_missed_cleavages and (
+                        is_nterm or is_cterm or 
+                        cut_mask[j-1] > 0 or cut_mask[j+seq_len-1] > 0
+                    )
+                else:
+                    occ_miss = 0
+                    valid = True
+                if valid:
+                    occ_prots[n_occ] = prot_idx
+                    n_occ += 1
+                    miss = min(miss, occ_miss)
+                    nterm |= is_nterm
+                    cterm |= is_cterm
+                if kk == 0 or lcp_array[kk-1] < seq_len: break
+                kk -= 1
+            if n_occ == 0: continue
+            pep_starts.append(i)
+            pep_stops.append(i+seq_len)
+            misses.append(miss)
+            nterms.append(nterm)
+            cterms.append(cterm)
+            if n_occ > 1:
+                occ_prots[:n_occ].sort()
+            prot_idxes.append(occ_prots[0])
+            for kk in range(1, n_occ):
+                if occ_prots[kk] != occ_prots[kk-1]:
+                    prot_idxes.append(occ_prots[kk])
+            prot_offsets.append(len(prot_idxes))
+    return (
+        np.array(pep_starts, dtype=np.int64),
+        np.array(pep_stops, dtype=np.int64),
+        np.array(misses, dtype=np.int64),
+        np.array(nterms, dtype=np.bool_),
+        np.array(cterms, dtype=np.bool_),
+        np.array(prot_offsets, dtype=np.int64),
+        np.array(prot_idxes, dtype=np.int32),
+    )
+
 #compile
 get_substring_indices("$ABCABCD$ABCDE$ABCE$BCDEF$", 2, 100)
 
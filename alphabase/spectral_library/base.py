@@ -2,11 +2,16 @@ import pandas as pd
 import numpy as np
 import typing
 import logging
+import os
 
 import alphabase.peptide.fragment as fragment
 import alphabase.peptide.precursor as precursor
 from alphabase.io.hdf import HDF_File
 
+def _get_hdf_dataframe_len(hdf_df)->int:
+    """Number of rows of the HDF dataframe, 0 if it has no columns"""
+    return len(hdf_df) if len(hdf_df.columns) > 0 else 0
+
 class SpecLibBase(object):
     """
     Base spectral library in alphabase and alphapeptdeep.
@@ -24,6 +29,25 @@ class SpecLibBase(object):
 
     decoy : str
         same as `decoy` in Parameters in :meth:`__init__`.
+
+    fragment_mz_mode : str
+        How :meth:`calc_fragment_mz_df` stores fragment mz values:
+
+        - 'float64' (default): dense float64 :attr:`fragment_mz_df`.
+        - 'float32': dense float32 :attr:`fragment_mz_df` with half 
+          of the RAM, the relative rounding error is at most 2**-24 
+          (<0.06 ppm, i.e. <1e-4 Da for 2000 m/z).
+        - 'lazy': fragment mz values are not stored, only 
+          'frag_start_idx' and 'frag_stop_idx' are assigned in 
+          :attr:`precursor_df`. Fragment mz values are recalculated 
+          from :attr:`precursor_df` by :meth:`get_fragment_mz_df` 
+          (or :attr:`fragment_mz_df` for all precursors).
+
+    fragment_mz_n_threads : int
+        Number of threads to calculate fragment mz values 
+        in :meth:`calc_fragment_mz_df` and :meth:`get_fragment_mz_df`, 
+        see :func:`alphabase.peptide.fragment.fill_fragment_mz_values`. 
+        Defaults to 1.
     """
 
     key_numeric_columns:list = [
@@ -79,11 +103,14 @@ class SpecLibBase(object):
         self.charged_frag_types = charged_frag_types
         self._precursor_df = pd.DataFrame()
         self._fragment_intensity_df = pd.DataFrame()
+        self._fragment_intensity_sparse_df = pd.DataFrame()
         self._fragment_mz_df = pd.DataFrame()
         self.min_precursor_mz = precursor_mz_min
         self.max_precursor_mz = precursor_mz_max
 
         self.decoy = decoy
+        self.fragment_mz_mode = 'float64'
+        self.fragment_mz_n_threads = 1
     
     @property
     def precursor_df(self)->pd.DataFrame:
@@ -120,18 +147,140 @@ class SpecLibBase(object):
     def fragment_mz_df(self)->pd.DataFrame:
         """
         The fragment mz dataframe with 
-        fragment types as columns (['b_z1', 'y_z2', ...])
+        fragment types as columns (['b_z1', 'y_z2', ...]).
+        For :attr:`fragment_mz_mode`=='lazy', the values are 
+        recalculated for all precursors in each call.
         """
+        if self._is_fragment_mz_lazy():
+            return self.get_fragment_mz_df()
         return self._fragment_mz_df
 
     @property
     def fragment_intensity_df(self)->pd.DataFrame:
         """
         The fragment intensity dataframe with 
-        fragment types as columns (['b_z1', 'y_z2', ...])
+        fragment types as columns (['b_z1', 'y_z2', ...]).
+        If the intensities are stored in :attr:`fragment_intensity_sparse_df`,
+        the dense dataframe is created in each call.
         """
+        if self._is_fragment_intensity_sparse():
+            return self.get_fragment_intensity_df()
         return self._fragment_intensity_df
 
+    @property
+    def fragment_intensity_sparse_df(self)->pd.DataFrame:
+        """
+        The sparse fragment intensity dataframe with columns 
+        'frag_idx', 'frag_type' and 'intensity' created by 
+        :meth:`sparsify_fragment_intensity_df`, see 
+        :func:`alphabase.peptide.fragment.sparsify_fragment_intensity_df`.
+        """
+        return self._fragment_intensity_sparse_df
+
+    def _is_fragment_intensity_sparse(self)->bool:
+        return (
+            len(self._fragment_intensity_df) == 0 and
+            len(self._fragment_intensity_sparse_df) > 0
+        )
+
+    def _get_fragment_num(self)->int:
+        """Number of fragment rows referred by :attr:`precursor_df`"""
+        frag_num = len(self._fragment_mz_df)
+        if (
+            len(self._precursor_df) > 0 and 
+            'frag_stop_idx' in self._precursor_df.columns
+        ):
+            frag_num = max(frag_num, self._precursor_df.frag_stop_idx.max())
+        if len(self._fragment_intensity_sparse_df) > 0:
+            frag_num = max(
+                frag_num, 
+                self._fragment_intensity_sparse_df.frag_idx.values[-1]+1
+            )
+        return int(frag_num)
+
+    def sparsify_fragment_intensity_df(self, 
+        min_intensity:float = 0., 
+        dtype:np.dtype = np.float32,
+    ):
+        """
+        Move :attr:`fragment_intensity_df` into the sparse 
+        :attr:`fragment_intensity_sparse_df` to save RAM, 
+        as most predicted intensities are zeros. 
+        The dense :attr:`fragment_intensity_df` is still available, 
+        but it is created from the sparse one in each call.
+
+        Parameters
+        ----------
+        min_intensity : float, optional
+            Intensities <= `min_intensity` are removed. 
+            Defaults to 0.0.
+
+        dtype : np.dtype, optional
+            np.float32 or np.float16. Defaults to np.float32.
+        """
+        if len(self._fragment_intensity_df) == 0: return
+        self._fragment_intensity_sparse_df = (
+            fragment.sparsify_fragment_intensity_df(
+                self._fragment_intensity_df, 
+                min_intensity=min_intensity, dtype=dtype,
+            )
+        )
+        self._fragment_intensity_df = pd.DataFrame()
+
+    def densify_fragment_intensity_df(self):
+        """
+        Move :attr:`fragment_intensity_sparse_df` back into 
+        the dense :attr:`fragment_intensity_df`.
+        """
+        if not self._is_fragment_intensity_sparse(): return
+        self._fragment_intensity_df = self.get_fragment_intensity_df(
+        ).reset_index(drop=True)
+        self._fragment_intensity_sparse_df = pd.DataFrame()
+
+    def get_fragment_intensity_df(self, 
+        precursor_start:int=0, 
+        precursor_stop:int=None,
+    )->pd.DataFrame:
+        """
+        Get fragment intensities of precursors in 
+        `precursor_df.iloc[precursor_start:precursor_stop]`,
+        similar to :meth:`get_fragment_mz_df`. 
+        For the sparse :attr:`fragment_intensity_sparse_df`, 
+        only these rows are converted into the dense format.
+
+        Parameters
+        ----------
+        precursor_start : int, optional
+            Start position of precursors, by default 0
+
+        precursor_stop : int, optional
+            Stop position of precursors, by default None (the last one)
+
+        Returns
+        -------
+        pd.DataFrame
+            Fragment intensity dataframe of rows from 
+            the min 'frag_start_idx' to the max 'frag_stop_idx' 
+            of these precursors, the index is the fragment index.
+        """
+        is_sparse = self._is_fragment_intensity_sparse()
+        if precursor_start == 0 and precursor_stop is None:
+            if not is_sparse:
+                return self._fragment_intensity_df
+            frag_start = 0
+            frag_stop = self._get_fragment_num()
+        else:
+            df = self._precursor_df.iloc[precursor_start:precursor_stop]
+            if len(df) == 0:
+                return pd.DataFrame(columns=self.charged_frag_types)
+            frag_start = df.frag_start_idx.min()
+            frag_stop = df.frag_stop_idx.max()
+            if not is_sparse:
+                return self._fragment_intensity_df.iloc[frag_start:frag_stop]
+        return fragment.densify_fragment_intensity_df(
+            self._fragment_intensity_sparse_df, frag_start, frag_stop
+        )
+
     def refine_df(self):
         """
         Sort nAA and reset_index for faster calculation (or prediction)
@@ -225,21 +374,101 @@ class SpecLibBase(object):
 
     def calc_fragment_mz_df(self):
         """
-        TODO: use multiprocessing here or in the
-        `create_fragment_mz_dataframe` function.
+        Calculate fragment mz values into :attr:`fragment_mz_df`,
+        see :attr:`fragment_mz_mode` for how the values are stored,
+        and :attr:`fragment_mz_n_threads` for the number of threads.
         """
+        if self.fragment_mz_mode not in ('float64', 'float32', 'lazy'):
+            raise ValueError(
+                f"Unknown fragment_mz_mode: {self.fragment_mz_mode}"
+            )
         if (
             self.charged_frag_types is not None 
             or len(self.charged_frag_types)
         ):
+            if self.fragment_mz_mode == 'lazy':
+                if 'frag_start_idx' not in self._precursor_df.columns:
+                    precursor.refine_precursor_df(self._precursor_df)
+                    # zero columns, only to assign frag_start/stop_idx
+                    fragment.init_fragment_by_precursor_dataframe(
+                        self._precursor_df, []
+                    )
+                self._fragment_mz_df = pd.DataFrame()
+                return
             (
                 self._fragment_mz_df
             ) = fragment.create_fragment_mz_dataframe(
                 self.precursor_df, self.charged_frag_types,
+                dtype=(
+                    np.float32 if self.fragment_mz_mode == 'float32' 
+                    else np.float64
+                ),
+                n_threads=self.fragment_mz_n_threads,
             )
         else:
             print('Skip fragment calculation as self.charged_frag_types is None or empty')
 
+    def _is_fragment_mz_lazy(self)->bool:
+        return (
+            self.fragment_mz_mode == 'lazy' and 
+            len(self._fragment_mz_df) == 0 and 
+            'frag_start_idx' in self._precursor_df.columns
+        )
+
+    def get_fragment_mz_df(self, 
+        precursor_start:int=0, 
+        precursor_stop:int=None,
+    )->pd.DataFrame:
+        """
+        Get fragment mz values of precursors in 
+        `precursor_df.iloc[precursor_start:precursor_stop]`.
+        For :attr:`fragment_mz_mode`=='lazy', the values are recalculated
+        only for these precursors, otherwise they are sliced 
+        from :attr:`fragment_mz_df`.
+
+        Parameters
+        ----------
+        precursor_start : int, optional
+            Start position of precursors, by default 0
+
+        precursor_stop : int, optional
+            Stop position of precursors, by default None (the last one)
+
+        Returns
+        -------
+        pd.DataFrame
+            Fragment mz dataframe of rows from the min 'frag_start_idx'
+            to the max 'frag_stop_idx' of these precursors, 
+            the index is the fragment index, so 
+            `df.loc[frag_start_idx:frag_stop_idx-1]` can be used.
+        """
+        df = self._precursor_df.iloc[precursor_start:precursor_stop]
+        if len(df) == 0:
+            return pd.DataFrame(columns=self.charged_frag_types)
+        frag_start = df.frag_start_idx.min()
+        frag_stop = df.frag_stop_idx.max()
+        if not self._is_fragment_mz_lazy():
+            return self._fragment_mz_df.iloc[frag_start:frag_stop]
+
+        frag_idxes = df[['frag_start_idx','frag_stop_idx']].values-frag_start
+        # calculate on a copy as it could be sorted by nAA
+        df = df.drop(columns=['frag_start_idx','frag_stop_idx'])
+        df['_row_idx'] = np.arange(len(df))
+        mz_df = fragment.create_fragment_mz_dataframe(
+            df, self.charged_frag_types,
+            n_threads=self.fragment_mz_n_threads,
+        )
+        fragment_mz_df = pd.DataFrame(
+            np.zeros((frag_stop-frag_start, len(mz_df.columns))),
+            columns=mz_df.columns,
+            index=pd.RangeIndex(frag_start, frag_stop),
+        )
+        fragment.update_sliced_fragment_dataframe(
+            fragment_mz_df, mz_df.values, 
+            frag_idxes[df._row_idx.values],
+        )
+        return fragment_mz_df
+
     def hash_precursor_df(self):
         """Insert hash codes for peptides and precursors"""
         precursor.hash_precursor_df(
@@ -274,7 +503,8 @@ class SpecLibBase(object):
     
     def remove_unused_fragments(self):
         """
-        Remove unused fragments from self._fragment_mz_df and self._fragment_intensity_df.
+        Remove unused fragments from self._fragment_mz_df and self._fragment_intensity_df
+        (or self._fragment_intensity_sparse_df).
         Fragment dataframes are updated inplace and overwritten.
         """
 
@@ -282,16 +512,24 @@ class SpecLibBase(object):
         if len(self._fragment_mz_df) > 0:
             
             # update both fragment mz and intensity df
-            if len(self.fragment_intensity_df > 0):
+            if len(self._fragment_intensity_df) > 0:
                 self._precursor_df,(self._fragment_mz_df, self._fragment_intensity_df) = fragment.remove_unused_fragments(
                     self._precursor_df,(self._fragment_mz_df, self._fragment_intensity_df)
                 )
+            elif len(self._fragment_intensity_sparse_df) > 0:
+                self._precursor_df,(self._fragment_mz_df, self._fragment_intensity_sparse_df) = fragment.remove_unused_fragments(
+                    self._precursor_df,(self._fragment_mz_df, self._fragment_intensity_sparse_df)
+                )
             # only update fragment mz df
             else:
                 (self._precursor_df, (self._fragment_mz_df,)) = fragment.remove_unused_fragments(
                     self._precursor_df, (self._fragment_mz_df,)
                 )
-
+        # fragment mz values are not stored for fragment_mz_mode=='lazy'
+        elif len(self._fragment_intensity_sparse_df) > 0:
+            self._precursor_df,(self._fragment_intensity_sparse_df,) = fragment.remove_unused_fragments(
+                self._precursor_df,(self._fragment_intensity_sparse_df,)
+            )
 
 
     def _get_hdf_to_save(self, 
@@ -382,14 +620,31 @@ class SpecLibBase(object):
             truncate=True,
             delete_existing=True
         )
+        _hdf.library = {
+            **self._get_precursor_dfs_to_save(),
+            'fragment_mz_df': self.fragment_mz_df,
+            'fragment_intensity_df': self._fragment_intensity_df,
+        }
+        if self._is_fragment_intensity_sparse():
+            frag_type_cat = self._fragment_intensity_sparse_df.frag_type.cat
+            _hdf.library.fragment_intensity_sparse_df = pd.DataFrame({
+                'frag_idx': self._fragment_intensity_sparse_df.frag_idx.values,
+                'frag_type': frag_type_cat.codes.values,
+                'intensity': self._fragment_intensity_sparse_df.intensity.values,
+            })
+            _hdf.library.fragment_intensity_sparse_df.frag_types = ';'.join(
+                frag_type_cat.categories
+            )
+
+    def _get_precursor_dfs_to_save(self)->typing.Dict[str, pd.DataFrame]:
+        """`mod_seq_df` and `precursor_df` to save into hdf"""
         if 'mod_seq_charge_hash' not in self._precursor_df.columns:
             self.hash_precursor_df()
 
         key_columns = self.key_numeric_columns+[
             'mod_seq_hash', 'mod_seq_charge_hash'
         ]
-
-        _hdf.library = {
+        return {
             'mod_seq_df': self._precursor_df[
                 [
                     col for col in self._precursor_df.columns 
@@ -402,9 +657,96 @@ class SpecLibBase(object):
                     if col in key_columns
                 ]
             ],
-            'fragment_mz_df': self._fragment_mz_df,
-            'fragment_intensity_df': self._fragment_intensity_df,
         }
+
+    def append_hdf(self, hdf_file:str):
+        """Append this library as a batch into the library in `hdf_file` 
+        saved by :meth:`save_hdf` (or create it if `hdf_file` does not exist), 
+        so libraries can be written batch by batch 
+        without holding the whole library in RAM.
+        'frag_start_idx' and 'frag_stop_idx' of the appended precursors 
+        are shifted by the number of existing fragment rows 
+        (as :func:`alphabase.peptide.fragment.concat_precursor_fragment_dataframes`). 
+        Dense and sparse intensities are converted into the format 
+        of the existing library. This library itself is not changed.
+
+        Parameters
+        ----------
+        hdf_file : str
+            The hdf library to append into
+
+        Raises
+        ------
+        ValueError
+            If columns of the appended dataframes mismatch the saved ones
+        """
+        if not os.path.isfile(hdf_file):
+            self.save_hdf(hdf_file)
+            return
+        with HDF_File(hdf_file, read_only=False, truncate=True) as _hdf:
+            library = _hdf.library
+            frag_offset = max(
+                _get_hdf_dataframe_len(library.fragment_mz_df),
+                _get_hdf_dataframe_len(library.fragment_intensity_df),
+            )
+            if _get_hdf_dataframe_len(library.precursor_df) > 0:
+                frag_offset = max(
+                    frag_offset, 
+                    int(library.precursor_df.frag_stop_idx.values.max())
+                )
+            df_dict = self._get_precursor_dfs_to_save()
+            df_dict['precursor_df'] = df_dict['precursor_df'].copy()
+            df_dict['precursor_df'][
+                ['frag_start_idx','frag_stop_idx']
+            ] += frag_offset
+            df_dict['fragment_mz_df'] = self.fragment_mz_df
+            if 'fragment_intensity_sparse_df' in library.dataframe_names:
+                df_dict['fragment_intensity_sparse_df'] = (
+                    self._get_sparse_df_to_append(
+                        library.fragment_intensity_sparse_df, frag_offset
+                    )
+                )
+            else:
+                df_dict['fragment_intensity_df'] = self.fragment_intensity_df
+            # check all dataframes before appending anything
+            for name, df in df_dict.items():
+                hdf_df = library.__getattribute__(name)
+                if set(hdf_df.columns) != set(df.columns):
+                    raise ValueError(
+                        f"Columns of '{name}' mismatch the saved ones: "
+                        f"{list(df.columns)} vs {hdf_df.columns}"
+                    )
+            for name, df in df_dict.items():
+                if len(df.columns) > 0:
+                    library.__getattribute__(name).append(df)
+
+    def _get_sparse_df_to_append(self, 
+        hdf_sparse_df, frag_offset:int
+    )->pd.DataFrame:
+        """Sparse intensities of this library with the fragment type codes
+        of `hdf_sparse_df` and frag_idx shifted by `frag_offset`"""
+        if self._is_fragment_intensity_sparse():
+            sparse_df = self._fragment_intensity_sparse_df
+        else:
+            sparse_df = fragment.sparsify_fragment_intensity_df(
+                self._fragment_intensity_df
+            )
+        saved_frag_types = hdf_sparse_df.frag_types.split(';')
+        codes = pd.Index(saved_frag_types).get_indexer(
+            sparse_df.frag_type.cat.categories
+        )
+        if (codes < 0).any():
+            raise ValueError(
+                "Fragment types of the intensities mismatch the saved ones: "
+                f"{list(sparse_df.frag_type.cat.categories)} vs {saved_frag_types}"
+            )
+        return pd.DataFrame({
+            'frag_idx': sparse_df.frag_idx.values + frag_offset,
+            'frag_type': codes[
+                sparse_df.frag_type.cat.codes.values
+            ].astype(np.int8),
+            'intensity': sparse_df.intensity.values,
+        })
         
     def load_hdf(self, hdf_file:str, load_mod_seq:bool=False):
         """Load the hdf library from hdf_file
@@ -419,36 +761,55 @@ class SpecLibBase(object):
             Defaults to False.
             
         """
-        _hdf = HDF_File(
+        with HDF_File(
             hdf_file,
-        )
-        self._precursor_df:pd.DataFrame = _hdf.library.precursor_df.values
-        if load_mod_seq:
-            key_columns = self.key_numeric_columns+[
-                'mod_seq_hash', 'mod_seq_charge_hash'
-            ]
-            mod_seq_df = _hdf.library.mod_seq_df.values
-            cols = [
-                col for col in mod_seq_df.columns 
-                if col not in key_columns
-            ]
-            self._precursor_df[cols] = mod_seq_df[cols]
+        ) as _hdf:
+            self._precursor_df:pd.DataFrame = _hdf.library.precursor_df.values
+            if load_mod_seq:
+                key_columns = self.key_numeric_columns+[
+                    'mod_seq_hash', 'mod_seq_charge_hash'
+                ]
+                cols = [
+                    col for col in _hdf.library.mod_seq_df.columns 
+                    if col not in key_columns
+                ]
+                mod_seq_df = _hdf.library.mod_seq_df.get(cols)
+                self._precursor_df[cols] = mod_seq_df
             
-        self._fragment_mz_df = _hdf.library.fragment_mz_df.values
-        self._fragment_intensity_df = _hdf.library.fragment_intensity_df.values
-
-        self._fragment_mz_df = self._fragment_mz_df[
-            [
+            self._fragment_mz_df = _hdf.library.fragment_mz_df.get([
                 frag for frag in self.charged_frag_types 
-                if frag in self._fragment_mz_df.columns
-            ]
-        ]
-        self._fragment_intensity_df = self._fragment_intensity_df[
-            [
+                if frag in _hdf.library.fragment_mz_df.columns
+            ])
+            self._fragment_intensity_df = _hdf.library.fragment_intensity_df.get([
                 frag for frag in self.charged_frag_types 
-                if frag in self._fragment_intensity_df.columns
-            ]
+                if frag in _hdf.library.fragment_intensity_df.columns
+            ])
+
+            if 'fragment_intensity_sparse_df' in _hdf.library.dataframe_names:
+                self._fragment_intensity_sparse_df = self._load_fragment_intensity_sparse_df(
+                    _hdf.library.fragment_intensity_sparse_df
+                )
+            else:
+                self._fragment_intensity_sparse_df = pd.DataFrame()
+
+    def _load_fragment_intensity_sparse_df(self, hdf_df)->pd.DataFrame:
+        """
+        Load the sparse fragment intensity dataframe from the HDF dataframe, 
+        only fragment types in :attr:`charged_frag_types` are kept.
+        """
+        df = hdf_df.values
+        saved_frag_types = hdf_df.frag_types.split(';')
+        df['frag_type'] = pd.Categorical.from_codes(
+            df.frag_type.values, categories=saved_frag_types
+        )
+        frag_types = [
+            frag for frag in self.charged_frag_types 
+            if frag in saved_frag_types
         ]
+        if frag_types != saved_frag_types:
+            df = df[df.frag_type.isin(frag_types)].reset_index(drop=True)
+            df['frag_type'] = df.frag_type.cat.set_categories(frag_types)
+        return df[['frag_idx','frag_type','intensity']]
         
 def annotate_fragments_from_speclib(
     speclib: SpecLibBase, 
@@ -511,5 +872,6 @@ def annotate_fragments_from_speclib(
 
     speclib._fragment_mz_df = fragment_speclib._fragment_mz_df.copy()
     speclib._fragment_intensity_df = fragment_speclib._fragment_intensity_df.copy()
+    speclib._fragment_intensity_sparse_df = fragment_speclib._fragment_intensity_sparse_df.copy()
 
     return speclib
\ No newline at end of file
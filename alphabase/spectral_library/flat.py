@@ -1,4 +1,7 @@
 import pandas as pd
+import numpy as np
+import typing
+from concurrent.futures import ThreadPoolExecutor
 
 from alphabase.spectral_library.base import (
     SpecLibBase
@@ -33,6 +36,8 @@ class SpecLibFlat:
     key_numeric_columns = SpecLibBase.key_numeric_columns
     """ Identical to :obj:`SpecLibBase.key_numeric_columns <alphabase.spectral_library.base.SpecLibBase.key_numeric_columns>`. """
 
+    _get_precursor_dfs_to_save = SpecLibBase._get_precursor_dfs_to_save
+
     def __init__(self,
         min_fragment_intensity:float = 0.001,
         keep_top_k_fragments:int = 1000,
@@ -93,7 +98,17 @@ class SpecLibFlat:
         """
         return self._fragment_df
 
-    def parse_base_library(self, library:SpecLibBase):
+    def hash_precursor_df(self):
+        """Insert hash codes for peptides and precursors"""
+        precursor.hash_precursor_df(
+            self._precursor_df
+        )
+
+    def parse_base_library(self, 
+        library:SpecLibBase,
+        precursor_batch_size:int = None,
+        n_threads:int = 1,
+    ):
         """ Flatten an library object of SpecLibBase or its inherited class. 
         This method will generate :attr:`precursor_df` and :attr:`fragment_df`
         The fragments in fragment_df can be located by 
@@ -103,17 +118,179 @@ class SpecLibFlat:
         ----------
         library : SpecLibBase
             A library object with attributes
-            `precursor_df`, `fragment_mz_df` and `fragment_intensity_df`.
+            `precursor_df`, `fragment_mz_df` and `fragment_intensity_df`
+            (or `fragment_intensity_sparse_df`).
+
+        precursor_batch_size : int, optional
+            If not None, flatten fragments of `precursor_batch_size` 
+            precursors at a time (see :meth:`iter_flattened_batches`),
+            by default None (all precursors at once).
+
+        n_threads : int, optional
+            Number of threads to flatten the batches, by default 1.
+        """
+        if (
+            precursor_batch_size is None or 
+            precursor_batch_size >= len(library.precursor_df)
+        ):
+            self._precursor_df, self._fragment_df = flatten_fragments(
+                library.precursor_df, 
+                library.fragment_mz_df, 
+                (
+                    library.fragment_intensity_sparse_df
+                    if library._is_fragment_intensity_sparse()
+                    else library.fragment_intensity_df
+                ),
+                min_fragment_intensity=self.min_fragment_intensity,
+                keep_top_k_fragments=self.keep_top_k_fragments,
+                custom_columns=self.custom_fragment_df_columns,
+            )
+            return
+        precursor_df_list = []
+        fragment_df_list = []
+        for precursor_df, fragment_df in self.iter_flattened_batches(
+            library, precursor_batch_size, n_threads
+        ):
+            precursor_df_list.append(precursor_df)
+            fragment_df_list.append(fragment_df)
+        self._precursor_df = pd.concat(precursor_df_list)
+        self._fragment_df = pd.concat(fragment_df_list, ignore_index=True)
+
+    def iter_flattened_batches(self, 
+        library:SpecLibBase,
+        precursor_batch_size:int = 100000,
+        n_threads:int = 1,
+    )->typing.Iterator[typing.Tuple[pd.DataFrame, pd.DataFrame]]:
+        """
+        Flatten fragments of `library` batch by batch of precursors 
+        in the order of `library.precursor_df`. Fragment mz values 
+        (for `fragment_mz_mode=='lazy'`) and sparse intensities are 
+        only converted for the precursors in the batch.
+
+        Parameters
+        ----------
+        library : SpecLibBase
+            See :meth:`parse_base_library`
+
+        precursor_batch_size : int, optional
+            Number of precursors in each batch, by default 100000
+
+        n_threads : int, optional
+            Number of batches to flatten in parallel, by default 1
+
+        Yields
+        ------
+        Tuple[pd.DataFrame, pd.DataFrame]
+            Flattened precursor_df and fragment_df of a batch, 
+            `frag_start_idx` and `frag_stop_idx` point to the 
+            concatenated fragment_df of all batches.
+            Note that fragments shared by precursors in different batches 
+            will be duplicated in each batch.
         """
-        self._precursor_df, self._fragment_df = flatten_fragments(
-            library.precursor_df, 
-            library.fragment_mz_df, 
-            library.fragment_intensity_df,
+        n_precursors = len(library.precursor_df)
+        batches = [
+            (start, min(start+precursor_batch_size, n_precursors))
+            for start in range(0, n_precursors, precursor_batch_size)
+        ]
+        frag_offset = 0
+        with ThreadPoolExecutor(n_threads) as executor:
+            for i in range(0, len(batches), n_threads):
+                for precursor_df, fragment_df in executor.map(
+                    lambda batch: self._flatten_precursor_batch(
+                        library, *batch
+                    ), batches[i:i+n_threads]
+                ):
+                    precursor_df[
+                        ['frag_start_idx','frag_stop_idx']
+                    ] += frag_offset
+                    frag_offset += len(fragment_df)
+                    yield precursor_df, fragment_df
+
+    def _flatten_precursor_batch(self, 
+        library:SpecLibBase, start:int, stop:int
+    )->typing.Tuple[pd.DataFrame, pd.DataFrame]:
+        """Flatten fragments of `library.precursor_df.iloc[start:stop]`"""
+        precursor_df = library.precursor_df.iloc[start:stop].copy()
+        frag_start = precursor_df.frag_start_idx.min()
+        frag_stop = precursor_df.frag_stop_idx.max()
+        precursor_df[['frag_start_idx','frag_stop_idx']] -= frag_start
+        if library._is_fragment_intensity_sparse():
+            sparse_df = library.fragment_intensity_sparse_df
+            i, j = np.searchsorted(
+                sparse_df.frag_idx.values, [frag_start, frag_stop]
+            )
+            fragment_intensity_df = sparse_df.iloc[i:j].copy()
+            fragment_intensity_df['frag_idx'] -= frag_start
+        else:
+            fragment_intensity_df = library.get_fragment_intensity_df(
+                start, stop
+            )
+        return flatten_fragments(
+            precursor_df,
+            library.get_fragment_mz_df(start, stop),
+            fragment_intensity_df,
             min_fragment_intensity=self.min_fragment_intensity,
             keep_top_k_fragments=self.keep_top_k_fragments,
             custom_columns=self.custom_fragment_df_columns,
         )
 
+    def parse_base_library_to_hdf(self,
+        library:SpecLibBase,
+        hdf_file:str,
+        precursor_batch_size:int = 100000,
+        n_threads:int = 1,
+    ):
+        """
+        Flatten `library` batch by batch (see :meth:`iter_flattened_batches`)
+        and append fragments of each batch into `flat_library/fragment_df`
+        of `hdf_file`, so the whole :attr:`fragment_df` is never in RAM. 
+        The file layout is the same as :meth:`save_hdf`. 
+        Afterwards, :attr:`precursor_df` is the flattened one, 
+        and :attr:`fragment_df` is empty, use :meth:`load_hdf` to load it.
+
+        Parameters
+        ----------
+        library : SpecLibBase
+            See :meth:`parse_base_library`
+
+        hdf_file : str
+            The hdf file path to save, existing file will be deleted.
+
+        precursor_batch_size : int, optional
+            Number of precursors in each batch, by default 100000
+
+        n_threads : int, optional
+            Number of batches to flatten in parallel, by default 1
+        """
+        _hdf = HDF_File(
+            hdf_file, 
+            read_only=False, 
+            truncate=True,
+            delete_existing=True
+        )
+        _hdf.flat_library = {}
+        precursor_df_list = []
+        fragment_df = pd.DataFrame()
+        for precursor_df, fragment_df in self.iter_flattened_batches(
+            library, precursor_batch_size, n_threads
+        ):
+            precursor_df_list.append(precursor_df)
+            if len(fragment_df) == 0: continue
+            if 'fragment_df' in _hdf.flat_library.dataframe_names:
+                _hdf.flat_library.fragment_df.append(fragment_df)
+            else:
+                _hdf.flat_library.fragment_df = fragment_df
+        if 'fragment_df' not in _hdf.flat_library.dataframe_names:
+            _hdf.flat_library.fragment_df = fragment_df.iloc[:0]
+
+        if len(precursor_df_list) > 0:
+            self._precursor_df = pd.concat(precursor_df_list)
+        else:
+            self._precursor_df = library.precursor_df.copy()
+        self._fragment_df = pd.DataFrame()
+        for key, df in self._get_precursor_dfs_to_save().items():
+            _hdf.flat_library.__setattr__(key, df)
+
     def save_hdf(self, hdf_file:str):
         """Save library dataframes into hdf_file.
         For `self.precursor_df`, this method will save it into two hdf groups:
@@ -143,26 +320,8 @@ class SpecLibFlat:
             truncate=True,
             delete_existing=True
         )
-        if 'mod_seq_charge_hash' not in self._precursor_df.columns:
-            self.hash_precursor_df()
-
-        key_columns = self.key_numeric_columns+[
-            'mod_seq_hash', 'mod_seq_charge_hash'
-        ]
-
         _hdf.flat_library = {
-            'mod_seq_df': self._precursor_df[
-                [
-                    col for col in self._precursor_df.columns 
-                    if col not in self.key_numeric_columns
-                ]
-            ],
-            'precursor_df': self._precursor_df[
-                [
-                    col for col in self._precursor_df.columns 
-                    if col in key_columns
-                ]
-            ],
+            **self._get_precursor_dfs_to_save(),
             'fragment_df': self._fragment_df,
         }
         
@@ -0,0 +1,369 @@
+import h5py
+import numpy as np
+import pandas as pd
+import typing
+
+from alphabase.peptide.fragment import densify_fragment_intensity_df
+from alphabase.io.hdf import decode_string_array, _is_categories_name
+
+def get_hdf_dataset_mmap(dataset:h5py.Dataset)->typing.Union[np.memmap, None]:
+    """Memory-map a contiguous and uncompressed HDF dataset.
+
+    Parameters
+    ----------
+    dataset : h5py.Dataset
+        The HDF dataset
+
+    Returns
+    -------
+    np.memmap | None
+        Read-only memory-mapped array of the dataset,
+        or None if the dataset is chunked, compressed, empty
+        or contains variable-length strings.
+    """
+    if (
+        dataset.size == 0 or
+        dataset.dtype.kind == 'O' or
+        h5py.check_string_dtype(dataset.dtype) is not None
+    ):
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None
+    return np.memmap(
+        dataset.file.filename, mode='r',
+        dtype=dataset.dtype, offset=offset,
+        shape=dataset.shape,
+    )
+
+class LazyHDFDataframe:
+    """
+    Read-only dataframe in an opened HDF file (saved by
+    :class:`alphabase.io.hdf.HDF_Dataframe`),
+    columns are only read when they are accessed.
+
+    A column is memory-mapped if it is contiguous and uncompressed,
+    or if it has the '{column}_mmap' copy created by
+    :meth:`alphabase.io.hdf.HDF_Dataset.create_mmap`.
+    Otherwise the slices are read from the chunked (compressed) dataset
+    through the chunk cache of the opened HDF file.
+    Encoded string columns (see :func:`alphabase.io.hdf.encode_string_array`)
+    are decoded after the rows are selected.
+    """
+    def __init__(self, group:h5py.Group):
+        """
+        Parameters
+        ----------
+        group : h5py.Group
+            The HDF group of the dataframe
+        """
+        self._group = group
+        self.columns = [
+            name for name in sorted(group)
+            if isinstance(group[name], h5py.Dataset)
+            and not name.endswith('_mmap')
+            and not _is_categories_name(name, group)
+        ]
+        self._arrays = {}
+        self._categories = {}
+
+    def __len__(self):
+        if len(self.columns) == 0: return 0
+        return len(self._group[self.columns[0]])
+
+    def __getitem__(self, column:str)->np.ndarray:
+        return self.get_column(column)
+
+    def _get_array(self, column:str):
+        if column not in self._arrays:
+            if column not in self.columns:
+                raise KeyError(column)
+            array = None
+            if f'{column}_mmap' in self._group:
+                array = get_hdf_dataset_mmap(self._group[f'{column}_mmap'])
+            if array is None:
+                array = get_hdf_dataset_mmap(self._group[column])
+            if array is None:
+                array = self._group[column]
+                if h5py.check_string_dtype(array.dtype) is not None:
+                    array = array.asstr('utf-8')
+            self._arrays[column] = array
+            if (
+                self._group[column].attrs.get('string_encoding', None) 
+                == 'categorical'
+            ):
+                self._categories[column] = self._group[
+                    f'{column}_categories'
+                ].asstr()[...]
+        return self._arrays[column]
+
+    def _decode(self, column:str, values:np.ndarray)->np.ndarray:
+        string_encoding = self._group[column].attrs.get(
+            'string_encoding', None
+        )
+        if string_encoding == 'categorical':
+            return decode_string_array(
+                values, string_encoding, self._categories[column]
+            )
+        elif string_encoding == 'bytes' and values.dtype.kind == 'S':
+            # memory-mapped bytes
+            return decode_string_array(values, string_encoding)
+        return values
+
+    def is_mmap(self, column:str)->bool:
+        """If the column is memory-mapped"""
+        return isinstance(self._get_array(column), np.memmap)
+
+    def get_column(self,
+        column:str,
+        rows:typing.Union[slice, np.ndarray] = slice(None),
+    )->np.ndarray:
+        """Get values of a column.
+
+        Parameters
+        ----------
+        column : str
+            Column name
+
+        rows : slice | np.ndarray, optional
+            Row slice, integer indices or boolean mask,
+            by default slice(None) (all rows)
+
+        Returns
+        -------
+        np.ndarray
+            Values of the selected rows
+        """
+        array = self._get_array(column)
+        if isinstance(array, np.memmap) or isinstance(rows, slice):
+            return self._decode(column, array[rows])
+        rows = np.asarray(rows)
+        if rows.dtype == np.bool_:
+            return self._decode(column, array[np.flatnonzero(rows)])
+        # h5py only accepts increasing indices
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        return self._decode(column, array[unique_rows][inverse])
+
+    def get(self,
+        rows:typing.Union[slice, np.ndarray] = slice(None),
+        columns:typing.List[str] = None,
+    )->pd.DataFrame:
+        """Get a dataframe of the selected rows and columns.
+
+        Parameters
+        ----------
+        rows : slice | np.ndarray, optional
+            See :meth:`get_column`, by default slice(None)
+
+        columns : typing.List[str], optional
+            Columns to read, by default None (all columns)
+
+        Returns
+        -------
+        pd.DataFrame
+            The dataframe
+        """
+        if columns is None:
+            columns = self.columns
+        return pd.DataFrame({
+            col: self.get_column(col, rows) for col in columns
+        })
+
+class LazySpecLib:
+    """
+    Lazily loaded spectral library from the hdf file saved by
+    :meth:`SpecLibBase.save_hdf <alphabase.spectral_library.base.SpecLibBase.save_hdf>`
+    or :meth:`SpecLibFlat.save_hdf <alphabase.spectral_library.flat.SpecLibFlat.save_hdf>`.
+    The HDF file is opened once in read-only mode, nothing is loaded
+    until precursor columns or fragment blocks are requested.
+    Fragment blocks are read by 'frag_start_idx' and 'frag_stop_idx'.
+
+    Dataframes in the library group (e.g. 'precursor_df', 'mod_seq_df',
+    'fragment_mz_df', 'fragment_df') are attributes of
+    :class:`LazyHDFDataframe`.
+
+    Examples::
+        >>> with LazySpecLib('lib.hdf') as lib:
+        >>>     df = lib.get_precursor_df(['precursor_mz','frag_start_idx','frag_stop_idx'])
+        >>>     start, stop = df[['frag_start_idx','frag_stop_idx']].values[0]
+        >>>     mz_df = lib.get_fragment_mz_df(start, stop)
+    """
+    def __init__(self,
+        hdf_file:str,
+        library_key:str = None,
+        charged_frag_types:typing.List[str] = None,
+        chunk_cache_size:int = 64*1024**2,
+    ):
+        """
+        Parameters
+        ----------
+        hdf_file : str
+            The hdf file
+
+        library_key : str, optional
+            The library group in the hdf file, 'library' or 'flat_library'.
+            By default None to use the first existing one.
+
+        charged_frag_types : typing.List[str], optional
+            Fragment types (and order) of fragment mz and intensity
+            dataframes, by default None to keep all types in the hdf file.
+
+        chunk_cache_size : int, optional
+            Chunk cache in bytes of each chunked dataset,
+            by default 64 MB.
+        """
+        self._hdf = h5py.File(hdf_file, 'r', rdcc_nbytes=chunk_cache_size)
+        if library_key is None:
+            library_key = next(
+                key for key in ('library', 'flat_library') if key in self._hdf
+            )
+        self.library_key = library_key
+        self.charged_frag_types = charged_frag_types
+        self._sparse_frag_idxes = None
+        group = self._hdf[library_key]
+        self.dataframe_names = []
+        for name in sorted(group):
+            if group[name].attrs.get('is_pd_dataframe', False):
+                self.dataframe_names.append(name)
+                setattr(self, name, LazyHDFDataframe(group[name]))
+
+    def close(self):
+        """Close the hdf file"""
+        self._hdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.precursor_df)
+
+    def get_precursor_df(self,
+        columns:typing.List[str] = None,
+        rows:typing.Union[slice, np.ndarray] = slice(None),
+    )->pd.DataFrame:
+        """Get precursor columns from 'precursor_df'
+        (and 'mod_seq_df' if exists).
+
+        Parameters
+        ----------
+        columns : typing.List[str], optional
+            Columns to read, by default None for all columns in 'precursor_df'
+
+        rows : slice | np.ndarray, optional
+            See :meth:`LazyHDFDataframe.get_column`, by default slice(None)
+
+        Returns
+        -------
+        pd.DataFrame
+            Precursor dataframe of the selected rows and columns
+        """
+        if columns is None:
+            columns = self.precursor_df.columns
+        df_dict = {}
+        for col in columns:
+            if col in self.precursor_df.columns:
+                df_dict[col] = self.precursor_df.get_column(col, rows)
+            elif (
+                'mod_seq_df' in self.dataframe_names and
+                col in self.mod_seq_df.columns
+            ):
+                df_dict[col] = self.mod_seq_df.get_column(col, rows)
+            else:
+                raise KeyError(col)
+        return pd.DataFrame(df_dict)
+
+    def _get_fragment_block(self,
+        df_name:str, frag_start:int, frag_stop:int, columns:list
+    )->pd.DataFrame:
+        df = getattr(self, df_name).get(
+            slice(frag_start, frag_stop), columns
+        )
+        df.index = pd.RangeIndex(frag_start, frag_start+len(df))
+        return df
+
+    @property
+    def frag_types(self)->typing.List[str]:
+        """
+        Fragment types (columns) of both fragment mz and intensity 
+        dataframes: :attr:`charged_frag_types` if it is not None, 
+        otherwise the columns of 'fragment_mz_df' (sorted in the hdf file), 
+        or the saved fragment types of the intensities 
+        if 'fragment_mz_df' is empty.
+        """
+        if self.charged_frag_types is not None:
+            return self.charged_frag_types
+        for df_name in ('fragment_mz_df', 'fragment_intensity_df'):
+            if (
+                df_name in self.dataframe_names and 
+                len(getattr(self, df_name).columns) > 0
+            ):
+                return getattr(self, df_name).columns
+        return self._get_sparse_frag_types()
+
+    def _get_sparse_frag_types(self)->typing.List[str]:
+        return self._hdf[
+            f'{self.library_key}/fragment_intensity_sparse_df'
+        ].attrs['frag_types'].split(';')
+
+    def _get_frag_types(self, columns:list)->list:
+        return [
+            frag for frag in self.frag_types
+            if frag in columns
+        ]
+
+    def get_fragment_mz_df(self,
+        frag_start:int, frag_stop:int
+    )->pd.DataFrame:
+        """Get rows from `frag_start` to `frag_stop` of 'fragment_mz_df',
+        the index is the fragment index, the columns are in 
+        the order of :attr:`frag_types`."""
+        return self._get_fragment_block(
+            'fragment_mz_df', frag_start, frag_stop,
+            self._get_frag_types(self.fragment_mz_df.columns)
+        )
+
+    def get_fragment_intensity_df(self,
+        frag_start:int, frag_stop:int
+    )->pd.DataFrame:
+        """Get rows from `frag_start` to `frag_stop` of 'fragment_intensity_df',
+        or convert them from 'fragment_intensity_sparse_df'
+        if the intensities are saved in the sparse format.
+        The index is the fragment index, the columns are in 
+        the order of :attr:`frag_types`."""
+        has_dense = 'fragment_intensity_df' in self.dataframe_names
+        if has_dense and (
+            len(self.fragment_intensity_df.columns) > 0 or 
+            'fragment_intensity_sparse_df' not in self.dataframe_names
+        ):
+            return self._get_fragment_block(
+                'fragment_intensity_df', frag_start, frag_stop,
+                self._get_frag_types(self.fragment_intensity_df.columns)
+            )
+        elif 'fragment_intensity_sparse_df' not in self.dataframe_names:
+            raise KeyError('fragment_intensity_df')
+        sparse_df = self.fragment_intensity_sparse_df
+        if self._sparse_frag_idxes is None:
+            # read once, block lookups are only searchsorted afterwards
+            self._sparse_frag_idxes = sparse_df.get_column('frag_idx')
+        i, j = np.searchsorted(
+            self._sparse_frag_idxes, [frag_start, frag_stop]
+        )
+        df = sparse_df.get(slice(i, j))
+        df['frag_type'] = pd.Categorical.from_codes(
+            df.frag_type.values, categories=self._get_sparse_frag_types()
+        )
+        df = densify_fragment_intensity_df(df, frag_start, frag_stop)
+        return df[self._get_frag_types(df.columns)]
+
+    def get_fragment_df(self,
+        frag_start:int, frag_stop:int,
+        columns:typing.List[str] = None,
+    )->pd.DataFrame:
+        """Get rows from `frag_start` to `frag_stop` of 'fragment_df'
+        of the flat library, the index is the fragment index."""
+        return self._get_fragment_block(
+            'fragment_df', frag_start, frag_stop, columns
+        )
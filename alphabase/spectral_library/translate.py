@@ -398,17 +398,24 @@ def translate_to_tsv(
         df_head_queue = mp.Queue(maxsize=queue_size)
         writing_process = WritingProcess(df_head_queue, tsv)
         writing_process.start()
-    mask_fragment_intensity_by_mz_(
-        speclib._fragment_mz_df,
-        speclib._fragment_intensity_df,
-        min_frag_mz, max_frag_mz
+    # sparse intensities (or lazy mz values) are converted 
+    # into dense fragment dataframes batch by batch
+    batch_dense = (
+        speclib._is_fragment_intensity_sparse() 
+        or speclib._is_fragment_mz_lazy()
     )
-    if min_frag_nAA > 0:
-        mask_fragment_intensity_by_frag_nAA(
+    if not batch_dense:
+        mask_fragment_intensity_by_mz_(
+            speclib._fragment_mz_df,
             speclib._fragment_intensity_df,
-            speclib._precursor_df,
-            max_mask_frag_nAA=min_frag_nAA-1
+            min_frag_mz, max_frag_mz
         )
+        if min_frag_nAA > 0:
+            mask_fragment_intensity_by_frag_nAA(
+                speclib._fragment_intensity_df,
+                speclib._precursor_df,
+                max_mask_frag_nAA=min_frag_nAA-1
+            )
     if isinstance(tsv, str):
         with open(tsv, "w"): pass
     _speclib = SpecLibBase()
@@ -417,6 +424,28 @@ def translate_to_tsv(
     precursor_df = speclib._precursor_df
     for i in tqdm.tqdm(range(0, len(precursor_df), batch_size)):
         _speclib._precursor_df = precursor_df.iloc[i:i+batch_size]
+        if batch_dense:
+            _speclib._fragment_mz_df = speclib.get_fragment_mz_df(
+                i, i+batch_size
+            ).reset_index(drop=True)
+            _speclib._fragment_intensity_df = speclib.get_fragment_intensity_df(
+                i, i+batch_size
+            ).reset_index(drop=True)
+            _speclib._precursor_df = _speclib._precursor_df.copy()
+            _speclib._precursor_df[
+                ['frag_start_idx','frag_stop_idx']
+            ] -= _speclib._precursor_df.frag_start_idx.min()
+            mask_fragment_intensity_by_mz_(
+                _speclib._fragment_mz_df,
+                _speclib._fragment_intensity_df,
+                min_frag_mz, max_frag_mz
+            )
+            if min_frag_nAA > 0:
+                mask_fragment_intensity_by_frag_nAA(
+                    _speclib._fragment_intensity_df,
+                    _speclib._precursor_df,
+                    max_mask_frag_nAA=min_frag_nAA-1
+                )
         df = speclib_to_single_df(
             _speclib, translate_mod_dict=translate_mod_dict,
             keep_k_highest_fragments=keep_k_highest_fragments,